@@ -0,0 +1,4 @@
+# Nạp ứng dụng Celery cùng Django để @shared_task dùng đúng cấu hình
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
@@ -13,4 +13,11 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "app.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Import sau khi Django đã được khởi tạo: luồng sự kiện điểm danh được phục vụ ngoài ASGIHandler,
+# các request khác dùng chung ASGI_SYNC_THREADS thread cho phần đồng bộ
+from attendance.events import EventStreamMiddleware  # noqa: E402
+from core.asgi import SyncThreadPoolMiddleware  # noqa: E402
+
+application = EventStreamMiddleware(SyncThreadPoolMiddleware(django_application))
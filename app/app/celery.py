@@ -0,0 +1,15 @@
+"""
+Ứng dụng Celery của dự án.
+
+Khi không cấu hình CELERY_BROKER_URL, các task chạy đồng bộ ngay trong tiến trình
+(CELERY_TASK_ALWAYS_EAGER), tiện cho môi trường phát triển.
+"""
+import os
+
+from celery import Celery
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "app.settings")
+
+app = Celery("app")
+app.config_from_object("django.conf:settings", namespace="CELERY")
+app.autodiscover_tasks()
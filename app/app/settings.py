@@ -11,7 +11,8 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 from pathlib import Path
-from datetime import timedelta
+from datetime import date, timedelta
+import importlib.util
 import os
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -58,6 +59,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "core.roles.RoleMiddleware",  # Gắn request.role (core/roles.py)
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "core.middleware.FakeIPMiddleware",
@@ -101,12 +103,50 @@ WSGI_APPLICATION = "app.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# Cơ sở dữ liệu: SQLite khi phát triển, PostgreSQL khi DB_ENGINE=postgresql
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite').lower()
+if DB_ENGINE in ('postgres', 'postgresql'):
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get('DB_NAME', 'utt'),
+            "USER": os.environ.get('DB_USER', 'postgres'),
+            "PASSWORD": os.environ.get('DB_PASSWORD', ''),
+            "HOST": os.environ.get('DB_HOST', 'localhost'),
+            "PORT": os.environ.get('DB_PORT', '5432'),
+            # Giữ kết nối giữa các request (giây), kiểm tra kết nối còn sống trước khi dùng lại
+            "CONN_MAX_AGE": int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {},
+        }
     }
-}
+    if os.environ.get('DB_POOL', 'false').lower() == 'true':
+        # Pool kết nối của Django (Django 5.1+, cần psycopg 3 và psycopg_pool), thay cho kết nối lâu dài
+        if not importlib.util.find_spec('psycopg_pool'):
+            from django.core.exceptions import ImproperlyConfigured
+            raise ImproperlyConfigured("DB_POOL=true cần psycopg 3 kèm pool: pip install 'psycopg[pool]'")
+        DATABASES["default"]["CONN_MAX_AGE"] = 0
+        DATABASES["default"]["OPTIONS"]["pool"] = {
+            "min_size": int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+            "max_size": int(os.environ.get('DB_POOL_MAX_SIZE', '10')),
+        }
+    if os.environ.get('DB_PGBOUNCER', 'false').lower() == 'true':
+        # PgBouncer ở chế độ transaction pooling không hỗ trợ server-side cursor
+        DATABASES["default"]["DISABLE_SERVER_SIDE_CURSORS"] = True
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db.sqlite3",
+            "OPTIONS": {
+                # Giành khóa ghi ngay khi mở transaction và chờ tối đa 20 giây thay vì báo lỗi "database is locked"
+                "transaction_mode": "IMMEDIATE",
+                "timeout": 20,
+            },
+        }
+    }
+# SQLite: bật WAL (core/signals.py) để người đọc không bị chặn khi có người ghi
+SQLITE_WAL = os.environ.get('SQLITE_WAL', 'true').lower() == 'true'
 
 
 # Password validation
@@ -156,6 +196,106 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Định vị theo IP (core/geolocation.py)
+# CSDL GeoIP cục bộ định dạng MaxMind, ví dụ GeoLite2-City.mmdb
+GEOIP_PATH = os.environ.get('GEOIP_PATH', os.path.join(BASE_DIR, 'geoip', 'GeoLite2-City.mmdb'))
+GEOIP_BACKENDS = [
+    'core.geolocation.MaxMindBackend',
+]
+GEOIP_CACHE_SIZE = 10000  # Số dải IP tối đa trong bộ nhớ đệm
+GEOIP_CACHE_TTL = 6 * 60 * 60  # giây
+GEOIP_CACHE_IPV4_PREFIX = 24
+GEOIP_CACHE_IPV6_PREFIX = 48
+# Gọi ipinfo.io chạy nền khi CSDL cục bộ không có kết quả (không chặn request)
+GEOIP_HTTP_FALLBACK = os.environ.get('GEOIP_HTTP_FALLBACK', 'true').lower() == 'true'
+GEOIP_HTTP_TIMEOUT = 2  # giây
+
+# Cache dùng chung (core/cache.py): Redis hoặc server tương thích giao thức Redis khi có CACHE_URL
+# (vd. redis://localhost:6379/1), nếu không dùng bộ nhớ của từng tiến trình
+CACHE_URL = os.environ.get('CACHE_URL', '')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+            'KEY_PREFIX': 'utt',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'utt-be',
+            'KEY_PREFIX': 'utt',
+        }
+    }
+# Khi không có CACHE_URL, việc xoá cache do signal (ảnh chụp lịch học, danh sách lớp, tọa độ phòng học) chỉ
+# có hiệu lực trong tiến trình nhận thay đổi: triển khai nhiều worker (gunicorn / uvicorn --workers N) phải
+# đặt CACHE_URL. CACHE_SINGLE_PROCESS=true khai báo chỉ có một tiến trình phục vụ request (mặc định khi DEBUG,
+# vd. runserver); nếu không, manage.py check cảnh báo (core.W001) và các cache cần dùng chung bị tắt (core/cache.py)
+CACHE_SINGLE_PROCESS = os.environ.get('CACHE_SINGLE_PROCESS', str(DEBUG)).lower() == 'true'
+
+# Điểm danh QR (core/checkin.py, core/cache.py), thời gian giữ trong cache (giây)
+SCHEDULE_SNAPSHOT_TTL = 300  # ảnh chụp lịch học
+CLASS_ROSTER_TTL = 600  # danh sách sinh viên của lớp
+CLASSROOM_GEOFENCE_TTL = 3600  # mã và tọa độ phòng học
+USER_SNAPSHOT_TTL = 60  # user cùng student / teacher, cho xác thực JWT (core/roles.py), chỉ khi cache dùng chung
+# Gom các lượt điểm danh hợp lệ và ghi hàng loạt; khi bật, phản hồi trả về trước khi bản ghi được ghi
+# (at-most-once, phản hồi không có id bản ghi điểm danh)
+ATTENDANCE_CHECKIN_BUFFER = {
+    'ENABLED': os.environ.get('ATTENDANCE_CHECKIN_BUFFER', 'false').lower() == 'true',
+    'MAX_SIZE': 200,  # Ghi khi bộ đệm đủ số lượt điểm danh này
+    'MAX_DELAY': 0.5,  # hoặc sau số giây này kể từ lượt đầu tiên
+    'MAX_RETRIES': 3,  # Số lần thử lại khi ghi thất bại, sau đó các lượt điểm danh được ghi vào log
+}
+
+# Mã QR điểm danh (core/qr_payload.py): khóa ký HMAC (mặc định SECRET_KEY)
+QR_SIGNING_KEY = os.environ.get('QR_SIGNING_KEY', '')
+# Mã QR dạng cũ (str(dict), không có chữ ký) bị từ chối. Trong thời gian chuyển đổi có thể bật
+# QR_ACCEPT_LEGACY_PAYLOAD kèm ngày cuối cùng còn chấp nhận QR_LEGACY_PAYLOAD_UNTIL (YYYY-MM-DD, bắt buộc)
+QR_ACCEPT_LEGACY_PAYLOAD = os.environ.get('QR_ACCEPT_LEGACY_PAYLOAD', 'false').lower() == 'true'
+QR_LEGACY_PAYLOAD_UNTIL = (
+    date.fromisoformat(os.environ['QR_LEGACY_PAYLOAD_UNTIL']) if os.environ.get('QR_LEGACY_PAYLOAD_UNTIL') else None
+)
+# Mã QR xoay vòng (GET /api/qr/schedules/<id>/rotating-qr/): đổi mã sau mỗi QR_ROTATION_INTERVAL giây,
+# mã cũ còn dùng được thêm QR_ROTATION_GRACE giây
+QR_ROTATION_INTERVAL = 15
+QR_ROTATION_GRACE = 15
+# Chỉ chấp nhận mã QR xoay vòng khi điểm danh: mã cố định của lịch học (in sẵn, dùng được cả học kỳ) bị từ chối
+QR_REQUIRE_ROTATING_TOKEN = os.environ.get('QR_REQUIRE_ROTATING_TOKEN', 'false').lower() == 'true'
+# Chạy bằng ASGI (app/asgi.py, core/asgi.py): số thread dùng chung cho phần đồng bộ của các request
+# (middleware, view đồng bộ, truy vấn CSDL) trong một worker; các request khác chờ bằng coroutine
+ASGI_SYNC_THREADS = int(os.environ.get('ASGI_SYNC_THREADS', 8))
+
+# Thời gian lưu phản hồi của request có Idempotency-Key (core/idempotency.py), giây
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+
+# Cache-Control của các API có ETag / Last-Modified (core/http_cache.py); client luôn có thể hỏi lại
+# bằng If-None-Match và nhận 304 nếu dữ liệu chưa đổi
+HTTP_CACHE_CONTROL = {
+    'timetable': 'private, max-age=60, must-revalidate',  # student_schedule, teacher_schedule
+    'classrooms': 'private, max-age=3600',
+    'teachers': 'private, max-age=600',
+    'user_info': 'private, no-cache',  # thông tin cá nhân: luôn hỏi lại
+}
+
+# Luồng sự kiện điểm danh (GET /api/attendance/schedules/<id>/events/, core/realtime.py).
+# Một worker ASGI dùng LocalBroker; nhiều worker cần 'core.realtime.RedisBroker'
+REALTIME_BROKER = os.environ.get('REALTIME_BROKER', 'core.realtime.LocalBroker')
+REALTIME_BROKER_URL = os.environ.get('REALTIME_BROKER_URL', CACHE_URL)
+REALTIME_KEEPALIVE = 15  # giây giữa hai dòng giữ kết nối khi không có sự kiện
+REALTIME_QUEUE_SIZE = 100  # số sự kiện chờ tối đa của một kết nối, quá thì bỏ sự kiện
+REALTIME_RETRY_MS = 3000  # thời gian client chờ trước khi kết nối lại
+
+# Số lịch học tối đa trong một yêu cầu tạo hàng loạt (POST /api/core/schedules/bulk/)
+SCHEDULE_BULK_MAX = 1000
+
+# Celery (app/celery.py): không có broker thì chạy task đồng bộ trong tiến trình
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', '')
+CELERY_TASK_ALWAYS_EAGER = not CELERY_BROKER_URL
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_TIMEZONE = TIME_ZONE
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -164,12 +304,16 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        # JWTAuthentication nạp sẵn student / teacher cùng user (core/roles.py)
+        "core.roles.RoleJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticated",
     ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # Mọi danh sách đều được phân trang (core/pagination.py);
+    # điểm danh và lịch học dùng phân trang keyset riêng
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.DefaultPagination',
 }
 
 SIMPLE_JWT = {
@@ -179,6 +323,9 @@ SIMPLE_JWT = {
     "BLACKLIST_AFTER_ROTATION": False,
     "ALGORITHM": "HS256",
     "SIGNING_KEY": SECRET_KEY,  # Phải khớp với SECRET_KEY của bạn
+    # Dùng cho /auth/jwt/create/ và /auth/jwt/refresh/ của Djoser: token mang claim vai trò (core/roles.py)
+    "TOKEN_OBTAIN_SERIALIZER": "core.serializers.RoleTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "core.serializers.RoleTokenRefreshSerializer",
 }
 
 DJOSER = {
@@ -1,5 +1,6 @@
 from django.contrib import admin
 from core.models import Attendance, Student
+from core.roles import get_role
 
 @admin.register(Attendance)
 class AttendanceAdmin(admin.ModelAdmin):
@@ -39,14 +40,11 @@ class AttendanceAdmin(admin.ModelAdmin):
         qs = super().get_queryset(request)
         if request.user.is_superuser:
             return qs
-        try:
-            teacher = request.user.teacher
-            classes = teacher.teaching_classes.all()
+        role = get_role(request)
+        if role.is_teacher:
+            classes = role.teacher.teaching_classes.all()
             return qs.filter(schedule__class_name__in=classes)
-        except:
-            # Nếu không phải giáo viên, có thể là học sinh
-            try:
-                student = request.user.student
-                return qs.filter(student=student)
-            except:
-                return qs.none() 
\ No newline at end of file
+        # Nếu không phải giáo viên, có thể là học sinh
+        if role.is_student:
+            return qs.filter(student=role.student)
+        return qs.none() 
\ No newline at end of file
@@ -0,0 +1,142 @@
+"""
+Luồng sự kiện điểm danh (Server-Sent Events) của một lịch học: GET /api/attendance/schedules/<id>/events/
+
+- attendance_events: view async của Django, dùng được với runserver / WSGI (mỗi kết nối chiếm một thread).
+- EventStreamMiddleware: bọc ứng dụng ASGI (app/asgi.py) và tự phục vụ đúng đường dẫn của view trên,
+  không qua ASGIHandler của Django (vốn giữ một thread riêng cho mỗi request tới khi response kết thúc),
+  nên một worker giữ được hàng nghìn kết nối đang chờ chỉ với các coroutine.
+Chỉ giáo viên dạy lịch học và admin được theo dõi, xác thực bằng JWT trong header Authorization.
+"""
+import asyncio
+import contextlib
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import Resolver404, resolve
+from rest_framework import HTTP_HEADER_ENCODING, exceptions, status
+
+from core.checkin import get_schedule_snapshot
+from core.realtime import event_stream, schedule_channel
+from core.roles import RoleJWTAuthentication, resolve_role
+
+STREAM_HEADERS = {
+    'Content-Type': 'text/event-stream',
+    'Cache-Control': 'no-cache',
+    # Không để nginx gom dữ liệu của luồng sự kiện
+    'X-Accel-Buffering': 'no',
+}
+
+
+def authorize_attendance_events(authorization, schedule_id):
+    """Kiểm tra header Authorization (bytes); trả về None nếu được theo dõi, nếu không thì (mã lỗi, thông báo)"""
+    auth = RoleJWTAuthentication()
+    try:
+        raw_token = auth.get_raw_token(authorization)
+        if raw_token is None:
+            return status.HTTP_401_UNAUTHORIZED, "Chưa đăng nhập"
+        user = auth.get_user(auth.get_validated_token(raw_token))
+    except exceptions.APIException as e:
+        # InvalidToken có detail dạng dict, thông báo chính nằm ở khóa 'detail'
+        detail = e.detail.get('detail', e.detail) if isinstance(e.detail, dict) else e.detail
+        return e.status_code, str(detail)
+
+    role = resolve_role(user)
+    schedule = get_schedule_snapshot(schedule_id)
+    if schedule is None:
+        return status.HTTP_404_NOT_FOUND, "Lịch học không tồn tại"
+    if not role.is_admin and (role.teacher is None or role.teacher.pk != schedule.teacher_id):
+        return status.HTTP_403_FORBIDDEN, "Bạn không phải là giáo viên của lịch học này"
+    return None
+
+
+async def attendance_events(request, schedule_id):
+    """Server-Sent Events: các lượt điểm danh QR của lịch học ngay khi được ghi (core/realtime.py)"""
+    authorization = request.META.get('HTTP_AUTHORIZATION', '').encode(HTTP_HEADER_ENCODING)
+    error = await sync_to_async(authorize_attendance_events)(authorization, schedule_id)
+    if error is not None:
+        return JsonResponse({"error": error[1]}, status=error[0], json_dumps_params={'ensure_ascii': False})
+    return StreamingHttpResponse(event_stream(schedule_channel(schedule_id)), headers=STREAM_HEADERS)
+
+
+def _authorize_outside_request(authorization, schedule_id):
+    # Chạy trong thread pool dùng chung, ngoài vòng đời request của Django: tự dọn kết nối CSDL như request
+    close_old_connections()
+    try:
+        return authorize_attendance_events(authorization, schedule_id)
+    finally:
+        close_old_connections()
+
+
+def _asgi_headers(headers):
+    return [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()]
+
+
+class EventStreamMiddleware:
+    """Middleware ASGI: phục vụ attendance_events trực tiếp bằng coroutine, các request khác chuyển cho `app`"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        schedule_id = self.match(scope)
+        if schedule_id is None:
+            return await self.app(scope, receive, send)
+        await self.stream(schedule_id, scope, receive, send)
+
+    @staticmethod
+    def match(scope):
+        if scope['type'] != 'http' or scope['method'] != 'GET':
+            return None
+        path = scope['path'][len(scope.get('root_path', '')):] if scope.get('root_path') else scope['path']
+        try:
+            match = resolve(path)
+        except Resolver404:
+            return None
+        return match.kwargs['schedule_id'] if match.func is attendance_events else None
+
+    async def stream(self, schedule_id, scope, receive, send):
+        headers = dict(scope['headers'])
+        error = await sync_to_async(_authorize_outside_request, thread_sensitive=False)(
+            headers.get(b'authorization', b''), schedule_id,
+        )
+        if error is not None:
+            await self.respond(send, error[0], {'Content-Type': 'application/json'},
+                               json.dumps({"error": error[1]}, ensure_ascii=False).encode('utf-8'))
+            return
+
+        response_headers = dict(STREAM_HEADERS)
+        if getattr(settings, 'CORS_ALLOW_ALL_ORIGINS', False):
+            response_headers['Access-Control-Allow-Origin'] = '*'
+        await send({
+            'type': 'http.response.start',
+            'status': status.HTTP_200_OK,
+            'headers': _asgi_headers(response_headers),
+        })
+
+        events = event_stream(schedule_channel(schedule_id))
+
+        async def pump():
+            async for chunk in events:
+                await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': True})
+
+        task = asyncio.ensure_future(pump())
+        try:
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+        finally:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError, OSError):
+                await task
+            await events.aclose()
+
+    @staticmethod
+    async def respond(send, status_code, headers, body):
+        await send({
+            'type': 'http.response.start',
+            'status': status_code,
+            'headers': _asgi_headers(headers),
+        })
+        await send({'type': 'http.response.body', 'body': body})
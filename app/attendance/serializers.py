@@ -1,9 +1,9 @@
 from rest_framework import serializers
 from core.models import Attendance, Schedule
+from core.checkin import get_schedule_snapshot
+from core.qr_payload import InvalidQRPayload, parse_qr_data
 from django.utils import timezone
 from datetime import datetime, timedelta
-import json
-import math
 
 class ScheduleDetailSerializer(serializers.ModelSerializer):
     course_name = serializers.StringRelatedField(source='course_name.object_name')
@@ -63,18 +63,19 @@ class QRCodeAttendanceSerializer(serializers.Serializer):
         latitude = attrs.get('latitude')
         longitude = attrs.get('longitude')
 
-        # Parse QR data
+        # Giải mã và kiểm tra chữ ký, hạn dùng của mã QR trước khi truy cập CSDL (core/qr_payload.py)
         try:
-            qr_json = qr_data.replace("'", '"')
-            qr_info = json.loads(qr_json)
-            schedule_id = qr_info.get('schedule_id')
-        except (json.JSONDecodeError, AttributeError):
-            raise serializers.ValidationError("Mã QR không hợp lệ")
-
-        # Kiểm tra schedule tồn tại
-        try:
-            schedule = Schedule.objects.get(id=schedule_id)
-        except Schedule.DoesNotExist:
+            payload = parse_qr_data(qr_data)
+        except InvalidQRPayload as e:
+            raise serializers.ValidationError(str(e))
+
+        # Kiểm tra schedule tồn tại (đọc từ ảnh chụp lịch học trong cache). View async nạp sẵn ảnh chụp
+        # bằng cache async và truyền qua context['schedules'] ({schedule_id: ScheduleSnapshot hoặc None})
+        if 'schedules' in self.context:
+            schedule = self.context['schedules'].get(payload.schedule_id)
+        else:
+            schedule = get_schedule_snapshot(payload.schedule_id)
+        if schedule is None:
             raise serializers.ValidationError("Lịch học không tồn tại")
 
         # Kiểm tra thời gian
@@ -97,50 +98,32 @@ class QRCodeAttendanceSerializer(serializers.Serializer):
             6: 'SUN',  # Chủ nhật
         }
         current_weekday = weekday_map.get(now.weekday())
-        if not schedule.weekdays.filter(day=current_weekday).exists():
+        if current_weekday not in schedule.weekdays:
             raise serializers.ValidationError(f"Hôm nay không phải là ngày học của lịch này")
 
         # Kiểm tra vị trí (nếu có tọa độ và phòng học có tọa độ)
-        classroom = schedule.room
         location_message = None
+        geofence = schedule.geofence
 
         if latitude is None or longitude is None:
             location_message = "Không nhận được tọa độ vị trí từ thiết bị. Hệ thống sẽ sử dụng vị trí dựa trên IP."
-        elif classroom.latitude is None or classroom.longitude is None:
+        elif geofence is None or not geofence.has_location:
             location_message = "Phòng học chưa được cài đặt tọa độ. Không thể xác minh vị trí điểm danh."
         else:
-            # Tính khoảng cách sử dụng công thức Haversine
-            max_distance = 100  # mét
-
-            def calculate_distance(lat1, lon1, lat2, lon2):
-                # Bán kính trái đất (mét)
-                R = 6371000
-
-                # Chuyển đổi độ sang radian
-                lat1_rad = math.radians(lat1)
-                lon1_rad = math.radians(lon1)
-                lat2_rad = math.radians(lat2)
-                lon2_rad = math.radians(lon2)
-
-                # Hiệu số giữa các tọa độ
-                dlat = lat2_rad - lat1_rad
-                dlon = lon2_rad - lon1_rad
-
-                # Công thức Haversine
-                a = math.sin(dlat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon/2)**2
-                c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-                distance = R * c
-
-                return distance
-
-            distance = calculate_distance(latitude, longitude, classroom.latitude, classroom.longitude)
-
-            if distance > max_distance:
-                raise serializers.ValidationError(f"Bạn cần ở gần phòng học để điểm danh (khoảng cách hiện tại: {int(distance)} mét, tối đa cho phép: {max_distance} mét)")
+            # Kiểm tra theo bán kính hoặc ranh giới đa giác của phòng học (core/geofence.py)
+            result = geofence.check(latitude, longitude)
+
+            if not result.inside:
+                if geofence.is_polygon:
+                    raise serializers.ValidationError(f"Bạn cần ở trong khu vực phòng học để điểm danh (cách ranh giới {int(result.distance)} mét)")
+                raise serializers.ValidationError(f"Bạn cần ở gần phòng học để điểm danh (khoảng cách hiện tại: {int(result.distance)} mét, tối đa cho phép: {int(geofence.radius)} mét)")
+            elif geofence.is_polygon:
+                location_message = "Vị trí hợp lệ, trong khu vực phòng học."
             else:
-                location_message = f"Vị trí hợp lệ, cách phòng học {int(distance)} mét."
+                location_message = f"Vị trí hợp lệ, cách phòng học {int(result.distance)} mét."
 
-        # Lưu lại schedule và thông báo vị trí để sử dụng sau này
+        # Lưu lại ảnh chụp lịch học và thông báo vị trí để sử dụng sau này
         attrs['schedule'] = schedule
+        attrs['geofence'] = geofence
         attrs['location_message'] = location_message
         return attrs
\ No newline at end of file
@@ -1,11 +1,14 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import AttendanceViewSet
+from .events import attendance_events
+from .views import AttendanceViewSet, qr_attendance_async
 
 router = DefaultRouter()
 router.register(r'', AttendanceViewSet)
 
 urlpatterns = [
+    path('schedules/<int:schedule_id>/events/', attendance_events, name='attendance-events'),
+    path('qr-attendance-async/', qr_attendance_async, name='qr-attendance-async'),
     path('', include(router.urls)),
     path('qr-attendance/', AttendanceViewSet.as_view({'post': 'qr_attendance'})),
 ]
\ No newline at end of file
@@ -1,4 +1,11 @@
-from rest_framework import viewsets, serializers, status
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework import viewsets, serializers, status, exceptions
+from rest_framework.renderers import JSONRenderer
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from core.models import Attendance, Student, Schedule
@@ -6,8 +13,16 @@ from rest_framework.permissions import IsAuthenticated
 from .serializers import AttendanceSerializer, QRCodeAttendanceSerializer
 from django.utils import timezone
 from datetime import timedelta
-import requests
 import logging
+from core.geolocation import alocate_ip, locate_ip
+from core.cache import is_class_member
+from core.checkin import (
+    ALREADY_PRESENT, CREATED, acheck_in, aget_schedule_snapshot, check_in, get_checkin_buffer,
+)
+from core.qr_payload import InvalidQRPayload, parse_qr_data
+from core.idempotency import aidempotent, idempotent
+from core.roles import RoleJWTAuthentication, get_role, resolve_role
+from core.pagination import AttendanceCursorPagination, SparseFieldsetsMixin
 
 logger = logging.getLogger(__name__)
 
@@ -33,203 +48,316 @@ def get_client_ip(request):
 
 
 def get_location_from_ip(ip):
-    """Lấy vị trí dựa trên địa chỉ IP"""
-    print(f"AttendanceViewSet: Đang lấy vị trí từ IP: {ip}")
-    try:
-        response = requests.get(f"https://ipinfo.io/{ip}/json")
-        if response.status_code == 200:
-            data = response.json()
-            print(f"AttendanceViewSet: Dữ liệu từ ipinfo.io: {data}")
-            if 'loc' in data:
-                lat, lon = data['loc'].split(',')
-                return float(lat), float(lon)
-        print("AttendanceViewSet: Không thể lấy vị trí từ IP")
-        return None, None
-    except Exception as e:
-        print(f"AttendanceViewSet: Lỗi khi lấy vị trí từ IP: {str(e)}")
-        return None, None
-
-class AttendanceViewSet(viewsets.ModelViewSet):
+    """
+    Lấy vị trí dựa trên địa chỉ IP.
+    Tra cứu bộ nhớ đệm và CSDL GeoIP cục bộ, không chờ dịch vụ bên ngoài (xem core.geolocation).
+    """
+    location = locate_ip(ip)
+    if location:
+        return location
+    logger.debug("Chưa xác định được vị trí từ IP %s", ip)
+    return None, None
+
+class AttendanceViewSet(SparseFieldsetsMixin, viewsets.ModelViewSet):
     queryset = Attendance.objects.all()
     serializer_class = AttendanceSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = AttendanceCursorPagination
 
     def get_queryset(self):
-        user = self.request.user
         # Kiểm tra nếu user có student profile
-        try:
-            student = Student.objects.get(user=user)
-            return Attendance.objects.filter(student=student)
-        except Student.DoesNotExist:
+        student = get_role(self.request).student
+        if student is None:
             # Nếu không phải student, trả về danh sách rỗng
             return Attendance.objects.none()
+        return Attendance.objects.filter(student=student).select_related(
+            'schedule__course_name', 'schedule__teacher__user', 'schedule__room', 'schedule__class_name'
+        )
 
     def perform_create(self, serializer):
-        user = self.request.user
         # Kiểm tra nếu user có student profile
-        try:
-            student = Student.objects.get(user=user)
-            # Kiểm tra xem sinh viên có thuộc lớp của schedule này không
-            schedule = serializer.validated_data['schedule']
-            if not schedule.class_name.students.filter(id=student.id).exists():
-                raise serializers.ValidationError("Bạn không phải là sinh viên trong lớp học này")
-
-            # Nếu đã tồn tại bản ghi điểm danh, không cho phép tạo mới
-            if Attendance.objects.filter(student=student, schedule=schedule).exists():
-                raise serializers.ValidationError("Bạn đã điểm danh cho lịch học này rồi")
-
-            # Kiểm tra thời gian và tính toán số phút trễ
-            now = timezone.now()
-            is_late = False
-            minutes_late = None
-
-            if now > schedule.start_time:
-                # Tính số phút trễ (làm tròn lên)
-                delta = now - schedule.start_time
-                minutes_late = int(delta.total_seconds() / 60)
-                is_late = minutes_late > 0
-
-            # Lấy thông tin vị trí từ request data
-            latitude = serializer.validated_data.get('latitude')
-            longitude = serializer.validated_data.get('longitude')
-            device_info = serializer.validated_data.get('device_info')
-
-            # Nếu không có tọa độ từ client, thử lấy từ IP
-            if not latitude or not longitude:
-                client_ip = get_client_ip(self.request)
-                location_data = get_location_from_ip(client_ip)
-                if location_data:
-                    latitude, longitude = location_data
-                    if not device_info:
-                        device_info = f"IP: {client_ip}, Vị trí: {latitude}, {longitude}"
-
-            serializer.save(
-                student=student,
-                is_present=True,
-                is_late=is_late,
-                minutes_late=minutes_late,
-                latitude=latitude,
-                longitude=longitude,
-                device_info=device_info,
-                is_in_location=True
-            )
-        except Student.DoesNotExist:
+        student = get_role(self.request).student
+        if student is None:
             raise serializers.ValidationError("Bạn không có quyền điểm danh")
 
+        # Kiểm tra xem sinh viên có thuộc lớp của schedule này không
+        schedule = serializer.validated_data['schedule']
+        if not is_class_member(schedule.class_name_id, student.id):
+            raise serializers.ValidationError("Bạn không phải là sinh viên trong lớp học này")
+
+        # Nếu đã tồn tại bản ghi điểm danh, không cho phép tạo mới
+        if Attendance.objects.filter(student=student, schedule=schedule).exists():
+            raise serializers.ValidationError("Bạn đã điểm danh cho lịch học này rồi")
+
+        # Kiểm tra thời gian và tính toán số phút trễ
+        now = timezone.now()
+        is_late = False
+        minutes_late = None
+
+        if now > schedule.start_time:
+            # Tính số phút trễ (làm tròn lên)
+            delta = now - schedule.start_time
+            minutes_late = int(delta.total_seconds() / 60)
+            is_late = minutes_late > 0
+
+        # Lấy thông tin vị trí từ request data
+        latitude = serializer.validated_data.get('latitude')
+        longitude = serializer.validated_data.get('longitude')
+        device_info = serializer.validated_data.get('device_info')
+
+        # Nếu không có tọa độ từ client, thử lấy từ IP
+        if not latitude or not longitude:
+            client_ip = get_client_ip(self.request)
+            location_data = get_location_from_ip(client_ip)
+            if location_data:
+                latitude, longitude = location_data
+                if not device_info:
+                    device_info = f"IP: {client_ip}, Vị trí: {latitude}, {longitude}"
+
+        serializer.save(
+            student=student,
+            is_present=True,
+            is_late=is_late,
+            minutes_late=minutes_late,
+            latitude=latitude,
+            longitude=longitude,
+            device_info=device_info,
+            is_in_location=True
+        )
+
     @action(detail=False, methods=['post'], url_path='qr-attendance')
+    @idempotent
     def qr_attendance(self, request):
-        serializer = QRCodeAttendanceSerializer(data=request.data)
-        if serializer.is_valid():
-            user = request.user
-
-            # Kiểm tra nếu user có student profile
-            try:
-                student = Student.objects.get(user=user)
-            except Student.DoesNotExist:
-                return Response(
-                    {"error": "Bạn không có quyền điểm danh"},
-                    status=status.HTTP_403_FORBIDDEN
-                )
-
-            schedule = serializer.validated_data['schedule']
-            location_message = serializer.validated_data.get('location_message')
-
-            # Kiểm tra xem sinh viên có thuộc lớp của schedule này không
-            if not schedule.class_name.students.filter(id=student.id).exists():
-                return Response(
-                    {"error": "Bạn không phải là sinh viên trong lớp học này"},
-                    status=status.HTTP_403_FORBIDDEN
-                )
-
-            # Kiểm tra thời gian và tính toán số phút trễ
-            now = timezone.now()
-            is_late = False
-            minutes_late = None
-
-            if now > schedule.start_time:
-                # Tính số phút trễ (làm tròn lên)
-                delta = now - schedule.start_time
-                minutes_late = int(delta.total_seconds() / 60)
-                is_late = minutes_late > 0
-
-            # Lấy thông tin vị trí từ request data
-            latitude = serializer.validated_data.get('latitude')
-            longitude = serializer.validated_data.get('longitude')
-            device_info = serializer.validated_data.get('device_info', '')
-
-            # Thông tin về nguồn gốc vị trí
-            location_source = "GPS thiết bị"
-
-            # Nếu không có tọa độ từ client, thử lấy từ IP
-            if not latitude or not longitude:
-                client_ip = get_client_ip(request)
-                location_data = get_location_from_ip(client_ip)
-                if location_data and len(location_data) == 2:
-                    latitude, longitude = location_data
-                    location_source = "IP"
-
-                    # Thêm thông tin vị trí vào device_info
-                    location_info = f"IP: {client_ip}, Vị trí: {latitude}, {longitude}"
-                    if device_info:
-                        device_info = f"{device_info}, {location_info}"
-                    else:
-                        device_info = location_info
-
-            # Kiểm tra xem đã điểm danh cho lịch học này chưa
-            attendance, created = Attendance.objects.get_or_create(
-                student=student,
-                schedule=schedule,
-                defaults={
-                    'is_present': True,
-                    'is_late': is_late,
-                    'minutes_late': minutes_late,
-                    'latitude': latitude,
-                    'longitude': longitude,
-                    'device_info': device_info,
-                    'is_in_location': True
-                }
-            )
-
-            if not created:
-                # Nếu bản ghi đã tồn tại, cập nhật trạng thái
-                attendance.is_present = True
-                attendance.is_late = is_late
-                attendance.minutes_late = minutes_late
-                attendance.latitude = latitude
-                attendance.longitude = longitude
-                attendance.device_info = device_info
-                attendance.is_in_location = True
-                attendance.save()
-                message = "Bạn đã cập nhật điểm danh thành công"
-            else:
-                message = "Bạn đã điểm danh thành công"
-
-            attendance_status = "Có mặt"
-            if is_late:
-                attendance_status = f"Trễ {minutes_late} phút"
-
-            # Format thời gian theo múi giờ Việt Nam
-            timestamp_vn = timezone.localtime(attendance.timestamp).strftime('%H:%M:%S %d/%m/%Y')
-
-            return Response({
-                "status": "success",
-                "message": message,
-                "attendance": {
-                    "id": attendance.id,
-                    "schedule_id": schedule.id,
-                    "course_name": schedule.course_name.object_name,
-                    "teacher": schedule.teacher.user.name,
-                    "classroom": schedule.room.classroom_code,
-                    "timestamp": attendance.timestamp,
-                    "timestamp_vn": timestamp_vn,
-                    "is_present": attendance.is_present,
-                    "is_late": attendance.is_late,
-                    "minutes_late": attendance.minutes_late,
-                    "attendance_status": attendance_status,
-                    "location": f"{latitude}, {longitude}" if latitude and longitude else None,
-                    "location_source": location_source,
-                    "location_message": location_message
-                }
-            })
-
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        student = get_role(request).student
+        validated_data, errors, error_status = validate_qr_attendance(request.data, student)
+        if errors is not None:
+            return Response(errors, status=error_status)
+
+        # Nếu không có tọa độ từ client, thử lấy từ IP
+        client_ip = location_data = None
+        if needs_ip_location(validated_data):
+            client_ip = get_client_ip(request)
+            location_data = get_location_from_ip(client_ip)
+
+        attendance, location = build_qr_attendance(student, validated_data, timezone.now(), location_data, client_ip)
+        attendance, message, queued = save_qr_attendance(attendance)
+        return Response(qr_attendance_data(attendance, validated_data, message, queued, location))
+
+
+# Các bước của điểm danh QR, dùng chung cho AttendanceViewSet.qr_attendance và view async qr_attendance_async
+
+def validate_qr_attendance(data, student, context=None):
+    """
+    Kiểm tra mã QR, thời gian, vị trí (QRCodeAttendanceSerializer) và quyền điểm danh của sinh viên.
+    Trả về (validated_data, None, None) hoặc (None, nội dung lỗi, mã lỗi).
+    """
+    serializer = QRCodeAttendanceSerializer(data=data, context=context or {})
+    if not serializer.is_valid():
+        return None, serializer.errors, status.HTTP_400_BAD_REQUEST
+
+    # Kiểm tra nếu user có student profile
+    if student is None:
+        return None, {"error": "Bạn không có quyền điểm danh"}, status.HTTP_403_FORBIDDEN
+    # Kiểm tra xem sinh viên có thuộc lớp của schedule này không
+    if not serializer.validated_data['schedule'].has_student(student.id):
+        return None, {"error": "Bạn không phải là sinh viên trong lớp học này"}, status.HTTP_403_FORBIDDEN
+    return serializer.validated_data, None, None
+
+
+async def avalidate_qr_attendance(data, student):
+    """
+    validate_qr_attendance() cho view async: ảnh chụp lịch học, danh sách lớp và ranh giới phòng học được
+    nạp trước bằng cache async / ORM async, phần kiểm tra còn lại chỉ là tính toán, chạy ngay trong event loop.
+    """
+    schedules = {}
+    qr_data = data.get('qr_data') if isinstance(data, dict) else None
+    try:
+        schedule_id = parse_qr_data(qr_data).schedule_id if isinstance(qr_data, str) else None
+    except InvalidQRPayload:
+        schedule_id = None  # Serializer trả về lỗi của mã QR
+    if schedule_id is not None:
+        schedule = await aget_schedule_snapshot(schedule_id)
+        schedules[schedule_id] = await schedule.aprefetch() if schedule is not None else None
+    return validate_qr_attendance(data, student, context={'schedules': schedules})
+
+
+def needs_ip_location(validated_data):
+    return not validated_data.get('latitude') or not validated_data.get('longitude')
+
+
+def build_qr_attendance(student, validated_data, now, location_data=None, client_ip=None):
+    """
+    Attendance (chưa lưu) của một lượt điểm danh QR hợp lệ và thông tin vị trí cho phản hồi.
+    `location_data` là kết quả tra cứu vị trí theo `client_ip` khi thiết bị không gửi tọa độ.
+    """
+    # Ảnh chụp lịch học (giờ học, sĩ số, tên hiển thị) đã được nạp từ cache khi validate
+    schedule = validated_data['schedule']
+
+    # Kiểm tra thời gian và tính toán số phút trễ
+    is_late = False
+    minutes_late = None
+    if now > schedule.start_time:
+        # Tính số phút trễ (làm tròn lên)
+        delta = now - schedule.start_time
+        minutes_late = int(delta.total_seconds() / 60)
+        is_late = minutes_late > 0
+
+    # Lấy thông tin vị trí từ request data
+    latitude = validated_data.get('latitude')
+    longitude = validated_data.get('longitude')
+    device_info = validated_data.get('device_info', '')
+
+    # Thông tin về nguồn gốc vị trí
+    location_source = "GPS thiết bị"
+
+    if location_data and len(location_data) == 2:
+        latitude, longitude = location_data
+        location_source = "IP"
+
+        # Thêm thông tin vị trí vào device_info
+        location_info = f"IP: {client_ip}, Vị trí: {latitude}, {longitude}"
+        if device_info:
+            device_info = f"{device_info}, {location_info}"
+        else:
+            device_info = location_info
+
+    attendance = Attendance(
+        student=student,
+        schedule_id=schedule.id,
+        timestamp=now,
+        is_present=True,
+        is_late=is_late,
+        minutes_late=minutes_late,
+        latitude=latitude,
+        longitude=longitude,
+        device_info=device_info,
+        is_in_location=True,
+    )
+    location = {
+        "location": f"{latitude}, {longitude}" if latitude and longitude else None,
+        "location_source": location_source,
+    }
+    return attendance, location
+
+
+def save_qr_attendance(attendance):
+    """
+    Ghi lượt điểm danh; trả về (bản ghi điểm danh, thông báo, đã đưa vào bộ đệm hay chưa).
+    Khi bật ATTENDANCE_CHECKIN_BUFFER, lượt điểm danh chỉ được đưa vào bộ đệm (CheckInBuffer): phản hồi
+    có "queued": true và "id": null, bản ghi được ghi nhiều nhất một lần sau khi phản hồi đã trả về.
+    """
+    buffer = get_checkin_buffer()
+    if buffer is not None:
+        # Đường nhanh: đưa vào bộ đệm, ghi hàng loạt cùng các lượt điểm danh khác
+        buffer.add(attendance)
+        return attendance, "Bạn đã điểm danh thành công", True
+
+    # Một câu lệnh upsert có điều kiện: lượt điểm danh có mặt đầu tiên được giữ
+    attendance, outcome = check_in(attendance)
+    return attendance, _checkin_message(outcome), False
+
+
+async def asave_qr_attendance(attendance):
+    """save_qr_attendance() cho view async"""
+    if get_checkin_buffer() is not None:
+        # buffer.add() có thể ghi cả bộ đệm xuống CSDL
+        return await sync_to_async(save_qr_attendance)(attendance)
+    attendance, outcome = await acheck_in(attendance)
+    return attendance, _checkin_message(outcome), False
+
+
+def _checkin_message(outcome):
+    if outcome == CREATED:
+        return "Bạn đã điểm danh thành công"
+    if outcome == ALREADY_PRESENT:
+        return "Bạn đã điểm danh cho lịch học này rồi"
+    return "Bạn đã cập nhật điểm danh thành công"
+
+
+def qr_attendance_data(attendance, validated_data, message, queued, location):
+    """Nội dung phản hồi của một lượt điểm danh QR thành công"""
+    schedule = validated_data['schedule']
+    geofence = validated_data['geofence']
+
+    attendance_status = "Có mặt"
+    if attendance.is_late:
+        attendance_status = f"Trễ {attendance.minutes_late} phút"
+
+    # Format thời gian theo múi giờ Việt Nam
+    timestamp_vn = timezone.localtime(attendance.timestamp).strftime('%H:%M:%S %d/%m/%Y')
+
+    return {
+        "status": "success",
+        "message": message,
+        "queued": queued,
+        "attendance": {
+            "id": attendance.id,
+            "schedule_id": schedule.id,
+            "course_name": schedule.course_name,
+            "teacher": schedule.teacher_name,
+            "classroom": geofence.code if geofence else None,
+            "timestamp": attendance.timestamp,
+            "timestamp_vn": timestamp_vn,
+            "is_present": attendance.is_present,
+            "is_late": attendance.is_late,
+            "minutes_late": attendance.minutes_late,
+            "attendance_status": attendance_status,
+            **location,
+            "location_message": validated_data.get('location_message'),
+        }
+    }
+
+
+def _json_response(data, status_code=status.HTTP_200_OK):
+    # JSONRenderer của DRF để phản hồi giống hệt view đồng bộ (định dạng thời gian, ErrorDetail)
+    return HttpResponse(JSONRenderer().render(data), status=status_code, content_type='application/json')
+
+
+@csrf_exempt
+@require_POST
+async def qr_attendance_async(request):
+    """
+    Điểm danh QR bằng coroutine (chạy dưới ASGI), cùng kiểm tra và cùng phản hồi với
+    AttendanceViewSet.qr_attendance:
+    - JWT được kiểm tra ngay trong event loop, user lấy từ ảnh chụp trong cache (core/roles.py).
+    - Thiết bị không gửi tọa độ: chờ tra cứu vị trí theo IP bằng httpx (có timeout) mà không chiếm thread.
+    - Ảnh chụp lịch học, danh sách lớp và ranh giới phòng học được đọc bằng cache async, nạp bằng ORM async
+      khi trượt cache; kiểm tra mã QR, thời gian và vị trí chạy ngay trong event loop.
+    - Câu lệnh upsert chạy qua một lần sync_to_async (acheck_in, core/checkin.py): upsert, bảng tổng hợp
+      và sự kiện thời gian thực phải nằm trong cùng một transaction, việc mà ORM async chưa hỗ trợ.
+    - Phần đồng bộ chạy trên ASGI_SYNC_THREADS thread dùng chung (core/asgi.py); các request còn lại chờ
+      bằng coroutine thay vì mỗi request giữ một thread.
+    - Idempotency-Key như qr_attendance (core/idempotency.py, aidempotent).
+    """
+    try:
+        authenticated = await RoleJWTAuthentication().aauthenticate(request)
+        if authenticated is None:
+            raise exceptions.NotAuthenticated()
+    except exceptions.APIException as e:
+        detail = e.detail if isinstance(e.detail, dict) else {"detail": e.detail}
+        return _json_response(detail, e.status_code)
+    return await aqr_attendance(request, authenticated[0])
+
+
+@aidempotent
+async def aqr_attendance(request, user):
+    """Phần của qr_attendance_async sau khi đã xác thực"""
+    student = resolve_role(user).student
+
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return _json_response({"error": "Dữ liệu JSON không hợp lệ"}, status.HTTP_400_BAD_REQUEST)
+
+    validated_data, errors, error_status = await avalidate_qr_attendance(data, student)
+    if errors is not None:
+        return _json_response(errors, error_status)
+
+    client_ip = location_data = None
+    if needs_ip_location(validated_data):
+        client_ip = get_client_ip(request)
+        location_data = await alocate_ip(client_ip) or (None, None)
+
+    attendance, location = build_qr_attendance(student, validated_data, timezone.now(), location_data, client_ip)
+    attendance, message, queued = await asave_qr_attendance(attendance)
+    return _json_response(qr_attendance_data(attendance, validated_data, message, queued, location))
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Student, Teacher, Schedule, Attendance, QRCode, User, Classroom, Class, Object, Weekday
+from .models import Student, Teacher, Schedule, Attendance, QRCode, User, Classroom, Class, Object, Weekday, QR_READY
+from .roles import get_role
 from django.contrib.auth.models import Group, Permission
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.auth.decorators import user_passes_test
@@ -159,7 +160,7 @@ class ClassroomAdmin(admin.ModelAdmin):
     form = ClassroomAdminForm
     list_display = ['classroom_code', 'class_name', 'location_info']
     search_fields = ['classroom_code', 'class_name']
-    fields = ['classroom_code', 'class_name', 'manual_latitude', 'manual_longitude', 'latitude', 'longitude', 'map_view']
+    fields = ['classroom_code', 'class_name', 'manual_latitude', 'manual_longitude', 'latitude', 'longitude', 'geofence_radius', 'geofence_polygon', 'map_view']
     readonly_fields = ['map_view']
 
     def location_info(self, obj):
@@ -421,8 +422,10 @@ class ScheduleAdmin(admin.ModelAdmin):
     
     def generate_qr_view(self, request, object_id):
         schedule = self.get_object(request, object_id)
-        schedule.generate_qr_code()
-        messages.success(request, f"Đã tạo mã QR cho lịch học thành công.")
+        if schedule.generate_qr_code() == QR_READY:
+            messages.success(request, f"Đã tạo mã QR cho lịch học thành công.")
+        else:
+            messages.info(request, "Mã QR đang được tạo, vui lòng tải lại trang sau ít giây.")
         return redirect(f'../../{object_id}/change/')
     
     def save_model(self, request, obj, form, change):
@@ -435,10 +438,8 @@ class ScheduleAdmin(admin.ModelAdmin):
             obj.lesson_count = 11 - obj.lesson_start + 1
             messages.warning(request, f"Tiết kết thúc vượt quá giới hạn. Đã điều chỉnh số tiết thành {obj.lesson_count}.")
         
+        # Mã QR được làm mới trong Schedule.save() khi dữ liệu QR thay đổi
         super().save_model(request, obj, form, change)
-        # Tự động tạo QR code khi tạo mới
-        if not change and not obj.qr_code:
-            obj.generate_qr_code()
 
 # Register models in the admin interface
 admin.site.register(Student)
@@ -500,8 +501,9 @@ class StudentAdminSite(AdminSite):
         app_list = self.get_app_list(request)
         
         # Lấy thông tin sinh viên
-        try:
-            student = Student.objects.get(user=request.user)
+        student = get_role(request).student
+        student_info = None
+        if student is not None:
             student_info = {
                 'name': student.user.name,
                 'student_code': student.student_code,
@@ -509,8 +511,6 @@ class StudentAdminSite(AdminSite):
                 'attendance_count': Attendance.objects.filter(student=student).count(),
                 'present_count': Attendance.objects.filter(student=student, is_present=True).count(),
             }
-        except:
-            student_info = None
             
         context = {
             **self.each_context(request),
@@ -678,11 +678,10 @@ class StudentAttendanceAdmin(admin.ModelAdmin):
         if request.user.is_superuser:
             return qs
         
-        try:
-            student = Student.objects.get(user=request.user)
-            return qs.filter(student=student)
-        except Student.DoesNotExist:
+        student = get_role(request).student
+        if student is None:
             return qs.none()
+        return qs.filter(student=student)
     
     def has_add_permission(self, request):
         return False  # Sinh viên không được thêm mới attendance
@@ -746,12 +745,11 @@ class StudentScheduleAdmin(admin.ModelAdmin):
         if request.user.is_superuser:
             return qs
         
-        try:
-            student = Student.objects.get(user=request.user)
-            classes = student.student_classes.all()
-            return qs.filter(class_name__in=classes)
-        except Student.DoesNotExist:
+        student = get_role(request).student
+        if student is None:
             return qs.none()
+        classes = student.student_classes.all()
+        return qs.filter(class_name__in=classes)
     
     def has_add_permission(self, request):
         return False  # Sinh viên không được thêm mới lịch học
@@ -815,14 +813,13 @@ class StudentClassroomAdmin(admin.ModelAdmin):
         if request.user.is_superuser:
             return qs
         
-        try:
-            student = Student.objects.get(user=request.user)
-            classes = student.student_classes.all()
-            schedules = Schedule.objects.filter(class_name__in=classes)
-            classroom_ids = schedules.values_list('room', flat=True).distinct()
-            return qs.filter(id__in=classroom_ids)
-        except Student.DoesNotExist:
+        student = get_role(request).student
+        if student is None:
             return qs.none()
+        classes = student.student_classes.all()
+        schedules = Schedule.objects.filter(class_name__in=classes)
+        classroom_ids = schedules.values_list('room', flat=True).distinct()
+        return qs.filter(id__in=classroom_ids)
 
 # Đăng ký các model với site admin của sinh viên
 student_admin_site.register(Attendance, StudentAttendanceAdmin)
@@ -6,4 +6,5 @@ class CoreConfig(AppConfig):
     name = "core"
 
     def ready(self):
-        import core.signals
\ No newline at end of file
+        import core.checks
+        import core.signals
@@ -0,0 +1,40 @@
+"""
+Giới hạn số thread của ứng dụng ASGI (app/asgi.py).
+
+ASGIHandler của Django mở một ThreadSensitiveContext cho mỗi request: mọi phần đồng bộ của request
+(process_request / process_response của các middleware dạng MiddlewareMixin, view đồng bộ, truy vấn của
+ORM async, sync_to_async) chạy trên một thread riêng của request đó, thread tồn tại tới khi response
+kết thúc. Hàng trăm request đang chờ (vd. chờ tra cứu vị trí theo IP) giữ hàng trăm thread.
+
+SyncThreadPoolMiddleware gán mỗi request vào một trong ASGI_SYNC_THREADS ngữ cảnh dùng chung (ngữ cảnh
+đang có ít request nhất) trước khi chuyển cho Django; ThreadSensitiveContext của Django thấy đã có
+ngữ cảnh nên dùng lại. Phần đồng bộ của một request vẫn luôn chạy trên cùng một thread (kết nối CSDL,
+transaction), các request cùng ngữ cảnh chạy phần đồng bộ lần lượt như các thread của một worker uWSGI.
+Mọi middleware trong settings.MIDDLEWARE phải dùng được async: middleware chỉ đồng bộ giữ thread của
+ngữ cảnh trong suốt phần còn lại của request.
+"""
+from asgiref.sync import SyncToAsync, ThreadSensitiveContext
+from django.conf import settings
+
+
+class SyncThreadPoolMiddleware:
+    """Middleware ASGI: các request HTTP dùng chung `size` thread cho phần đồng bộ"""
+
+    def __init__(self, app, size=None):
+        self.app = app
+        self.size = size or settings.ASGI_SYNC_THREADS
+        self._contexts = [ThreadSensitiveContext() for _ in range(self.size)]
+        # Số request đang xử lý của từng ngữ cảnh; chỉ được đọc / ghi trên event loop
+        self._load = [0] * self.size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        slot = min(range(self.size), key=self._load.__getitem__)
+        self._load[slot] += 1
+        token = SyncToAsync.thread_sensitive_context.set(self._contexts[slot])
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            SyncToAsync.thread_sensitive_context.reset(token)
+            self._load[slot] -= 1
@@ -0,0 +1,157 @@
+"""
+Tiện ích dùng chung cho các lệnh benchmark (manage.py bench_*).
+
+Các lệnh benchmark chạy trên một cơ sở dữ liệu tạm được tạo giống như khi chạy test,
+vì vậy không làm thay đổi dữ liệu thật.
+"""
+import itertools
+import os
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from .models import Attendance, Class, Classroom, Object, Schedule, Student, Teacher, User, Weekday
+from .rollup import rebuild_rollups
+
+
+@contextmanager
+def benchmark_database(verbosity=0, sqlite_file=False):
+    """
+    Tạo cơ sở dữ liệu tạm và thư mục media tạm, xoá cả hai khi kết thúc.
+    Với SQLite, CSDL tạm mặc định nằm trong bộ nhớ; sqlite_file=True tạo file trong thư mục tạm
+    (cần cho các benchmark về journal mode / ghi đồng thời). Benchmark chạy trong một tiến trình
+    nên cache trong bộ nhớ tiến trình được coi là dùng chung (CACHE_SINGLE_PROCESS).
+    """
+    old_name = connection.settings_dict['NAME']
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    old_test_name = test_settings.get('NAME')
+    with tempfile.TemporaryDirectory() as media_root, override_settings(
+        MEDIA_ROOT=media_root, CACHE_SINGLE_PROCESS=True,
+    ):
+        if sqlite_file and connection.vendor == 'sqlite':
+            test_settings['NAME'] = os.path.join(media_root, 'benchmark.sqlite3')
+        connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+        try:
+            yield connection
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+            test_settings['NAME'] = old_test_name
+
+
+class QueryCounter:
+    """Đếm số truy vấn qua execute_wrapper, không bị giới hạn 9000 truy vấn như CaptureQueriesContext"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def measure(func, *args, **kwargs):
+    """Chạy `func` và trả về (kết quả, số truy vấn, thời gian tính bằng giây)"""
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+    return result, counter.count, elapsed
+
+
+def percentile(values, pct):
+    """Phân vị `pct` (0-100) của danh sách giá trị, dùng nội suy gần nhất"""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def _create_users(count, label):
+    users = [
+        User(email=f"{label}-{uuid.uuid4().hex[:10]}@bench.local", name=f"{label} {i}", password='!')
+        for i in range(count)
+    ]
+    return User.objects.bulk_create(users)
+
+
+# Số thứ tự cho mã sinh viên: mã ngẫu nhiên mặc định (6 ký tự hex) có thể trùng khi tạo hàng chục nghìn sinh viên
+_student_numbers = itertools.count(1)
+
+
+def create_students(count):
+    users = _create_users(count, 'sv')
+    return Student.objects.bulk_create([
+        Student(user=user, student_code=f'S{next(_student_numbers):06d}') for user in users
+    ])
+
+
+def create_teacher():
+    user = _create_users(1, 'gv')[0]
+    return Teacher.objects.create(user=user)
+
+
+def seed_school(classes=1, students_per_class=5, schedules_per_class=2, days=5,
+                teacher=None, student=None):
+    """
+    Sinh dữ liệu mẫu: `classes` lớp, mỗi lớp `students_per_class` sinh viên và
+    `schedules_per_class` lịch học; điểm danh được rải đều trên `days` ngày gần nhất.
+    `teacher` dạy mọi lớp và `student` (nếu có) học mọi lớp được sinh ra.
+    """
+    weekdays = [Weekday.objects.get_or_create(day=day)[0] for day, _ in Weekday.DAY_CHOICES]
+    today = timezone.now().date()
+    teacher = teacher or create_teacher()
+    room = Classroom.objects.create(class_name='P-bench', latitude=20.9845, longitude=105.7987)
+
+    schedules = []
+    for c in range(classes):
+        class_obj = Class.objects.create(class_name=f"Lớp {c}")
+        students = create_students(students_per_class)
+        if student is not None:
+            students.append(student)
+        class_obj.students.add(*students)
+        class_obj.teachers.add(teacher)
+        teacher.teaching_classes.add(class_obj)
+
+        for j in range(schedules_per_class):
+            course = Object.objects.create(object_name=f"Môn {c}-{j}")
+            schedule = Schedule(
+                teacher=teacher,
+                course_name=course,
+                room=room,
+                class_name=class_obj,
+                lesson_start=1 + j % 11,
+                start_date=today - timedelta(days=j % days),
+                end_date=today + timedelta(days=30),
+            )
+            schedule.save()
+            schedule.weekdays.set(weekdays)
+            schedules.append(schedule)
+
+            rows = Attendance.objects.bulk_create([
+                Attendance(
+                    student=s,
+                    schedule=schedule,
+                    is_present=k % 4 != 0,
+                    is_late=k % 5 == 0,
+                )
+                for k, s in enumerate(students)
+            ])
+            # timestamp là auto_now_add nên phải cập nhật lại sau khi tạo
+            for offset in range(days):
+                ids = [row.id for k, row in enumerate(rows) if (k + j) % days == offset]
+                Attendance.objects.filter(id__in=ids).update(
+                    timestamp=timezone.now() - timedelta(days=offset)
+                )
+
+    # bulk_create / update không phát signal nên dựng lại bảng tổng hợp
+    rebuild_rollups()
+
+    return {'teacher': teacher, 'student': student, 'schedules': schedules}
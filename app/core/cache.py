@@ -0,0 +1,288 @@
+"""
+Lớp cache dùng chung cho dữ liệu đọc nhiều khi điểm danh.
+
+Backend là cache 'default' của Django (CACHES trong settings): Redis (hoặc server tương thích giao thức
+Redis) khi có CACHE_URL, bộ nhớ tiến trình (LocMem) khi phát triển / benchmark.
+
+- CachedLoader: đọc theo khóa chính, nạp từ CSDL khi chưa có trong cache; get_many nạp các khóa
+  còn thiếu bằng một truy vấn. Mỗi loader ghi lại số lần trúng / trượt cache (CacheStats).
+- class_rosters: chỉ mục id sinh viên của từng lớp (RosterIndex, core/roster_index.py).
+- classroom_geofences: mã phòng học và ranh giới điểm danh (Geofence, core/geofence.py).
+Ảnh chụp lịch học (core/checkin.py) cũng dùng CachedLoader. Cache bị xoá bởi các signal
+trong core/signals.py khi Schedule, Class.students hoặc Classroom thay đổi.
+"""
+import threading
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from .geofence import Geofence
+from .models import Class, Classroom
+from .roster_index import RosterIndex
+
+STATS_KEY = 'cache:stats:{}:{}'
+STATS_FIELDS = ('hits', 'misses', 'invalidations')
+
+
+class CacheStats:
+    """
+    Đếm số lần trúng / trượt / xoá cache theo từng loader.
+    Số đếm được cộng dồn trong tiến trình và đẩy lên cache dùng chung sau mỗi `publish_every` lần,
+    để `manage.py cache_stats` đọc được tổng của mọi worker mà không tốn thêm một lượt gọi mỗi request.
+    """
+
+    def __init__(self, publish_every=100):
+        self.publish_every = publish_every
+        self._local = Counter()
+        self._pending = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, name, field, count=1):
+        if not count:
+            return
+        with self._lock:
+            self._local[(name, field)] += count
+            self._pending[(name, field)] += count
+            publish = sum(self._pending.values()) >= self.publish_every
+        if publish:
+            self.publish()
+
+    def publish(self):
+        """Cộng các số đếm chưa đẩy vào cache dùng chung"""
+        with self._lock:
+            pending = self._pending
+            self._pending = Counter()
+        for (name, field), count in pending.items():
+            key = STATS_KEY.format(name, field)
+            # add() không ghi đè nếu khóa đã tồn tại; incr() là phép cộng nguyên tử trên Redis
+            cache.add(key, 0, timeout=None)
+            try:
+                cache.incr(key, count)
+            except ValueError:
+                # Khóa vừa bị xoá (reset) giữa add() và incr()
+                cache.set(key, count, timeout=None)
+
+    def local(self):
+        """Số đếm của tiến trình hiện tại, theo từng loader"""
+        with self._lock:
+            return _summarize(self._local)
+
+    def shared(self, names):
+        """Số đếm đã đẩy lên cache dùng chung (tổng của mọi tiến trình)"""
+        keys = {STATS_KEY.format(name, field): (name, field) for name in names for field in STATS_FIELDS}
+        values = cache.get_many(list(keys))
+        return _summarize(Counter({keys[key]: value for key, value in values.items()}), names)
+
+    def reset(self, names=()):
+        with self._lock:
+            self._local.clear()
+            self._pending.clear()
+        cache.delete_many([STATS_KEY.format(name, field) for name in names for field in STATS_FIELDS])
+
+
+def _summarize(counter, names=()):
+    result = {name: dict.fromkeys(STATS_FIELDS, 0) for name in names}
+    for (name, field), count in counter.items():
+        result.setdefault(name, dict.fromkeys(STATS_FIELDS, 0))[field] = count
+    for values in result.values():
+        lookups = values['hits'] + values['misses']
+        values['hit_ratio'] = values['hits'] / lookups if lookups else None
+    return result
+
+
+stats = CacheStats()
+
+# Các loader đã đăng ký, theo tên
+loaders = {}
+
+
+def cache_is_shared():
+    """
+    Việc xoá / ghi cache có tới mọi tiến trình phục vụ request không: cache không nằm trong bộ nhớ
+    của tiến trình (LocMemCache), hoặc chỉ có một tiến trình (settings.CACHE_SINGLE_PROCESS)
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    return settings.CACHE_SINGLE_PROCESS or not backend.endswith('.LocMemCache')
+
+
+class CachedLoader:
+    """
+    Cache đọc qua (read-through) theo khóa chính nguyên.
+    `load(pk)` trả về giá trị hoặc None (không được cache); `load_many(pks)` trả về dict {pk: giá trị};
+    `aload(pk)` là bản coroutine của load (ORM async) cho aget().
+    Thời gian sống lấy từ settings.<timeout_setting>, mặc định `default_timeout` giây.
+    `shared_only=True`: chỉ dùng cache khi cache_is_shared(), nếu không mọi lần đọc đều nạp từ CSDL
+    (dữ liệu mà một worker dùng bản cũ sau khi bị xoá cache là không chấp nhận được).
+    """
+
+    def __init__(
+        self, name, load, load_many=None, timeout_setting=None, default_timeout=300, aload=None, shared_only=False,
+    ):
+        self.name = name
+        self.load = load
+        self.load_many = load_many
+        self.aload = aload
+        self.timeout_setting = timeout_setting
+        self.default_timeout = default_timeout
+        self.shared_only = shared_only
+        loaders[name] = self
+
+    @property
+    def enabled(self):
+        return not self.shared_only or cache_is_shared()
+
+    @property
+    def timeout(self):
+        if self.timeout_setting is None:
+            return self.default_timeout
+        return getattr(settings, self.timeout_setting, self.default_timeout)
+
+    def key(self, pk):
+        return f"{self.name}:{pk}"
+
+    def get(self, pk):
+        """Giá trị của `pk`, hoặc None nếu `pk` không hợp lệ / không tồn tại"""
+        try:
+            pk = int(pk)
+        except (TypeError, ValueError):
+            return None
+        if not self.enabled:
+            return self.load(pk)
+        key = self.key(pk)
+        value = cache.get(key)
+        if value is not None:
+            stats.record(self.name, 'hits')
+            return value
+        stats.record(self.name, 'misses')
+        value = self.load(pk)
+        if value is not None:
+            cache.set(key, value, self.timeout)
+        return value
+
+    async def aget(self, pk):
+        """get() cho code async: đọc cache bằng cache.aget, khi trượt nạp bằng aload (hoặc load qua sync_to_async)"""
+        try:
+            pk = int(pk)
+        except (TypeError, ValueError):
+            return None
+        if not self.enabled:
+            return await self._aload(pk)
+        key = self.key(pk)
+        value = await cache.aget(key)
+        if value is not None:
+            stats.record(self.name, 'hits')
+            return value
+        stats.record(self.name, 'misses')
+        value = await self._aload(pk)
+        if value is not None:
+            await cache.aset(key, value, self.timeout)
+        return value
+
+    async def _aload(self, pk):
+        return await self.aload(pk) if self.aload is not None else await sync_to_async(self.load)(pk)
+
+    def _load_many(self, pks):
+        loaded = self.load_many(list(pks)) if self.load_many is not None else {pk: self.load(pk) for pk in pks}
+        return {pk: value for pk, value in loaded.items() if value is not None}
+
+    def get_many(self, pks):
+        """dict {pk: giá trị} cho các `pk` tồn tại; các khóa còn thiếu được nạp cùng lúc"""
+        pks = {int(pk) for pk in pks}
+        if not self.enabled:
+            return self._load_many(pks) if pks else {}
+        keys = {self.key(pk): pk for pk in pks}
+        found = {keys[key]: value for key, value in cache.get_many(list(keys)).items()}
+        missing = [pk for pk in keys.values() if pk not in found]
+        stats.record(self.name, 'hits', len(found))
+        stats.record(self.name, 'misses', len(missing))
+        if missing:
+            loaded = self._load_many(missing)
+            cache.set_many({self.key(pk): value for pk, value in loaded.items()}, self.timeout)
+            found.update(loaded)
+        return found
+
+    def refresh(self, pks):
+        """Nạp lại các khóa từ CSDL và ghi đè vào cache (khóa không còn tồn tại thì bị xoá)"""
+        pks = {int(pk) for pk in pks}
+        if not pks:
+            return {}
+        loaded = self._load_many(pks)
+        if not self.enabled:
+            return loaded
+        cache.set_many({self.key(pk): value for pk, value in loaded.items()}, self.timeout)
+        cache.delete_many([self.key(pk) for pk in pks - set(loaded)])
+        return loaded
+
+    def invalidate(self, pks):
+        keys = [self.key(pk) for pk in pks]
+        if keys:
+            cache.delete_many(keys)
+            stats.record(self.name, 'invalidations', len(keys))
+
+    async def ainvalidate(self, pks):
+        keys = [self.key(pk) for pk in pks]
+        if keys:
+            await cache.adelete_many(keys)
+            stats.record(self.name, 'invalidations', len(keys))
+
+
+def load_class_rosters(class_ids):
+    """{class_id: RosterIndex} cho các lớp tồn tại, hai truy vấn"""
+    rosters = {class_id: [] for class_id in Class.objects.filter(pk__in=class_ids).values_list('pk', flat=True)}
+    for class_id, student_id in Class.students.through.objects.filter(
+        class_id__in=rosters
+    ).values_list('class_id', 'student_id'):
+        rosters[class_id].append(student_id)
+    return {class_id: RosterIndex(students) for class_id, students in rosters.items()}
+
+
+async def aload_class_roster(class_id):
+    """load_class_rosters() của một lớp bằng ORM async"""
+    if not await Class.objects.filter(pk=class_id).aexists():
+        return None
+    students = Class.students.through.objects.filter(class_id=class_id).values_list('student_id', flat=True)
+    return RosterIndex([student_id async for student_id in students])
+
+
+class_rosters = CachedLoader(
+    'roster',
+    load=lambda class_id: load_class_rosters([class_id]).get(class_id),
+    load_many=load_class_rosters,
+    timeout_setting='CLASS_ROSTER_TTL',
+    aload=aload_class_roster,
+)
+
+
+def is_class_member(class_id, student_id):
+    """Sinh viên có thuộc lớp không, đọc từ chỉ mục danh sách lớp trong cache"""
+    roster = class_rosters.get(class_id)
+    return roster is not None and student_id in roster
+
+
+GEOFENCE_FIELDS = ('pk', 'classroom_code', 'latitude', 'longitude', 'geofence_radius', 'geofence_polygon')
+
+
+def load_classroom_geofences(classroom_ids):
+    """{classroom_id: Geofence} (core/geofence.py), đa giác được chiếu sẵn khi nạp"""
+    return {
+        row[0]: Geofence.build(*row)
+        for row in Classroom.objects.filter(pk__in=classroom_ids).values_list(*GEOFENCE_FIELDS)
+    }
+
+
+async def aload_classroom_geofence(classroom_id):
+    """load_classroom_geofences() của một phòng học bằng ORM async"""
+    row = await Classroom.objects.filter(pk=classroom_id).values_list(*GEOFENCE_FIELDS).afirst()
+    return Geofence.build(*row) if row is not None else None
+
+
+classroom_geofences = CachedLoader(
+    'geofence',
+    load=lambda classroom_id: load_classroom_geofences([classroom_id]).get(classroom_id),
+    load_many=load_classroom_geofences,
+    timeout_setting='CLASSROOM_GEOFENCE_TTL',
+    default_timeout=3600,
+    aload=aload_classroom_geofence,
+)
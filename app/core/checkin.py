@@ -0,0 +1,384 @@
+"""
+Đường điểm danh nhanh bằng mã QR cho các đợt cao điểm đầu giờ học.
+
+- ScheduleSnapshot: ảnh chụp những gì cần để kiểm tra một lượt điểm danh (giờ học, thứ trong tuần,
+  lớp, phòng, tên hiển thị). Được lưu qua lớp cache dùng chung (core/cache.py) và bị xoá khi Schedule
+  hoặc Class thay đổi (xem core/signals.py). Danh sách sinh viên và tọa độ phòng được cache riêng
+  (class_rosters, classroom_geofences) nên thay đổi sĩ số hay tọa độ không làm mất ảnh chụp lịch học.
+- upsert_checkins: ghi các lượt điểm danh bằng một câu lệnh INSERT ... ON CONFLICT DO UPDATE có điều kiện
+  trên khóa duy nhất (student, schedule): lượt có mặt đầu tiên được giữ, không có race giữa đọc và ghi.
+- Mỗi lượt điểm danh được ghi được phát tới luồng sự kiện thời gian thực của lịch học (core/realtime.py).
+- Các hàm bắt đầu bằng `a` (aget_schedule_snapshot, ScheduleSnapshot.aprefetch, acheck_in) dùng cho view
+  async: đọc cache và CSDL bằng cache async / ORM async.
+- CheckInBuffer: hàng đợi trong tiến trình gom các lượt điểm danh hợp lệ và ghi một lần bằng upsert_checkins
+  (at-most-once, lượt ghi thất bại được thử lại rồi ghi vào log).
+"""
+import atexit
+import dataclasses
+import json
+import logging
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, connections, transaction
+from django.utils import timezone
+
+from .cache import CachedLoader, class_rosters, classroom_geofences, is_class_member
+from .models import Attendance, Schedule
+from .realtime import publish_checkins
+from .rollup import refresh_rollups, rollup_key
+
+logger = logging.getLogger(__name__)
+
+# Các trường được ghi đè khi bản ghi vắng mặt của sinh viên được chuyển thành có mặt
+CHECKIN_UPDATE_FIELDS = [
+    'is_present', 'is_late', 'minutes_late',
+    'latitude', 'longitude', 'device_info', 'is_in_location',
+]
+CHECKIN_INSERT_FIELDS = ['student', 'schedule', 'timestamp'] + CHECKIN_UPDATE_FIELDS
+# CSDL hỗ trợ INSERT ... ON CONFLICT DO UPDATE ... WHERE ... RETURNING
+UPSERT_VENDORS = ('postgresql', 'sqlite')
+# Số lượt điểm danh tối đa trong một câu lệnh (giới hạn số tham số của SQLite)
+UPSERT_BATCH_SIZE = 500
+
+# Kết quả của check_in()
+CREATED = 'created'
+UPDATED = 'updated'
+ALREADY_PRESENT = 'already_present'
+
+
+@dataclass(frozen=True)
+class ScheduleSnapshot:
+    id: int
+    class_id: int
+    room_id: int
+    start_time: Optional[datetime]
+    end_time: Optional[datetime]
+    weekdays: frozenset
+    course_name: str
+    teacher_name: str
+    class_name: str
+    teacher_id: Optional[int] = None
+    # (RosterIndex, Geofence) đã nạp bởi aprefetch(), không lưu vào cache
+    prefetched: Optional[tuple] = field(default=None, compare=False, repr=False)
+
+    def has_student(self, student_id):
+        if self.prefetched is not None:
+            roster = self.prefetched[0]
+            return roster is not None and student_id in roster
+        return is_class_member(self.class_id, student_id)
+
+    @property
+    def geofence(self):
+        """Mã phòng học và ranh giới điểm danh (Geofence, core/geofence.py) từ cache"""
+        if self.prefetched is not None:
+            return self.prefetched[1]
+        return classroom_geofences.get(self.room_id)
+
+    async def aprefetch(self):
+        """
+        Bản sao của ảnh chụp với danh sách lớp và ranh giới phòng học đã nạp bằng cache async / ORM async:
+        has_student() và geofence không còn đọc cache, gọi được trong event loop.
+        """
+        roster = await class_rosters.aget(self.class_id)
+        geofence = await classroom_geofences.aget(self.room_id)
+        return dataclasses.replace(self, prefetched=(roster, geofence))
+
+
+def _schedule_queryset(schedule_id):
+    return Schedule.objects.select_related('course_name', 'teacher__user', 'class_name').filter(pk=schedule_id)
+
+
+def _snapshot(schedule, weekdays):
+    return ScheduleSnapshot(
+        id=schedule.id,
+        class_id=schedule.class_name_id,
+        room_id=schedule.room_id,
+        start_time=schedule.start_time,
+        end_time=schedule.end_time,
+        weekdays=frozenset(weekdays),
+        course_name=schedule.course_name.object_name,
+        teacher_name=schedule.teacher.user.name,
+        class_name=schedule.class_name.class_name,
+        teacher_id=schedule.teacher_id,
+    )
+
+
+def build_schedule_snapshot(schedule_id):
+    """Nạp ảnh chụp lịch học từ CSDL (2 truy vấn), trả về None nếu lịch học không tồn tại"""
+    schedule = _schedule_queryset(schedule_id).first()
+    if schedule is None:
+        return None
+    return _snapshot(schedule, schedule.weekdays.values_list('day', flat=True))
+
+
+async def abuild_schedule_snapshot(schedule_id):
+    """build_schedule_snapshot() bằng ORM async"""
+    schedule = await _schedule_queryset(schedule_id).afirst()
+    if schedule is None:
+        return None
+    return _snapshot(schedule, [day async for day in schedule.weekdays.values_list('day', flat=True)])
+
+
+schedule_snapshots = CachedLoader(
+    'schedule',
+    load=build_schedule_snapshot,
+    timeout_setting='SCHEDULE_SNAPSHOT_TTL',
+    aload=abuild_schedule_snapshot,
+)
+
+
+def get_schedule_snapshot(schedule_id):
+    """Lấy ảnh chụp lịch học từ cache, nạp lại từ CSDL khi chưa có"""
+    return schedule_snapshots.get(schedule_id)
+
+
+async def aget_schedule_snapshot(schedule_id):
+    """get_schedule_snapshot() cho view async"""
+    return await schedule_snapshots.aget(schedule_id)
+
+
+def invalidate_schedule_snapshots(schedule_ids):
+    schedule_snapshots.invalidate(schedule_ids)
+
+
+def _upsert_sql(count):
+    opts = Attendance._meta
+    qn = connection.ops.quote_name
+    table = qn(opts.db_table)
+    columns = [qn(opts.get_field(name).column) for name in CHECKIN_INSERT_FIELDS]
+    row = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    updates = ', '.join(
+        f'{qn(opts.get_field(name).column)} = EXCLUDED.{qn(opts.get_field(name).column)}'
+        for name in CHECKIN_UPDATE_FIELDS
+    )
+    returning = ', '.join(qn(field.column) for field in opts.concrete_fields)
+    return (
+        f'INSERT INTO {table} ({", ".join(columns)}) VALUES {", ".join([row] * count)} '
+        f'ON CONFLICT ({qn("student_id")}, {qn("schedule_id")}) DO UPDATE SET {updates} '
+        f'WHERE NOT {table}.{qn("is_present")} '
+        f'RETURNING {returning}'
+    )
+
+
+def _upsert_fallback(attendances):
+    """Cùng ngữ nghĩa với upsert_checkins cho CSDL không hỗ trợ upsert có điều kiện"""
+    written = []
+    for attendance in attendances:
+        with transaction.atomic():
+            current = (
+                Attendance.objects.select_for_update()
+                .filter(student_id=attendance.student_id, schedule_id=attendance.schedule_id)
+                .first()
+            )
+            if current is None:
+                attendance.save(force_insert=True)
+                written.append(attendance)
+            elif not current.is_present:
+                for field in CHECKIN_UPDATE_FIELDS:
+                    setattr(current, field, getattr(attendance, field))
+                current.save(update_fields=CHECKIN_UPDATE_FIELDS)
+                written.append(current)
+    return written
+
+
+def upsert_checkins(attendances):
+    """
+    Ghi các lượt điểm danh (Attendance chưa lưu), mỗi lô một câu lệnh upsert có điều kiện:
+    bản ghi mới được tạo, bản ghi vắng mặt được chuyển thành có mặt, bản ghi đã có mặt giữ nguyên
+    (lượt điểm danh đầu tiên được giữ, kể cả khi hai request cùng lúc).
+    Trả về {(student_id, schedule_id): Attendance} của các bản ghi đã được tạo hoặc cập nhật.
+    Câu lệnh không phát signal nên bảng tổng hợp được cập nhật tại đây.
+    """
+    written = []
+    # Bản ghi điểm danh và bảng tổng hợp được ghi trong cùng một transaction
+    with transaction.atomic():
+        if connection.vendor not in UPSERT_VENDORS:
+            written = _upsert_fallback(attendances)
+        else:
+            fields = [Attendance._meta.get_field(name) for name in CHECKIN_INSERT_FIELDS]
+            for attendance in attendances:
+                if attendance.timestamp is None:
+                    attendance.timestamp = timezone.now()
+            for start in range(0, len(attendances), UPSERT_BATCH_SIZE):
+                batch = attendances[start:start + UPSERT_BATCH_SIZE]
+                params = [
+                    field.get_db_prep_save(getattr(attendance, field.attname), connection)
+                    for attendance in batch
+                    for field in fields
+                ]
+                written.extend(Attendance.objects.raw(_upsert_sql(len(batch)), params))
+        refresh_rollups({rollup_key(attendance) for attendance in written})
+        if written:
+            # Giáo viên đang theo dõi buổi học nhận sự kiện sau khi bản ghi được commit
+            transaction.on_commit(lambda: publish_checkins(written))
+    return {(attendance.student_id, attendance.schedule_id): attendance for attendance in written}
+
+
+def check_in(attendance):
+    """
+    Ghi một lượt điểm danh bằng upsert_checkins. Trả về (bản ghi điểm danh, kết quả), kết quả là
+    CREATED, UPDATED (bản ghi vắng mặt chuyển thành có mặt) hoặc ALREADY_PRESENT (bản ghi có sẵn, không đổi).
+    """
+    written = upsert_checkins([attendance]).get((attendance.student_id, attendance.schedule_id))
+    if written is None:
+        current = Attendance.objects.get(student_id=attendance.student_id, schedule_id=attendance.schedule_id)
+        return current, ALREADY_PRESENT
+    return written, _checkin_outcome(written, attendance)
+
+
+async def acheck_in(attendance):
+    """
+    check_in() cho view async. Upsert, bảng tổng hợp và sự kiện thời gian thực phải nằm trong một transaction,
+    ORM async của Django chưa hỗ trợ transaction nên phần ghi chạy qua một lần sync_to_async;
+    bản ghi đã có mặt được đọc bằng ORM async.
+    """
+    written = (await sync_to_async(upsert_checkins)([attendance])).get((attendance.student_id, attendance.schedule_id))
+    if written is None:
+        current = await Attendance.objects.aget(student_id=attendance.student_id, schedule_id=attendance.schedule_id)
+        return current, ALREADY_PRESENT
+    return written, _checkin_outcome(written, attendance)
+
+
+def _checkin_outcome(written, attendance):
+    # timestamp không bị ghi đè khi cập nhật nên chỉ bản ghi mới có timestamp của lượt này
+    return CREATED if written.timestamp == attendance.timestamp else UPDATED
+
+
+class CheckInBuffer:
+    """
+    Gom các lượt điểm danh trong tiến trình và ghi hàng loạt.
+    Bộ đệm được ghi khi đủ `max_size` phần tử hoặc sau `max_delay` giây kể từ phần tử đầu tiên.
+    Cùng một (student, schedule) chỉ giữ lượt điểm danh đầu tiên trong mỗi lần ghi.
+
+    Lượt điểm danh được ghi nhiều nhất một lần (at-most-once): request đã nhận phản hồi thành công
+    trước khi bản ghi được ghi. Lần ghi thất bại được ghi log và các lượt điểm danh được đưa lại vào
+    bộ đệm để thử lại, tối đa `max_retries` lần liên tiếp; sau đó (hoặc khi tiến trình kết thúc) các lượt
+    chưa ghi được được ghi vào log ở mức ERROR (một dòng JSON mỗi lượt) để có thể nhập lại.
+    """
+
+    def __init__(self, max_size=200, max_delay=0.5, max_retries=3):
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.max_retries = max_retries
+        self._items = {}
+        self._lock = threading.Lock()
+        self._timer = None
+        # Số lần ghi thất bại liên tiếp
+        self._failures = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, attendance):
+        with self._lock:
+            self._items.setdefault((attendance.student_id, attendance.schedule_id), attendance)
+            full = len(self._items) >= self.max_size
+            if not full:
+                self._start_timer()
+        if full:
+            self.flush()
+
+    def _start_timer(self):
+        # Gọi khi đang giữ self._lock
+        if self._timer is None:
+            self._timer = threading.Timer(self.max_delay, self._flush_from_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _take(self):
+        with self._lock:
+            batch = list(self._items.values())
+            self._items.clear()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        return batch
+
+    def flush(self):
+        """Ghi toàn bộ bộ đệm xuống CSDL, trả về số bản ghi đã ghi (0 nếu lần ghi thất bại)"""
+        batch = self._take()
+        if not batch:
+            return 0
+        try:
+            upsert_checkins(batch)
+        except Exception:
+            self._retry_later(batch)
+            return 0
+        with self._lock:
+            self._failures = 0
+        return len(batch)
+
+    def _retry_later(self, batch):
+        with self._lock:
+            self._failures += 1
+            failures = self._failures
+            retry = failures <= self.max_retries
+            if retry:
+                # Lượt điểm danh của lần ghi thất bại đến trước các lượt mới thêm vào bộ đệm
+                pending = {(attendance.student_id, attendance.schedule_id): attendance for attendance in batch}
+                for key, attendance in self._items.items():
+                    pending.setdefault(key, attendance)
+                self._items = pending
+                self._start_timer()
+            else:
+                self._failures = 0
+        if retry:
+            logger.exception(
+                "Không ghi được %d lượt điểm danh trong bộ đệm, thử lại (lần %d/%d)",
+                len(batch), failures, self.max_retries,
+            )
+        else:
+            logger.exception("Không ghi được %d lượt điểm danh trong bộ đệm sau %d lần thử", len(batch), failures)
+            self._spill(batch)
+
+    @staticmethod
+    def _spill(batch):
+        for attendance in batch:
+            fields = [Attendance._meta.get_field(name).attname for name in CHECKIN_INSERT_FIELDS]
+            logger.error("Lượt điểm danh chưa được ghi: %s", json.dumps(
+                {field: getattr(attendance, field) for field in fields}, cls=DjangoJSONEncoder, ensure_ascii=False,
+            ))
+
+    def close(self):
+        """Ghi nốt bộ đệm khi tiến trình kết thúc; các lượt không ghi được được ghi vào log"""
+        self.flush()
+        batch = self._take()
+        if batch:
+            self._spill(batch)
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Không ghi được bộ đệm điểm danh")
+        finally:
+            # Thread của timer có kết nối CSDL riêng, đóng lại khi xong
+            connections.close_all()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_checkin_buffer():
+    """Trả về bộ đệm điểm danh của tiến trình, hoặc None nếu tính năng đang tắt"""
+    global _buffer
+    config = getattr(settings, 'ATTENDANCE_CHECKIN_BUFFER', {})
+    if not config.get('ENABLED'):
+        return None
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = CheckInBuffer(
+                    max_size=config.get('MAX_SIZE', 200),
+                    max_delay=config.get('MAX_DELAY', 0.5),
+                    max_retries=config.get('MAX_RETRIES', 3),
+                )
+                atexit.register(_buffer.close)
+    return _buffer
@@ -0,0 +1,23 @@
+"""Kiểm tra cấu hình (manage.py check) cho cache dùng chung"""
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+from .cache import cache_is_shared
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """Cache trong bộ nhớ tiến trình khi có thể có nhiều worker: các worker khác không thấy việc xoá cache"""
+    if cache_is_shared():
+        return []
+    return [
+        Warning(
+            "Cache 'default' nằm trong bộ nhớ của từng tiến trình (không có CACHE_URL): signal xoá cache chỉ "
+            "có hiệu lực trong tiến trình nhận thay đổi, các worker khác dùng dữ liệu cũ tới khi hết hạn - "
+            f"ảnh chụp lịch học {settings.SCHEDULE_SNAPSHOT_TTL} giây, danh sách sinh viên của lớp "
+            f"{settings.CLASS_ROSTER_TTL} giây, tọa độ phòng học {settings.CLASSROOM_GEOFENCE_TTL} giây. "
+            "ETag / 304 của các API đọc (core/http_cache.py) và cache user khi xác thực JWT (core/roles.py) bị tắt.",
+            hint="Đặt CACHE_URL tới Redis dùng chung, hoặc CACHE_SINGLE_PROCESS=true nếu chỉ chạy một tiến trình.",
+            id='core.W001',
+        )
+    ]
@@ -0,0 +1,236 @@
+"""
+Kiểm tra vị trí điểm danh so với phòng học (geofence).
+
+Mỗi phòng học có một trong hai loại ranh giới:
+- Hình tròn: tâm là tọa độ phòng học, bán kính Classroom.geofence_radius (mét).
+- Đa giác: Classroom.geofence_polygon, danh sách [vĩ độ, kinh độ]. Khi có đa giác thì bán kính không dùng.
+
+Geofence được dựng một lần cho mỗi phòng học (và cache trong core/cache.py classroom_geofences):
+các đỉnh đa giác được chiếu sẵn sang mặt phẳng cục bộ (mét, phép chiếu equirectangular quanh tâm phòng),
+nên mỗi lần kiểm tra chỉ là phép tính trên mặt phẳng. Sai số của phép chiếu không đáng kể ở phạm vi
+vài km quanh phòng học.
+
+check_many() kiểm tra hàng loạt điểm bằng NumPy (nạp khi cần; nếu không có NumPy thì lặp từng điểm),
+audit_attendance_locations() dùng nó để kiểm tra lại tọa độ đã lưu của Attendance và cập nhật is_in_location.
+"""
+import logging
+import math
+from dataclasses import dataclass
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS = 6371000  # mét
+DEFAULT_RADIUS = 100  # mét
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Khoảng cách (mét) giữa hai tọa độ GPS theo công thức Haversine"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+
+
+@dataclass(frozen=True)
+class GeofenceCheck:
+    inside: bool
+    # Hình tròn: khoảng cách tới tâm phòng học; đa giác: khoảng cách tới ranh giới (0 nếu ở trong)
+    distance: float
+
+
+@dataclass(frozen=True)
+class Geofence:
+    id: int
+    code: str
+    latitude: Optional[float]
+    longitude: Optional[float]
+    radius: float = DEFAULT_RADIUS
+    # Các đỉnh đa giác đã chiếu sang mặt phẳng quanh tâm: ((x, y), ...) tính bằng mét
+    polygon: tuple = ()
+
+    @classmethod
+    def build(cls, id, code, latitude, longitude, radius=None, polygon=None):
+        """
+        Dựng geofence từ dữ liệu của Classroom. `polygon` là danh sách [vĩ độ, kinh độ];
+        nếu phòng học chưa có tọa độ thì tâm là trung bình các đỉnh đa giác.
+        """
+        radius = radius or DEFAULT_RADIUS
+        points = [(float(lat), float(lon)) for lat, lon in (polygon or [])]
+        if len(points) < 3:
+            return cls(id, code, latitude, longitude, radius)
+        if latitude is None or longitude is None:
+            latitude = sum(lat for lat, _ in points) / len(points)
+            longitude = sum(lon for _, lon in points) / len(points)
+        fence = cls(id, code, latitude, longitude, radius)
+        return cls(id, code, latitude, longitude, radius, tuple(fence.project(lat, lon) for lat, lon in points))
+
+    @property
+    def has_location(self):
+        return self.latitude is not None and self.longitude is not None
+
+    @property
+    def is_polygon(self):
+        return bool(self.polygon)
+
+    def project(self, latitude, longitude):
+        """Tọa độ (x, y) tính bằng mét trên mặt phẳng cục bộ quanh tâm phòng học"""
+        x = math.radians(longitude - self.longitude) * EARTH_RADIUS * math.cos(math.radians(self.latitude))
+        y = math.radians(latitude - self.latitude) * EARTH_RADIUS
+        return x, y
+
+    def distance(self, latitude, longitude):
+        """Khoảng cách (mét) tới tâm phòng học"""
+        return haversine(latitude, longitude, self.latitude, self.longitude)
+
+    def check(self, latitude, longitude):
+        if not self.is_polygon:
+            distance = self.distance(latitude, longitude)
+            return GeofenceCheck(distance <= self.radius, distance)
+        x, y = self.project(latitude, longitude)
+        inside = _point_in_polygon(x, y, self.polygon)
+        return GeofenceCheck(inside, 0.0 if inside else _distance_to_polygon(x, y, self.polygon))
+
+
+def _edges(polygon):
+    return zip(polygon, polygon[1:] + polygon[:1])
+
+
+def _point_in_polygon(x, y, polygon):
+    """Thuật toán tia (ray casting)"""
+    inside = False
+    for (x1, y1), (x2, y2) in _edges(polygon):
+        if (y1 > y) != (y2 > y) and x < (x2 - x1) * (y - y1) / (y2 - y1) + x1:
+            inside = not inside
+    return inside
+
+
+def _distance_to_polygon(x, y, polygon):
+    """Khoảng cách ngắn nhất từ điểm tới các cạnh của đa giác"""
+    best = math.inf
+    for (x1, y1), (x2, y2) in _edges(polygon):
+        dx, dy = x2 - x1, y2 - y1
+        length = dx * dx + dy * dy
+        t = 0.0 if length == 0 else max(0.0, min(1.0, ((x - x1) * dx + (y - y1) * dy) / length))
+        best = min(best, math.hypot(x - x1 - t * dx, y - y1 - t * dy))
+    return best
+
+
+def _load_numpy():
+    try:
+        import numpy
+    except ImportError:
+        logger.warning("Không có NumPy, kiểm tra geofence hàng loạt sẽ lặp từng điểm")
+        return None
+    return numpy
+
+
+def check_many(geofences, room_ids, latitudes, longitudes):
+    """
+    Kiểm tra hàng loạt điểm. `geofences` là dict {room_id: Geofence}; `room_ids`, `latitudes`,
+    `longitudes` là các dãy cùng độ dài. Trả về (inside, distance): inside là True / False,
+    hoặc None khi phòng học không có geofence hoặc chưa có tọa độ.
+    """
+    np = _load_numpy()
+    if np is None:
+        inside, distance = [], []
+        for room_id, latitude, longitude in zip(room_ids, latitudes, longitudes):
+            fence = geofences.get(room_id)
+            if fence is None or not fence.has_location:
+                inside.append(None)
+                distance.append(None)
+                continue
+            result = fence.check(latitude, longitude)
+            inside.append(result.inside)
+            distance.append(result.distance)
+        return inside, distance
+
+    room_ids = np.asarray(room_ids, dtype=np.int64)
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon = np.radians(np.asarray(longitudes, dtype=np.float64))
+    inside = np.zeros(len(room_ids), dtype=bool)
+    distance = np.full(len(room_ids), np.nan)
+    known = np.zeros(len(room_ids), dtype=bool)
+
+    for room_id in np.unique(room_ids):
+        fence = geofences.get(int(room_id))
+        if fence is None or not fence.has_location:
+            continue
+        mask = room_ids == room_id
+        known |= mask
+        lat0, lon0 = math.radians(fence.latitude), math.radians(fence.longitude)
+        if not fence.is_polygon:
+            a = np.sin((lat[mask] - lat0) / 2) ** 2 + math.cos(lat0) * np.cos(lat[mask]) * np.sin((lon[mask] - lon0) / 2) ** 2
+            d = 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+            distance[mask] = d
+            inside[mask] = d <= fence.radius
+            continue
+
+        x = (lon[mask] - lon0) * EARTH_RADIUS * math.cos(lat0)
+        y = (lat[mask] - lat0) * EARTH_RADIUS
+        crossings = np.zeros(len(x), dtype=bool)
+        best = np.full(len(x), np.inf)
+        for (x1, y1), (x2, y2) in _edges(fence.polygon):
+            if y1 != y2:
+                straddles = (y1 > y) != (y2 > y)
+                crossings ^= straddles & (x < (x2 - x1) * (y - y1) / (y2 - y1) + x1)
+            dx, dy = x2 - x1, y2 - y1
+            length = dx * dx + dy * dy
+            t = np.zeros(len(x)) if length == 0 else np.clip(((x - x1) * dx + (y - y1) * dy) / length, 0, 1)
+            best = np.minimum(best, np.hypot(x - x1 - t * dx, y - y1 - t * dy))
+        inside[mask] = crossings
+        distance[mask] = np.where(crossings, 0.0, best)
+
+    known = known.tolist()
+    return (
+        [value if ok else None for value, ok in zip(inside.tolist(), known)],
+        [value if ok else None for value, ok in zip(distance.tolist(), known)],
+    )
+
+
+def audit_attendance_locations(queryset=None, update=False, chunk_size=5000):
+    """
+    Kiểm tra lại tọa độ đã lưu của các bản ghi điểm danh so với geofence hiện tại của phòng học.
+    Đọc theo lô `chunk_size` bản ghi (keyset theo id); với update=True, cập nhật is_in_location
+    của các bản ghi có kết quả khác (tối đa 2 truy vấn mỗi lô). Trả về dict thống kê.
+    """
+    from .cache import load_classroom_geofences
+    from .models import Attendance
+
+    if queryset is None:
+        queryset = Attendance.objects.all()
+    rows = (
+        queryset.filter(latitude__isnull=False, longitude__isnull=False)
+        .order_by('id')
+        .values_list('id', 'schedule__room_id', 'latitude', 'longitude', 'is_in_location')
+    )
+    summary = {'checked': 0, 'inside': 0, 'outside': 0, 'unknown': 0, 'changed': 0}
+    geofences = {}
+
+    def process(batch):
+        room_ids = {row[1] for row in batch} - set(geofences)
+        if room_ids:
+            geofences.update(load_classroom_geofences(room_ids))
+        ids, rooms, lats, lons, stored = zip(*batch)
+        inside, _ = check_many(geofences, rooms, lats, lons)
+        changes = {True: [], False: []}
+        for pk, result, current in zip(ids, inside, stored):
+            if result is None:
+                summary['unknown'] += 1
+                continue
+            summary['inside' if result else 'outside'] += 1
+            if result != current:
+                changes[result].append(pk)
+        summary['checked'] += len(batch)
+        summary['changed'] += len(changes[True]) + len(changes[False])
+        if update:
+            for value, pks in changes.items():
+                if pks:
+                    Attendance.objects.filter(pk__in=pks).update(is_in_location=value)
+
+    last_id = 0
+    while True:
+        batch = list(rows.filter(id__gt=last_id)[:chunk_size])
+        if not batch:
+            return summary
+        process(batch)
+        last_id = batch[-1][0]
@@ -0,0 +1,277 @@
+"""
+Định vị theo địa chỉ IP mà không chặn request điểm danh.
+
+Thứ tự tra cứu:
+1. Bộ nhớ đệm LRU có giới hạn và TTL, khóa theo dải IP (mặc định /24 với IPv4, /48 với IPv6).
+2. Các backend cục bộ trong settings.GEOIP_BACKENDS, mặc định là CSDL GeoIP định dạng
+   MaxMind (.mmdb) đọc qua mmap.
+3. (Tùy chọn) dịch vụ HTTP ipinfo.io, chạy nền trong thread pool với timeout. Request hiện tại
+   không chờ kết quả; kết quả được đưa vào bộ nhớ đệm cho các lần tra cứu sau.
+   View async (alocate_ip) chờ dịch vụ bằng httpx với timeout mà không chiếm thread; các request
+   cùng dải IP đang chờ dùng chung một lượt gọi.
+"""
+import asyncio
+import importlib.util
+import ipaddress
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class TTLLRUCache:
+    """Bộ nhớ đệm LRU có giới hạn số phần tử, mỗi phần tử hết hạn sau `ttl` giây"""
+
+    def __init__(self, maxsize=10000, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Trả về (có trong bộ nhớ đệm hay không, giá trị)"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return False, None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return False, None
+            self._data.move_to_end(key)
+            return True, value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class MaxMindBackend:
+    """
+    Tra cứu vị trí trong CSDL GeoIP cục bộ định dạng MaxMind (GeoLite2-City.mmdb...).
+    File được mở một lần qua mmap; nếu thiếu file hoặc thư viện maxminddb thì backend bị tắt.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or getattr(settings, 'GEOIP_PATH', None)
+        self._reader = None
+        self._lock = threading.Lock()
+        self._disabled = not self.path
+
+    def _get_reader(self):
+        if self._reader is None and not self._disabled:
+            with self._lock:
+                if self._reader is None and not self._disabled:
+                    try:
+                        import maxminddb
+                        self._reader = maxminddb.open_database(str(self.path), mode=maxminddb.MODE_MMAP)
+                    except (ImportError, OSError, ValueError) as e:
+                        logger.warning("Không mở được CSDL GeoIP %s: %s", self.path, e)
+                        self._disabled = True
+        return self._reader
+
+    def lookup(self, ip):
+        reader = self._get_reader()
+        if reader is None:
+            return None
+        try:
+            record = reader.get(ip)
+        except ValueError:
+            return None
+        location = (record or {}).get('location') or {}
+        if 'latitude' in location and 'longitude' in location:
+            return float(location['latitude']), float(location['longitude'])
+        return None
+
+
+class IPInfoBackend:
+    """Tra cứu qua dịch vụ ipinfo.io (có timeout). Chỉ dùng làm phương án dự phòng."""
+
+    url = "https://ipinfo.io/{ip}/json"
+    # alookup() cần httpx
+    supports_async = importlib.util.find_spec('httpx') is not None
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout or getattr(settings, 'GEOIP_HTTP_TIMEOUT', 2)
+
+    @staticmethod
+    def _parse(data):
+        if 'loc' in data:
+            lat, lon = data['loc'].split(',')
+            return float(lat), float(lon)
+        return None
+
+    def lookup(self, ip):
+        import requests
+
+        try:
+            response = requests.get(self.url.format(ip=ip), timeout=self.timeout)
+            if response.status_code == 200:
+                return self._parse(response.json())
+        except Exception as e:
+            logger.info("Không lấy được vị trí từ ipinfo.io cho %s: %s", ip, e)
+        return None
+
+    async def alookup(self, ip):
+        import httpx
+
+        try:
+            async with httpx.AsyncClient(timeout=self.timeout) as client:
+                response = await client.get(self.url.format(ip=ip))
+            if response.status_code == 200:
+                return self._parse(response.json())
+        except Exception as e:
+            logger.info("Không lấy được vị trí từ ipinfo.io cho %s: %s", ip, e)
+        return None
+
+
+class GeoLocator:
+    """Kết hợp bộ nhớ đệm, các backend cục bộ và backend HTTP dự phòng chạy nền"""
+
+    def __init__(self, backends=None, fallback=None, cache=None):
+        self.backends = backends if backends is not None else [
+            import_string(path)() for path in getattr(settings, 'GEOIP_BACKENDS', [])
+        ]
+        if fallback is None and getattr(settings, 'GEOIP_HTTP_FALLBACK', False):
+            fallback = IPInfoBackend()
+        self.fallback = fallback
+        self.cache = cache if cache is not None else TTLLRUCache(
+            maxsize=getattr(settings, 'GEOIP_CACHE_SIZE', 10000),
+            ttl=getattr(settings, 'GEOIP_CACHE_TTL', 3600),
+        )
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        # Lượt tra cứu dự phòng async đang chạy theo (event loop, khóa bộ nhớ đệm)
+        self._inflight = {}
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='geoip') if fallback else None
+
+    @staticmethod
+    def cache_key(ip):
+        """Khóa bộ nhớ đệm theo dải mạng, các IP cùng dải dùng chung kết quả"""
+        address = ipaddress.ip_address(ip)
+        if address.version == 4:
+            prefix = getattr(settings, 'GEOIP_CACHE_IPV4_PREFIX', 24)
+        else:
+            prefix = getattr(settings, 'GEOIP_CACHE_IPV6_PREFIX', 48)
+        return str(ipaddress.ip_network(f"{address}/{prefix}", strict=False))
+
+    def _locate_local(self, ip):
+        """
+        Tra bộ nhớ đệm và các backend cục bộ: (đã có kết quả, vị trí, ip, khóa bộ nhớ đệm).
+        Chưa có kết quả nghĩa là cần hỏi backend dự phòng.
+        """
+        try:
+            address = ipaddress.ip_address((ip or '').strip())
+        except ValueError:
+            return True, None, None, None
+        # IP nội bộ / loopback không có vị trí địa lý
+        if not address.is_global:
+            return True, None, None, None
+
+        ip = str(address)
+        key = self.cache_key(ip)
+        hit, value = self.cache.get(key)
+        if hit:
+            return True, value, ip, key
+
+        for backend in self.backends:
+            value = backend.lookup(ip)
+            if value:
+                self.cache.set(key, value)
+                return True, value, ip, key
+        return False, None, ip, key
+
+    def locate(self, ip):
+        """Trả về (latitude, longitude) hoặc None, không bao giờ chờ dịch vụ bên ngoài"""
+        found, value, ip, key = self._locate_local(ip)
+        if not found and self.fallback is not None:
+            self._schedule_fallback(ip, key)
+        return value
+
+    async def alocate(self, ip):
+        """
+        Như locate() nhưng chờ backend dự phòng (có timeout) bằng coroutine khi backend hỗ trợ
+        (supports_async, alookup); nếu không thì tra cứu dự phòng vẫn chạy nền như locate().
+        """
+        found, value, ip, key = self._locate_local(ip)
+        if found or self.fallback is None:
+            return value
+        if not getattr(self.fallback, 'supports_async', False):
+            self._schedule_fallback(ip, key)
+            return None
+
+        # Chỉ gộp các lượt tra cứu trong cùng event loop: dưới WSGI / runserver mỗi view async chạy trên
+        # event loop riêng (async_to_sync), không thể chờ task của loop khác
+        inflight_key = (asyncio.get_running_loop(), key)
+        task = self._inflight.get(inflight_key)
+        if task is None:
+            task = asyncio.ensure_future(self._run_afallback(ip, key))
+            self._inflight[inflight_key] = task
+            task.add_done_callback(lambda done: self._forget_inflight(inflight_key, done))
+        # shield: request bị huỷ (client ngắt kết nối) không huỷ lượt tra cứu các request khác đang chờ
+        return await asyncio.shield(task)
+
+    def _forget_inflight(self, inflight_key, task):
+        # Chỉ xoá nếu khóa vẫn trỏ tới task này, không xoá task mới hơn cùng khóa
+        if self._inflight.get(inflight_key) is task:
+            del self._inflight[inflight_key]
+
+    async def _run_afallback(self, ip, key):
+        value = await self.fallback.alookup(ip)
+        self.cache.set(key, value)
+        return value
+
+    def _schedule_fallback(self, ip, key):
+        with self._pending_lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+        self._executor.submit(self._run_fallback, ip, key)
+
+    def _run_fallback(self, ip, key):
+        try:
+            value = self.fallback.lookup(ip)
+            # Lưu cả kết quả rỗng để không gọi lại dịch vụ cho dải IP này cho tới khi hết hạn
+            self.cache.set(key, value)
+        finally:
+            with self._pending_lock:
+                self._pending.discard(key)
+
+
+_locator = None
+_locator_lock = threading.Lock()
+
+
+def get_locator():
+    global _locator
+    if _locator is None:
+        with _locator_lock:
+            if _locator is None:
+                _locator = GeoLocator()
+    return _locator
+
+
+def locate_ip(ip):
+    """Lấy (latitude, longitude) theo IP, trả về None nếu chưa xác định được"""
+    return get_locator().locate(ip)
+
+
+async def alocate_ip(ip):
+    """locate_ip() cho view async, xem GeoLocator.alocate"""
+    return await get_locator().alocate(ip)
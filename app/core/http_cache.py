@@ -0,0 +1,109 @@
+"""
+ETag / Last-Modified cho các API đọc nhiều, ít thay đổi (thời khoá biểu, phòng học, giáo viên, thông tin người dùng).
+
+Mỗi nhóm dữ liệu (scope) có một số phiên bản trong cache dùng chung, là thời điểm (ns) của lần thay đổi
+gần nhất; các signal trong core/signals.py gọi bump_versions() sau khi transaction được commit.
+ETag của một response được tính từ đường dẫn (kể cả query string), người dùng và phiên bản các scope
+mà API phụ thuộc (luôn gồm cả scope của người dùng), nên khi client gửi If-None-Match / If-Modified-Since còn khớp, decorator
+conditional_get trả về 304 ngay sau khi xác thực: không chạy truy vấn chính và serializer.
+Phiên bản chỉ đúng khi mọi worker cùng thấy: với cache trong bộ nhớ tiến trình (cache_is_shared() sai)
+các worker khác không thấy bump_versions() và trả 304 cho dữ liệu cũ, nên conditional_get không gửi ETag.
+"""
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpRequest
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from .cache import cache_is_shared
+
+VERSION_KEY = 'version:{}'
+
+# Các nhóm dữ liệu
+SCHEDULES = 'schedules'  # Schedule, thứ trong tuần, môn học
+CLASSES = 'classes'  # Class và danh sách sinh viên / giáo viên của lớp
+CLASSROOMS = 'classrooms'
+TEACHERS = 'teachers'  # Teacher và tên / thông tin User của giáo viên
+
+
+def user_scope(user_id):
+    """Dữ liệu của riêng một người dùng (User, Student / Teacher của người đó)"""
+    return f'user:{user_id}'
+
+
+def bump_versions(*scopes):
+    """Đánh dấu các scope vừa thay đổi, sau khi transaction hiện tại được commit"""
+    keys = [VERSION_KEY.format(scope) for scope in scopes]
+    transaction.on_commit(lambda: cache.set_many(dict.fromkeys(keys, time.time_ns()), timeout=None))
+
+
+def get_versions(scopes):
+    """Phiên bản (ns) của các scope; scope chưa có phiên bản (cache trống) được khởi tạo bằng thời điểm hiện tại"""
+    keys = [VERSION_KEY.format(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        now = time.time_ns()
+        for key in missing:
+            cache.add(key, now, timeout=None)
+        versions.update(cache.get_many(missing))
+    return [versions.get(key, 0) for key in keys]
+
+
+def conditional_get(scopes, policy, extra=None):
+    """
+    Decorator cho view (hàm hoặc method của ViewSet) trả về dữ liệu chỉ phụ thuộc vào `scopes`
+    và người dùng hiện tại. `policy` là khóa trong settings.HTTP_CACHE_CONTROL; `extra(request)` trả về
+    phần thêm vào ETag cho dữ liệu còn phụ thuộc vào thời gian (vd. ?period=today), hoặc None
+    nếu không được dùng HTTP cache cho request này.
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            request = next(arg for arg in args if isinstance(arg, (Request, HttpRequest)))
+            if request.method not in ('GET', 'HEAD') or not cache_is_shared():
+                return view(*args, **kwargs)
+            suffix = extra(request) if extra is not None else ''
+            if suffix is None:
+                response = view(*args, **kwargs)
+                response['Cache-Control'] = 'private, no-store'
+                return response
+
+            versions = get_versions([*scopes, user_scope(request.user.pk)])
+            seed = f'{request.get_full_path()}|{request.user.pk}|{suffix}|{versions}'
+            etag = '"%s"' % hashlib.sha1(seed.encode('utf-8')).hexdigest()
+            last_modified = max(versions) / 1e9
+
+            if _not_modified(request, etag, last_modified):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                response = view(*args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            response['Cache-Control'] = settings.HTTP_CACHE_CONTROL[policy]
+            patch_vary_headers(response, ['Authorization'])
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def _not_modified(request, etag, last_modified):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        # Khi có If-None-Match thì bỏ qua If-Modified-Since (RFC 9110)
+        return etag in parse_etags(if_none_match) or if_none_match.strip() == '*'
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since') or '')
+    return bool(if_modified_since and int(last_modified) <= if_modified_since)
@@ -0,0 +1,140 @@
+"""
+Idempotency-Key cho các API ghi (điểm danh QR).
+
+Client gửi header `Idempotency-Key` (chuỗi ngẫu nhiên cho mỗi lượt thao tác của người dùng) và gửi lại
+đúng header đó khi thử lại. Phản hồi thành công đầu tiên được lưu trong cache dùng chung theo
+(người dùng, khóa); các lần gửi lại trả về phản hồi đã lưu mà không chạy lại view, không truy cập CSDL.
+- Trong lúc lần đầu còn đang xử lý, lần gửi lại nhận 409.
+- Dùng lại khóa cho một nội dung request khác nhận 422.
+- Phản hồi lỗi không được lưu: khóa được giải phóng để client có thể thử lại.
+- idempotent() dành cho action của ViewSet, aidempotent() cho view async (đọc / ghi cache bằng API async).
+"""
+import functools
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+CACHE_KEY = 'idem:{}:{}:{}'
+IN_PROGRESS = 'in-progress'
+# Thời gian giữ khóa khi request đang xử lý (giây), phòng khi tiến trình chết giữa chừng
+LOCK_TIMEOUT = 60
+
+
+def _fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode('utf-8')).hexdigest()
+
+
+def _key_error(key):
+    """(nội dung lỗi, mã lỗi) nếu Idempotency-Key không hợp lệ, ngược lại None"""
+    if len(key) > MAX_KEY_LENGTH:
+        return {"error": f"{HEADER} dài tối đa {MAX_KEY_LENGTH} ký tự"}, status.HTTP_400_BAD_REQUEST
+    return None
+
+
+def _stored_outcome(stored, fingerprint):
+    """
+    Kết quả khi khóa đã có trong cache: (dữ liệu, mã trạng thái, là phản hồi đã lưu hay không),
+    hoặc None nếu khóa vừa hết hạn (xử lý như request mới).
+    """
+    if stored == IN_PROGRESS:
+        return {"error": "Yêu cầu với Idempotency-Key này đang được xử lý"}, status.HTTP_409_CONFLICT, False
+    if stored is None:
+        return None
+    stored_fingerprint, status_code, data = stored
+    if stored_fingerprint != fingerprint:
+        return {"error": f"{HEADER} đã được dùng cho một yêu cầu khác"}, status.HTTP_422_UNPROCESSABLE_ENTITY, False
+    return data, status_code, True
+
+
+def idempotent(view_method):
+    """Decorator cho action của ViewSet: bật Idempotency-Key cho action đó"""
+
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        error = _key_error(key)
+        if error is not None:
+            return Response(error[0], status=error[1])
+
+        cache_key = CACHE_KEY.format(view_method.__name__, request.user.pk, key)
+        fingerprint = _fingerprint(request)
+        if not cache.add(cache_key, IN_PROGRESS, LOCK_TIMEOUT):
+            outcome = _stored_outcome(cache.get(cache_key), fingerprint)
+            if outcome is not None:
+                data, status_code, replayed = outcome
+                return Response(data, status=status_code, headers={'Idempotent-Replayed': 'true'} if replayed else None)
+            # Khóa vừa hết hạn giữa add() và get(): xử lý như request mới
+            cache.set(cache_key, IN_PROGRESS, LOCK_TIMEOUT)
+
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            cache.delete(cache_key)
+            raise
+        if status.is_success(response.status_code):
+            cache.set(cache_key, (fingerprint, response.status_code, response.data), settings.IDEMPOTENCY_KEY_TTL)
+        else:
+            cache.delete(cache_key)
+        return response
+
+    return wrapper
+
+
+def _json_response(data, status_code):
+    return HttpResponse(JSONRenderer().render(data), status=status_code, content_type='application/json')
+
+
+def aidempotent(view):
+    """
+    idempotent() cho view async `view(request, user, ...)` trả về HttpResponse. View async tự xác thực
+    nên người dùng đã xác thực được truyền vào; dấu vân tay tính trên nội dung request gốc và phản hồi
+    được lưu dưới dạng nội dung đã render.
+    """
+
+    @functools.wraps(view)
+    async def wrapper(request, user, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return await view(request, user, *args, **kwargs)
+        error = _key_error(key)
+        if error is not None:
+            return _json_response(*error)
+
+        cache_key = CACHE_KEY.format(view.__name__, user.pk, key)
+        fingerprint = hashlib.sha256(f'{request.method} {request.path}\n'.encode('utf-8') + request.body).hexdigest()
+        if not await cache.aadd(cache_key, IN_PROGRESS, LOCK_TIMEOUT):
+            outcome = _stored_outcome(await cache.aget(cache_key), fingerprint)
+            if outcome is not None:
+                data, status_code, replayed = outcome
+                if not replayed:
+                    return _json_response(data, status_code)
+                content, content_type = data
+                response = HttpResponse(content, status=status_code, content_type=content_type)
+                response['Idempotent-Replayed'] = 'true'
+                return response
+            await cache.aset(cache_key, IN_PROGRESS, LOCK_TIMEOUT)
+
+        try:
+            response = await view(request, user, *args, **kwargs)
+        except Exception:
+            await cache.adelete(cache_key)
+            raise
+        if status.is_success(response.status_code):
+            stored = (fingerprint, response.status_code, (response.content, response['Content-Type']))
+            await cache.aset(cache_key, stored, settings.IDEMPOTENCY_KEY_TTL)
+        else:
+            await cache.adelete(cache_key)
+        return response
+
+    return wrapper
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from core.geofence import audit_attendance_locations
+from core.models import Attendance
+
+
+class Command(BaseCommand):
+    help = (
+        "Kiểm tra lại tọa độ đã lưu của các bản ghi điểm danh so với geofence hiện tại của phòng học "
+        "(bán kính hoặc đa giác). Với --update, cập nhật is_in_location cho các bản ghi có kết quả khác."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--update', action='store_true', help="Ghi lại is_in_location theo kết quả kiểm tra")
+        parser.add_argument('--schedule', type=int, action='append', help="Chỉ kiểm tra lịch học này (có thể lặp lại)")
+        parser.add_argument('--since', help="Chỉ kiểm tra các bản ghi điểm danh từ ngày này (YYYY-MM-DD)")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Số bản ghi mỗi lô (mặc định 5000)")
+
+    def handle(self, *args, **options):
+        queryset = Attendance.objects.all()
+        if options['schedule']:
+            queryset = queryset.filter(schedule_id__in=options['schedule'])
+        if options['since']:
+            since = parse_date(options['since'])
+            if since is None:
+                raise CommandError("--since phải có dạng YYYY-MM-DD")
+            queryset = queryset.filter(timestamp__date__gte=since)
+
+        summary = audit_attendance_locations(queryset, update=options['update'], chunk_size=options['chunk_size'])
+        self.stdout.write(
+            f"Đã kiểm tra {summary['checked']} bản ghi: {summary['inside']} trong phạm vi, "
+            f"{summary['outside']} ngoài phạm vi, {summary['unknown']} không rõ (phòng học chưa có tọa độ)."
+        )
+        verb = "Đã cập nhật" if options['update'] else "Cần cập nhật"
+        self.stdout.write(self.style.SUCCESS(f"{verb} is_in_location của {summary['changed']} bản ghi."))
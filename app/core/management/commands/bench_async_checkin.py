@@ -0,0 +1,206 @@
+import asyncio
+import contextlib
+import io
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from app.asgi import application
+from core import geolocation, tasks
+from core.benchmarks import benchmark_database, percentile, seed_school
+from core.checkin import invalidate_schedule_snapshots
+from core.geolocation import GeoLocator, TTLLRUCache
+from core.models import Attendance, Schedule, Student
+
+SYNC_PATH = '/api/attendance/qr-attendance/'
+ASYNC_PATH = '/api/attendance/qr-attendance-async/'
+
+
+class SlowIPBackend:
+    """Backend dự phòng thay thế ipinfo.io khi đo: trả về một tọa độ cố định sau `delay` giây"""
+
+    supports_async = True
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def lookup(self, ip):
+        time.sleep(self.delay)
+        return (21.0285, 105.8542)
+
+    async def alookup(self, ip):
+        await asyncio.sleep(self.delay)
+        return (21.0285, 105.8542)
+
+
+class Command(BaseCommand):
+    help = (
+        "So sánh AttendanceViewSet.qr_attendance (WSGI, một nhóm thread cố định) với qr_attendance_async "
+        "(ASGI, mọi request cùng lúc trên một event loop) khi cả lớp điểm danh QR: có tọa độ GPS và "
+        "không có tọa độ (tra cứu vị trí theo IP qua một dịch vụ chậm)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=300, help="Số sinh viên điểm danh (mặc định 300)")
+        parser.add_argument('--threads', type=int, default=8, help="Số thread của đường đồng bộ (mặc định 8)")
+        parser.add_argument('--ip-delay', type=float, default=0.1,
+                            help="Độ trễ của dịch vụ tra cứu IP, giây (mặc định 0.1)")
+
+    def handle(self, *args, **options):
+        with benchmark_database(sqlite_file=True), mock.patch.object(tasks.render_schedule_qr_code, 'delay'):
+            schedule = seed_school(
+                classes=1, students_per_class=options['students'], schedules_per_class=1, days=1,
+            )['schedules'][0]
+            now = timezone.now()
+            Schedule.objects.filter(pk=schedule.pk).update(
+                start_time=now - timedelta(minutes=1),
+                end_time=now + timedelta(hours=1),
+            )
+            invalidate_schedule_snapshots([schedule.pk])
+            self.schedule = schedule
+            self.qr_data = Schedule.objects.values_list('qr_code_data', flat=True).get(pk=schedule.pk)
+            students = list(Student.objects.filter(student_classes=schedule.class_name).select_related('user'))
+            # (token, IP công cộng riêng của từng sinh viên)
+            self.requests = [
+                (str(RefreshToken.for_user(student.user).access_token), f"8.{i // 256}.{i % 256}.1")
+                for i, student in enumerate(students)
+            ]
+
+            problems = []
+            for gps in (True, False):
+                self.stdout.write("Có tọa độ GPS:" if gps else
+                                  f"Không có tọa độ, tra cứu IP mất {options['ip_delay'] * 1000:.0f} ms:")
+                for label, runner in (('đồng bộ', self.run_sync), ('async', self.run_async)):
+                    Attendance.objects.filter(schedule=schedule).delete()
+                    locator = GeoLocator(backends=[], fallback=SlowIPBackend(options['ip_delay']),
+                                         cache=TTLLRUCache(maxsize=10000, ttl=3600))
+                    # Bỏ các dòng print của get_client_ip / get_location_from_ip khỏi kết quả đo
+                    with mock.patch.object(geolocation, '_locator', locator), \
+                            contextlib.redirect_stdout(io.StringIO()):
+                        results, elapsed, peak, threads = runner(gps, options['threads'])
+                    connections.close_all()
+
+                    failures = sum(1 for _, code in results if code != 200)
+                    stored = Attendance.objects.filter(schedule=schedule, is_present=True)
+                    located = stored.filter(latitude__isnull=False).count()
+                    latencies = [latency for latency, _ in results]
+                    self.stdout.write(
+                        f"  {label:<8} {len(results) / elapsed:8.1f} request/s  "
+                        f"p50 {percentile(latencies, 50) * 1000:7.1f} ms  p99 {percentile(latencies, 99) * 1000:7.1f} ms  "
+                        f"đang xử lý tối đa {peak:>4}  thread {threads:>4}  có vị trí {located}/{len(results)}"
+                    )
+                    if failures or stored.count() != len(self.requests):
+                        problems.append(f"{label}, {'GPS' if gps else 'IP'}: lỗi {failures}, {stored.count()} bản ghi")
+
+        if problems:
+            raise CommandError("Kết quả không đúng:\n  " + "\n  ".join(problems))
+        self.stdout.write(self.style.SUCCESS("Hai đường điểm danh ghi đủ bản ghi, không có lỗi."))
+
+    def payload(self, gps):
+        data = {'qr_data': self.qr_data}
+        if gps:
+            data.update(latitude=self.schedule.room.latitude, longitude=self.schedule.room.longitude)
+        return data
+
+    # Cả lớp quét mã cùng lúc: độ trễ của mỗi request tính từ đầu đợt, gồm cả thời gian chờ tới lượt
+
+    def run_sync(self, gps, thread_count):
+        """Full stack WSGI qua django.test.Client, `thread_count` thread như một worker uWSGI nhiều thread"""
+        body = json.dumps(self.payload(gps))
+        local = threading.local()
+        tracker = _InFlight()
+        started = time.perf_counter()
+
+        def post(item):
+            token, ip = item
+            if not hasattr(local, 'client'):
+                local.client = Client()
+            with tracker:
+                try:
+                    code = local.client.post(
+                        SYNC_PATH, body, content_type='application/json',
+                        HTTP_AUTHORIZATION=f"Bearer {token}", HTTP_X_FORWARDED_FOR=ip,
+                    ).status_code
+                except Exception:
+                    code = 500
+            connections.close_all()
+            return time.perf_counter() - started, code
+
+        with ThreadPoolExecutor(max_workers=thread_count) as pool:
+            futures = [pool.submit(post, item) for item in self.requests]
+            threads = threading.active_count()
+            results = [future.result() for future in futures]
+        return results, time.perf_counter() - started, tracker.peak, max(threads, tracker.threads)
+
+    def run_async(self, gps, thread_count):
+        """Ứng dụng ASGI trong tiến trình, mọi request được gửi cùng lúc trên một event loop"""
+        return asyncio.run(self._run_async(json.dumps(self.payload(gps)).encode()))
+
+    async def _run_async(self, body):
+        tracker = _InFlight()
+        started = time.perf_counter()
+
+        async def post(item):
+            token, ip = item
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST',
+                'scheme': 'http', 'path': ASYNC_PATH, 'raw_path': ASYNC_PATH.encode(), 'query_string': b'',
+                'root_path': '', 'client': ('127.0.0.1', 10000), 'server': ('testserver', 80),
+                'headers': [
+                    (b'host', b'testserver'), (b'content-type', b'application/json'),
+                    (b'content-length', str(len(body)).encode()),
+                    (b'authorization', f'Bearer {token}'.encode()), (b'x-forwarded-for', ip.encode()),
+                ],
+            }
+            messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+            code = []
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                await asyncio.Event().wait()
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    code.append(message['status'])
+
+            with tracker:
+                try:
+                    await application(scope, receive, send)
+                except Exception:
+                    code.append(500)
+                return time.perf_counter() - started, code[0] if code else 500
+
+        results = await asyncio.gather(*(post(item) for item in self.requests))
+        elapsed = time.perf_counter() - started
+        await asyncio.to_thread(connections.close_all)
+        return results, elapsed, tracker.peak, tracker.threads
+
+
+class _InFlight:
+    """Đếm số request đang xử lý cùng lúc (giá trị lớn nhất) và số thread của tiến trình lúc đó"""
+
+    def __init__(self):
+        self.current = self.peak = self.threads = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        with self._lock:
+            self.current += 1
+            if self.current > self.peak:
+                self.peak = self.current
+        return self
+
+    def __exit__(self, *exc):
+        with self._lock:
+            self.current -= 1
+            self.threads = max(self.threads, threading.active_count())
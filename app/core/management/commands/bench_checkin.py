@@ -0,0 +1,97 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from attendance.views import AttendanceViewSet
+from core.benchmarks import benchmark_database, percentile, seed_school
+from core.cache import stats as cache_stats
+from core.checkin import get_checkin_buffer, invalidate_schedule_snapshots
+from core.models import Attendance, Schedule, Student
+
+
+class Command(BaseCommand):
+    help = (
+        "Mô phỏng đợt cao điểm điểm danh QR (nhiều sinh viên quét cùng một mã) và báo cáo "
+        "độ trễ p50/p99 cùng số lượt điểm danh mỗi giây, có và không có bộ đệm ghi hàng loạt."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=200, help="Số sinh viên quét mã (mặc định 200)")
+        parser.add_argument('--threads', type=int, default=1, help="Số luồng gửi request đồng thời (mặc định 1)")
+        parser.add_argument('--batch-size', type=int, default=200, help="Kích thước bộ đệm ghi hàng loạt")
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            seeded = seed_school(classes=1, students_per_class=options['students'], schedules_per_class=1, days=1)
+            schedule = seeded['schedules'][0]
+            # Đặt buổi học đang diễn ra để mọi lượt quét đều hợp lệ
+            now = timezone.now()
+            Schedule.objects.filter(pk=schedule.pk).update(
+                start_time=now - timedelta(minutes=1),
+                end_time=now + timedelta(hours=1),
+            )
+            invalidate_schedule_snapshots([schedule.pk])
+            students = list(Student.objects.filter(student_classes=schedule.class_name).select_related('user'))
+
+            modes = [
+                ('ghi từng bản ghi', {'ENABLED': False}),
+                ('bộ đệm hàng loạt', {'ENABLED': True, 'MAX_SIZE': options['batch_size'], 'MAX_DELAY': 5}),
+            ]
+            for label, buffer_config in modes:
+                Attendance.objects.filter(schedule=schedule).delete()
+                with override_settings(ATTENDANCE_CHECKIN_BUFFER=buffer_config):
+                    self.run_burst(label, schedule, students, options['threads'])
+
+    def run_burst(self, label, schedule, students, threads):
+        factory = APIRequestFactory()
+        view = AttendanceViewSet.as_view({'post': 'qr_attendance'})
+        payload = {
+            'qr_data': Schedule.objects.values_list('qr_code_data', flat=True).get(pk=schedule.pk),
+            'latitude': schedule.room.latitude,
+            'longitude': schedule.room.longitude,
+            'device_info': 'bench',
+        }
+
+        def check_in(student):
+            request = factory.post('/api/attendance/qr-attendance/', payload, format='json')
+            force_authenticate(request, user=student.user)
+            start = time.perf_counter()
+            response = view(request)
+            elapsed = time.perf_counter() - start
+            if threads > 1:
+                connections.close_all()
+            return elapsed, response.status_code
+
+        cache_stats.reset()
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            if threads > 1:
+                with ThreadPoolExecutor(max_workers=threads) as pool:
+                    results = list(pool.map(check_in, students))
+            else:
+                results = [check_in(student) for student in students]
+            buffer = get_checkin_buffer()
+            if buffer is not None:
+                buffer.flush()
+            total = time.perf_counter() - started
+
+        latencies = [elapsed for elapsed, _ in results]
+        failures = sum(1 for _, code in results if code != 200)
+        stored = Attendance.objects.filter(schedule=schedule, is_present=True).count()
+        self.stdout.write(
+            f"{label:<18} p50 {percentile(latencies, 50) * 1000:7.2f} ms  "
+            f"p99 {percentile(latencies, 99) * 1000:7.2f} ms  "
+            f"{len(results) / total:8.1f} lượt/s  "
+            f"{len(ctx.captured_queries) / len(results):5.1f} truy vấn/lượt  "
+            f"lỗi {failures}  đã ghi {stored}"
+        )
+        for name, values in sorted(cache_stats.local().items()):
+            self.stdout.write(
+                f"{'':<18} cache {name:<10} {values['hits']:>6} trúng  {values['misses']:>4} trượt"
+            )
@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmarks import benchmark_database, create_students, create_teacher, measure
+from core.models import Class
+from core.serializers import ClassListSerializer
+from core.views import annotate_member_counts
+
+
+class Command(BaseCommand):
+    help = (
+        "So sánh liệt kê lớp học với số sinh viên / giáo viên đếm từng lớp (2 COUNT mỗi lớp) "
+        "và đếm bằng subquery trong một truy vấn."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--classes', type=int, default=1000, help="Số lớp (mặc định 1000)")
+        parser.add_argument('--students', type=int, default=40, help="Sĩ số mỗi lớp (mặc định 40)")
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            self.seed(options['classes'], options['students'])
+
+            results = {}
+            for label, func in (
+                ('đếm từng lớp', self.list_per_row),
+                ('annotate', self.list_annotated),
+            ):
+                data, queries, elapsed = measure(func)
+                results[label] = data
+                self.stdout.write(
+                    f"{label:<14} {len(data):>6} lớp  {queries:>6} truy vấn  {elapsed * 1000:>9.1f} ms"
+                )
+
+        if results['đếm từng lớp'] != results['annotate']:
+            raise CommandError("Kết quả hai cách đếm không khớp.")
+
+    def seed(self, count, students_per_class):
+        # Sinh viên và giáo viên dùng chung giữa các lớp để dữ liệu mẫu không quá lớn
+        students = create_students(max(students_per_class * 5, 1))
+        teachers = [create_teacher() for _ in range(10)]
+        classes = Class.objects.bulk_create([Class(class_name=f"Lớp {i}") for i in range(count)])
+
+        StudentLink = Class.students.through
+        TeacherLink = Class.teachers.through
+        StudentLink.objects.bulk_create([
+            StudentLink(class_id=class_obj.id, student_id=students[(i + k) % len(students)].id)
+            for i, class_obj in enumerate(classes)
+            # Sĩ số thay đổi theo lớp để phép so sánh có ý nghĩa
+            for k in range(students_per_class - i % 5)
+        ], batch_size=1000)
+        TeacherLink.objects.bulk_create([
+            TeacherLink(class_id=class_obj.id, teacher_id=teachers[(i + k) % len(teachers)].id)
+            for i, class_obj in enumerate(classes)
+            for k in range(1 + i % 2)
+        ], batch_size=1000)
+
+    def list_per_row(self):
+        """Đường cũ: mỗi lớp chạy obj.students.count() và obj.teachers.count()"""
+        return [
+            {
+                'id': class_obj.id,
+                'class_code': class_obj.class_code,
+                'class_name': class_obj.class_name,
+                'students_count': class_obj.students.count(),
+                'teachers_count': class_obj.teachers.count(),
+            }
+            for class_obj in Class.objects.order_by('pk')
+        ]
+
+    def list_annotated(self):
+        classes = annotate_member_counts(Class.objects.order_by('pk'))
+        return [dict(row) for row in ClassListSerializer(classes, many=True).data]
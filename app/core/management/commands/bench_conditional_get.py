@@ -0,0 +1,86 @@
+from unittest import mock
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core import tasks
+from core.benchmarks import benchmark_database, create_students, create_teacher, measure, seed_school
+from core.models import Classroom
+
+# (đường dẫn, vai trò gọi API)
+ENDPOINTS = [
+    ('/api/core/schedules/student_schedule/', 'student'),
+    ('/api/core/schedules/student_schedule/?period=week', 'student'),
+    ('/api/core/schedules/teacher_schedule/', 'teacher'),
+    ('/api/core/classrooms/', 'student'),
+    ('/api/core/teachers/', 'student'),
+    ('/api/user-info/', 'teacher'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "So sánh lượt gọi đầy đủ (200) với lượt hỏi lại bằng If-None-Match (304) của các API thời khoá biểu, "
+        "phòng học, giáo viên và thông tin người dùng; kiểm tra ETag đổi sau khi dữ liệu thay đổi."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--classes', type=int, default=4)
+        parser.add_argument('--schedules', type=int, default=6, help="Số lịch học mỗi lớp (mặc định 6)")
+        parser.add_argument('--repeat', type=int, default=50, help="Số lượt gọi để lấy thời gian trung bình")
+
+    def handle(self, *args, **options):
+        with benchmark_database(), mock.patch.object(tasks.render_schedule_qr_code, 'delay'):
+            teacher = create_teacher()
+            student = create_students(1)[0]
+            seeded = seed_school(
+                classes=options['classes'], students_per_class=20, schedules_per_class=options['schedules'],
+                days=1, teacher=teacher, student=student,
+            )
+            clients = {'teacher': self.client_for(teacher.user), 'student': self.client_for(student.user)}
+            repeat = options['repeat']
+
+            problems = []
+            etags = {}
+            for path, role in ENDPOINTS:
+                client = clients[role]
+                full, full_queries, full_time = self.timed(client, path, repeat)
+                etag = full['ETag']
+                etags[path] = etag
+                cached, cached_queries, cached_time = self.timed(client, path, repeat, HTTP_IF_NONE_MATCH=etag)
+                if full.status_code != 200 or cached.status_code != 304:
+                    problems.append(f"{path}: {full.status_code} / {cached.status_code}")
+                self.stdout.write(
+                    f"{path:<48} 200: {full_queries:>3} truy vấn {full_time * 1000:7.2f} ms   "
+                    f"304: {cached_queries:>3} truy vấn {cached_time * 1000:7.2f} ms   "
+                    f"({full_time / cached_time:.1f}x)   {full['Cache-Control']}"
+                )
+
+            # Sửa phòng học: thời khoá biểu và danh sách phòng học phải có ETag mới, danh sách giáo viên thì không
+            room = seeded['schedules'][0].room
+            Classroom.objects.filter(pk=room.pk).get().save()
+            expect_changed = {
+                '/api/core/schedules/student_schedule/': True,
+                '/api/core/classrooms/': True,
+                '/api/core/teachers/': False,
+            }
+            for path, changed in expect_changed.items():
+                role = dict(ENDPOINTS)[path]
+                response = clients[role].get(path, HTTP_IF_NONE_MATCH=etags[path])
+                if (response.status_code == 200) != changed:
+                    problems.append(f"{path}: {response.status_code} sau khi sửa phòng học")
+
+        if problems:
+            raise CommandError("Kết quả không đúng:\n  " + "\n  ".join(problems))
+        self.stdout.write(self.style.SUCCESS("304 không chạy truy vấn chính; ETag đổi đúng khi dữ liệu thay đổi."))
+
+    def timed(self, client, path, repeat, **headers):
+        """(response, số truy vấn, thời gian trung bình một lượt)"""
+        response, queries, _ = measure(client.get, path, **headers)
+        _, _, elapsed = measure(lambda: [client.get(path, **headers) for _ in range(repeat)])
+        return response, queries, elapsed / repeat
+
+    def client_for(self, user):
+        token = RefreshToken.for_user(user).access_token
+        return Client(HTTP_AUTHORIZATION=f"Bearer {token}")
@@ -0,0 +1,132 @@
+import importlib.util
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from attendance.views import AttendanceViewSet
+from core import tasks
+from core.benchmarks import benchmark_database, percentile, seed_school
+from core.checkin import invalidate_schedule_snapshots
+from core.models import Attendance, Schedule, Student
+
+
+class Command(BaseCommand):
+    help = (
+        "So sánh thông lượng điểm danh QR khi nhiều luồng ghi đồng thời với các cấu hình CSDL: "
+        "SQLite (journal mặc định / BEGIN IMMEDIATE / WAL) hoặc PostgreSQL (kết nối mỗi request / "
+        "kết nối lâu dài / pool), tùy theo DATABASES đang dùng (DB_ENGINE)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=400, help="Số lượt điểm danh mỗi cấu hình (mặc định 400)")
+        parser.add_argument('--threads', type=int, default=8, help="Số luồng ghi đồng thời (mặc định 8)")
+
+    def modes(self):
+        """(tên, OPTIONS của kết nối, giữ kết nối giữa các request, bật WAL)"""
+        options = dict(connection.settings_dict['OPTIONS'])
+        if connection.vendor == 'sqlite':
+            return [
+                ('SQLite mặc định', {}, True, False),
+                ('SQLite IMMEDIATE', options, True, False),
+                ('SQLite IMMEDIATE+WAL', options, True, True),
+            ]
+        modes = [
+            ('PostgreSQL mỗi request', options, False, False),
+            ('PostgreSQL lâu dài', options, True, False),
+        ]
+        if importlib.util.find_spec('psycopg_pool') and importlib.util.find_spec('psycopg'):
+            modes.append(('PostgreSQL pool', {**options, 'pool': True}, False, False))
+        return modes
+
+    def handle(self, *args, **options):
+        with benchmark_database(sqlite_file=True), mock.patch.object(tasks.render_schedule_qr_code, 'delay'):
+            seeded = seed_school(classes=1, students_per_class=options['students'], schedules_per_class=1, days=1)
+            schedule = seeded['schedules'][0]
+            now = timezone.now()
+            Schedule.objects.filter(pk=schedule.pk).update(
+                start_time=now - timedelta(minutes=1),
+                end_time=now + timedelta(hours=1),
+            )
+            students = list(Student.objects.filter(student_classes=schedule.class_name).select_related('user'))
+            qr_data = Schedule.objects.values_list('qr_code_data', flat=True).get(pk=schedule.pk)
+
+            if connection.vendor == 'sqlite':
+                self.stdout.write(
+                    "Đang dùng SQLite: chạy lại với DB_ENGINE=postgresql (và DB_NAME, DB_USER, ...) "
+                    "để so sánh các chế độ kết nối PostgreSQL."
+                )
+            settings_options = connection.settings_dict['OPTIONS']
+            saved_options = dict(settings_options)
+            try:
+                for label, db_options, persistent, wal in self.modes():
+                    Attendance.objects.filter(schedule=schedule).delete()
+                    invalidate_schedule_snapshots([schedule.pk])
+                    cache.clear()
+                    # Các luồng dùng chung settings_dict của kết nối nên chỉ cần đổi OPTIONS tại đây
+                    connections.close_all()
+                    settings_options.clear()
+                    settings_options.update(db_options)
+                    with override_settings(SQLITE_WAL=wal):
+                        if connection.vendor == 'sqlite':
+                            with connection.cursor() as cursor:
+                                cursor.execute(f"PRAGMA journal_mode={'WAL' if wal else 'DELETE'}")
+                        self.run_burst(label, schedule, students, qr_data, options['threads'], persistent)
+                    if 'pool' in db_options:
+                        connection.close_pool()
+            finally:
+                connections.close_all()
+                settings_options.clear()
+                settings_options.update(saved_options)
+
+    def run_burst(self, label, schedule, students, qr_data, threads, persistent):
+        factory = APIRequestFactory()
+        view = AttendanceViewSet.as_view({'post': 'qr_attendance'})
+        payload = {
+            'qr_data': qr_data,
+            'latitude': schedule.room.latitude,
+            'longitude': schedule.room.longitude,
+        }
+        latencies, errors = [], []
+        lock = threading.Lock()
+
+        def worker(chunk):
+            for student in chunk:
+                request = factory.post('/api/attendance/qr-attendance/', payload, format='json')
+                force_authenticate(request, user=student.user)
+                start = time.perf_counter()
+                try:
+                    code = view(request).status_code
+                except Exception as e:
+                    code = type(e).__name__
+                elapsed = time.perf_counter() - start
+                if not persistent:
+                    # Như CONN_MAX_AGE=0: đóng (hoặc trả về pool) kết nối sau mỗi request
+                    connection.close()
+                with lock:
+                    latencies.append(elapsed)
+                    if code != 200:
+                        errors.append(code)
+            connections.close_all()
+
+        workers = [threading.Thread(target=worker, args=(students[i::threads],)) for i in range(threads)]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        total = time.perf_counter() - started
+
+        stored = Attendance.objects.filter(schedule=schedule, is_present=True).count()
+        self.stdout.write(
+            f"{label:<24} {len(latencies) / total:8.1f} lượt/s  "
+            f"p50 {percentile(latencies, 50) * 1000:7.2f} ms  p99 {percentile(latencies, 99) * 1000:8.2f} ms  "
+            f"lỗi {len(errors)}{f' ({sorted(set(map(str, errors)))})' if errors else ''}  đã ghi {stored}"
+        )
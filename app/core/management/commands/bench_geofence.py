@@ -0,0 +1,64 @@
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmarks import measure
+from core.geofence import Geofence, check_many
+
+# Tọa độ gần trường (Hà Nội)
+CENTER = (21.0278, 105.8019)
+
+
+class Command(BaseCommand):
+    help = (
+        "So sánh kiểm tra geofence từng điểm (Geofence.check) với kiểm tra hàng loạt (check_many) "
+        "trên các điểm ngẫu nhiên quanh các phòng học hình tròn và đa giác, và đối chiếu kết quả."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--points', type=int, default=100000, help="Số điểm kiểm tra (mặc định 100000)")
+        parser.add_argument('--rooms', type=int, default=20, help="Số phòng học (mặc định 20)")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        geofences = {}
+        for room_id in range(1, options['rooms'] + 1):
+            lat = CENTER[0] + rng.uniform(-0.01, 0.01)
+            lon = CENTER[1] + rng.uniform(-0.01, 0.01)
+            if room_id % 2:
+                geofences[room_id] = Geofence.build(room_id, f'P{room_id}', lat, lon, rng.uniform(50, 150))
+            else:
+                # Đa giác 6 đỉnh bất quy tắc quanh phòng học
+                polygon = [
+                    [lat + rng.uniform(0.0004, 0.0012) * dy, lon + rng.uniform(0.0004, 0.0012) * dx]
+                    for dy, dx in ((1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (0, -1))
+                ]
+                geofences[room_id] = Geofence.build(room_id, f'P{room_id}', lat, lon, polygon=polygon)
+
+        room_ids, latitudes, longitudes = [], [], []
+        for _ in range(options['points']):
+            fence = geofences[rng.randint(1, options['rooms'])]
+            room_ids.append(fence.id)
+            latitudes.append(fence.latitude + rng.gauss(0, 0.001))
+            longitudes.append(fence.longitude + rng.gauss(0, 0.001))
+
+        def scalar():
+            results = [geofences[room_id].check(lat, lon) for room_id, lat, lon in zip(room_ids, latitudes, longitudes)]
+            return [r.inside for r in results], [r.distance for r in results]
+
+        # Lần gọi đầu nạp NumPy, không tính vào thời gian đo
+        check_many(geofences, room_ids[:10], latitudes[:10], longitudes[:10])
+        (inside, distance), _, scalar_elapsed = measure(scalar)
+        (batch_inside, batch_distance), _, batch_elapsed = measure(check_many, geofences, room_ids, latitudes, longitudes)
+
+        points = options['points']
+        self.stdout.write(f"Từng điểm:  {scalar_elapsed * 1000:9.1f} ms  ({points / scalar_elapsed:,.0f} điểm/giây)")
+        self.stdout.write(f"Hàng loạt:  {batch_elapsed * 1000:9.1f} ms  ({points / batch_elapsed:,.0f} điểm/giây)")
+        self.stdout.write(f"Nhanh hơn {scalar_elapsed / batch_elapsed:.1f} lần, {sum(inside)} / {points} điểm trong phạm vi")
+
+        mismatched = sum(a != b for a, b in zip(inside, batch_inside))
+        worst = max(abs(a - b) for a, b in zip(distance, batch_distance))
+        if mismatched or worst > 0.01:
+            raise CommandError(f"Kết quả khác nhau: {mismatched} điểm, sai lệch khoảng cách tối đa {worst:.3f} m")
+        self.stdout.write(self.style.SUCCESS("Kết quả hai cách kiểm tra trùng khớp."))
@@ -0,0 +1,125 @@
+import asyncio
+import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import AsyncClient
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import AccessToken
+
+from attendance.views import AttendanceViewSet
+from core import tasks
+from core.benchmarks import benchmark_database, measure, percentile, seed_school
+from core.checkin import invalidate_schedule_snapshots
+from core.models import Attendance, Schedule, Student
+
+
+class Command(BaseCommand):
+    help = (
+        "Kiểm tra điểm danh QR khi client gửi trùng: chạm hai lần cùng lúc (không có Idempotency-Key) "
+        "và gửi lại với cùng Idempotency-Key; báo cáo lỗi, số bản ghi và số truy vấn của lần gửi lại. "
+        "Kiểm tra Idempotency-Key của view async /api/attendance/qr-attendance-async/."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=100, help="Số sinh viên (mặc định 100)")
+        parser.add_argument('--threads', type=int, default=8, help="Số luồng gửi đồng thời (mặc định 8)")
+
+    def handle(self, *args, **options):
+        # CSDL SQLite dạng file: các luồng ghi chờ khóa theo timeout của kết nối thay vì lỗi "table is locked"
+        # như CSDL trong bộ nhớ dùng shared cache
+        with benchmark_database(sqlite_file=True), mock.patch.object(tasks.render_schedule_qr_code, 'delay'):
+            schedule = seed_school(classes=1, students_per_class=options['students'], schedules_per_class=1, days=1)['schedules'][0]
+            now = timezone.now()
+            Schedule.objects.filter(pk=schedule.pk).update(
+                start_time=now - timedelta(minutes=1),
+                end_time=now + timedelta(hours=1),
+            )
+            invalidate_schedule_snapshots([schedule.pk])
+            Attendance.objects.filter(schedule=schedule).delete()
+            students = list(Student.objects.filter(student_classes=schedule.class_name).select_related('user'))
+            qr_data = Schedule.objects.values_list('qr_code_data', flat=True).get(pk=schedule.pk)
+
+            factory = APIRequestFactory()
+            view = AttendanceViewSet.as_view({'post': 'qr_attendance'})
+
+            def post(student, key=None):
+                headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+                start = time.perf_counter()
+                request = factory.post(
+                    '/api/attendance/qr-attendance/',
+                    {'qr_data': qr_data, 'latitude': schedule.room.latitude, 'longitude': schedule.room.longitude},
+                    format='json', **headers,
+                )
+                force_authenticate(request, user=student.user)
+                try:
+                    code = view(request).status_code
+                except Exception:
+                    code = 500
+                finally:
+                    connections.close_all()
+                return time.perf_counter() - start, code
+
+            # Chạm hai lần cùng lúc: mỗi sinh viên gửi hai request song song
+            with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+                results = list(pool.map(post, [s for s in students for _ in range(2)]))
+            failures = sum(1 for _, code in results if code != 200)
+            stored = Attendance.objects.filter(schedule=schedule, is_present=True).count()
+            self.stdout.write(
+                f"Chạm hai lần cùng lúc: {len(results)} request  lỗi {failures}  "
+                f"{stored} bản ghi cho {len(students)} sinh viên"
+            )
+            if failures or stored != len(students):
+                raise CommandError("Điểm danh trùng gây lỗi hoặc tạo sai số bản ghi.")
+
+            # Gửi lại với cùng Idempotency-Key
+            keys = {student.pk: uuid.uuid4().hex for student in students}
+            first, first_queries, _ = measure(lambda: [post(s, keys[s.pk]) for s in students])
+            replay, replay_queries, _ = measure(lambda: [post(s, keys[s.pk]) for s in students])
+            for label, results, queries in (('Lần đầu', first, first_queries), ('Gửi lại', replay, replay_queries)):
+                latencies = [latency for latency, _ in results]
+                self.stdout.write(
+                    f"{label:<8} p50 {percentile(latencies, 50) * 1000:6.2f} ms  "
+                    f"p99 {percentile(latencies, 99) * 1000:6.2f} ms  "
+                    f"{queries / len(results):5.2f} truy vấn/request  "
+                    f"lỗi {sum(1 for _, code in results if code != 200)}"
+                )
+
+            self.check_async(schedule, students[:10], qr_data)
+        self.stdout.write(self.style.SUCCESS("Idempotency-Key được áp dụng cho cả view đồng bộ và view async."))
+
+    def check_async(self, schedule, students, qr_data):
+        """Gửi lại cùng Idempotency-Key tới view async: phản hồi đã lưu, không ghi lại; khóa dùng lại cho nội dung khác: 422"""
+        Attendance.objects.filter(schedule=schedule, student__in=students).delete()
+        path = '/api/attendance/qr-attendance-async/'
+        body = json.dumps({'qr_data': qr_data, 'latitude': schedule.room.latitude, 'longitude': schedule.room.longitude})
+
+        async def run(student):
+            client = AsyncClient()
+            headers = {'Authorization': f'Bearer {AccessToken.for_user(student.user)}', 'Idempotency-Key': uuid.uuid4().hex}
+            first = await client.post(path, body, content_type='application/json', headers=headers)
+            replay = await client.post(path, body, content_type='application/json', headers=headers)
+            other = await client.post(path, json.dumps({'qr_data': qr_data}), content_type='application/json', headers=headers)
+            return first, replay, other
+
+        async def run_all():
+            return await asyncio.gather(*[run(student) for student in students])
+
+        problems = []
+        for first, replay, other in asyncio.run(run_all()):
+            if first.status_code != 200 or replay.status_code != 200 or replay.content != first.content:
+                problems.append(f"gửi lại: {first.status_code} / {replay.status_code}")
+            elif replay.get('Idempotent-Replayed') != 'true':
+                problems.append("phản hồi gửi lại thiếu Idempotent-Replayed")
+            if other.status_code != 422:
+                problems.append(f"dùng lại khóa cho nội dung khác: {other.status_code}")
+        stored = Attendance.objects.filter(schedule=schedule, student__in=students).count()
+        self.stdout.write(f"View async: {len(students)} sinh viên gửi lại cùng Idempotency-Key  {stored} bản ghi  lỗi {len(problems)}")
+        if problems or stored != len(students):
+            raise CommandError("Idempotency-Key của view async không đúng:\n  " + "\n  ".join(problems[:10]))
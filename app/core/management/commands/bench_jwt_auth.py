@@ -0,0 +1,119 @@
+import json
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core import tasks
+from core.benchmarks import benchmark_database, create_students, create_teacher, measure, seed_school
+from core.models import Teacher
+from core.roles import STUDENT, TEACHER, user_snapshots
+
+PASSWORD = 'bench-password'
+
+# (đường dẫn, vai trò gọi API)
+ENDPOINTS = [
+    ('/api/user-info/', 'student'),
+    ('/api/core/schedules/student_schedule/', 'student'),
+    ('/api/core/schedules/teacher_schedule/', 'teacher'),
+    ('/api/attendance/', 'student'),
+    ('/api/core/classrooms/', 'teacher'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Đăng nhập qua /auth/jwt/create/, so sánh số truy vấn và thời gian của các API khi ảnh chụp user "
+        "chưa có / đã có trong cache; kiểm tra claim vai trò, việc xoá ảnh chụp khi User thay đổi "
+        "và việc nạp lại khi ảnh chụp khác vai trò trong token."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50, help="Số lượt gọi để lấy thời gian trung bình")
+
+    def handle(self, *args, **options):
+        with benchmark_database(), mock.patch.object(tasks.render_schedule_qr_code, 'delay'):
+            teacher = create_teacher()
+            student = create_students(1)[0]
+            seed_school(classes=2, students_per_class=20, schedules_per_class=4, days=1,
+                        teacher=teacher, student=student)
+            users = {'student': student.user, 'teacher': teacher.user}
+            for user in users.values():
+                user.set_password(PASSWORD)
+                user.save()
+
+            problems = []
+            tokens = {role: self.login(user) for role, user in users.items()}
+            claims = {role: AccessToken(token['access']) for role, token in tokens.items()}
+            if claims['student']['role'] != STUDENT or claims['student']['student_id'] != student.pk:
+                problems.append(f"claim của sinh viên: {claims['student'].payload}")
+            if claims['teacher']['role'] != TEACHER or claims['teacher']['teacher_id'] != teacher.pk:
+                problems.append(f"claim của giáo viên: {claims['teacher'].payload}")
+            clients = {
+                role: Client(HTTP_AUTHORIZATION=f"Bearer {token['access']}") for role, token in tokens.items()
+            }
+
+            repeat = options['repeat']
+            for path, role in ENDPOINTS:
+                client, user = clients[role], users[role]
+
+                def cold():
+                    # Chỉ xoá ảnh chụp user, các cache khác vẫn giữ như khi chạy thật
+                    user_snapshots.invalidate([user.pk])
+                    return client.get(path)
+
+                client.get(path)
+                cold_response, cold_queries, _ = measure(cold)
+                warm_response, warm_queries, _ = measure(client.get, path)
+                _, _, cold_time = measure(lambda: [cold() for _ in range(repeat)])
+                _, _, warm_time = measure(lambda: [client.get(path) for _ in range(repeat)])
+                self.stdout.write(
+                    f"{path:<42} {role:<8} chưa có ảnh chụp: {cold_queries:>3} truy vấn "
+                    f"{cold_time / repeat * 1000:7.2f} ms   đã có: {warm_queries:>3} truy vấn "
+                    f"{warm_time / repeat * 1000:7.2f} ms"
+                )
+                if cold_response.status_code != 200 or warm_response.status_code != 200:
+                    problems.append(f"{path}: {cold_response.status_code} / {warm_response.status_code}")
+                elif warm_queries > cold_queries - 1:
+                    problems.append(f"{path}: {cold_queries} -> {warm_queries} truy vấn")
+
+            # Sửa User: ảnh chụp bị xoá, lượt gọi tiếp theo thấy dữ liệu mới
+            student.user.name = 'Tên mới'
+            student.user.save()
+            name = clients['student'].get('/api/user-info/').json().get('name')
+            if name != 'Tên mới':
+                problems.append(f"/api/user-info/ trả về tên cũ sau khi sửa User: {name}")
+
+            # Ảnh chụp cũ (vd. tiến trình khác không nhận được việc xoá) khác claim vai trò: nạp lại từ CSDL
+            stale = user_snapshots.get(teacher.user.pk)
+            stale._state.fields_cache['teacher'] = None
+            cache.set(user_snapshots.key(teacher.user.pk), stale)
+            response, queries, _ = measure(clients['teacher'].get, '/api/core/schedules/teacher_schedule/')
+            reloaded = user_snapshots.get(teacher.user.pk)
+            self.stdout.write(f"ảnh chụp khác claim vai trò: {response.status_code}, {queries} truy vấn")
+            if response.status_code != 200 or reloaded.teacher is None:
+                problems.append("ảnh chụp cũ không được nạp lại khi khác claim vai trò")
+
+            # Vai trò đổi sau khi đăng nhập: token làm mới mang vai trò hiện tại
+            Teacher.objects.create(user=student.user)
+            refreshed = self.post('/auth/jwt/refresh/', {'refresh': tokens['student']['refresh']})
+            access = AccessToken(refreshed['access'])
+            if access['teacher_id'] is None or access['student_id'] != student.pk:
+                problems.append(f"token làm mới không mang vai trò hiện tại: {access.payload}")
+
+        if problems:
+            raise CommandError("Kết quả không đúng:\n  " + "\n  ".join(problems))
+        self.stdout.write(self.style.SUCCESS(
+            "Xác thực JWT không truy vấn khi ảnh chụp user có trong cache; claim vai trò và việc xoá ảnh chụp đúng."
+        ))
+
+    def login(self, user):
+        return self.post('/auth/jwt/create/', {'email': user.email, 'password': PASSWORD})
+
+    def post(self, path, data):
+        response = Client().post(path, json.dumps(data), content_type='application/json')
+        if response.status_code != 200:
+            raise CommandError(f"{path}: {response.status_code} {response.content[:200]}")
+        return response.json()
@@ -0,0 +1,121 @@
+from datetime import timedelta
+
+import qrcode
+from django.core.management.base import BaseCommand, CommandError
+from django.core.cache import cache
+from django.test import Client, override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core.benchmarks import benchmark_database, create_students, measure, seed_school
+from core.checkin import get_schedule_snapshot
+from core.qr_payload import InvalidQRPayload, parse_qr_data
+
+# Các API điểm danh QR phải trả về 400 cho mã dạng cũ khi không bật thời gian chuyển đổi
+CHECKIN_PATHS = ('/api/attendance/qr-attendance/', '/api/qr/schedules/attendance/')
+
+
+def qr_version(data):
+    """Phiên bản (kích thước) nhỏ nhất của mã QR chứa được `data`, như core/qr_images.py vẽ"""
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_L)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr.version
+
+
+class Command(BaseCommand):
+    help = (
+        "So sánh dữ liệu QR dạng cũ (str(dict)) với dạng mới đã ký (core/qr_payload.py): "
+        "độ dài, phiên bản mã QR và thời gian từ chối một mã giả mạo; kiểm tra mã dạng cũ bị từ chối "
+        "(400) trừ khi bật QR_ACCEPT_LEGACY_PAYLOAD và chưa quá QR_LEGACY_PAYLOAD_UNTIL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--checks', type=int, default=2000, help="Số mã giả mạo cần từ chối (mặc định 2000)")
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            schedule = seed_school(classes=1, students_per_class=1, schedules_per_class=1, days=1)['schedules'][0]
+            schedule.refresh_from_db()
+            token = schedule.qr_code_data
+            legacy = str({
+                'schedule_id': schedule.id,
+                'course_name': schedule.course_name.object_name,
+                'teacher': schedule.teacher.user.name,
+                'class_name': schedule.class_name.class_name,
+                'room': schedule.room.classroom_code,
+                'lesson_start': schedule.lesson_start,
+                'lesson_count': schedule.lesson_count,
+                'start_time': schedule.start_time.isoformat(),
+                'end_time': schedule.end_time.isoformat(),
+            })
+            for label, data in (('dạng cũ', legacy), ('đã ký', token)):
+                self.stdout.write(f"{label:<8} {len(data):4} ký tự  QR phiên bản {qr_version(data)}")
+
+            if parse_qr_data(token).schedule_id != schedule.id:
+                raise CommandError("Không giải mã được mã QR của lịch học.")
+
+            # Mã giả mạo: lịch học không tồn tại ở dạng cũ, chữ ký sai ở dạng mới
+            forged_legacy = str({'schedule_id': schedule.id + 10 ** 6})
+            forged_token = token[:-4] + ('AAAA' if token[-4:] != 'AAAA' else 'BBBB')
+            checks = options['checks']
+
+            def reject_legacy():
+                rejected = 0
+                for _ in range(checks):
+                    cache.clear()
+                    rejected += get_schedule_snapshot(parse_qr_data(forged_legacy).schedule_id) is None
+                return rejected
+
+            def reject_token():
+                rejected = 0
+                for _ in range(checks):
+                    try:
+                        parse_qr_data(forged_token)
+                    except InvalidQRPayload:
+                        rejected += 1
+                return rejected
+
+            # Mã dạng cũ chỉ được giải mã trong thời gian chuyển đổi
+            transition = override_settings(
+                QR_ACCEPT_LEGACY_PAYLOAD=True, QR_LEGACY_PAYLOAD_UNTIL=timezone.localdate() + timedelta(days=30),
+            )
+            for label, func in (('dạng cũ', transition(reject_legacy)), ('đã ký', reject_token)):
+                rejected, queries, elapsed = measure(func)
+                if rejected != checks:
+                    raise CommandError(f"{label}: chỉ từ chối {rejected} / {checks} mã giả mạo.")
+                self.stdout.write(
+                    f"Từ chối mã giả mạo ({label}): {queries / checks:.1f} truy vấn/lần  "
+                    f"{elapsed / checks * 1e6:8.1f} µs/lần"
+                )
+
+            self.check_legacy_rejected(legacy, forged_legacy)
+        self.stdout.write(self.style.SUCCESS("Mã dạng cũ bị từ chối ngoài thời gian chuyển đổi."))
+
+    def check_legacy_rejected(self, legacy, forged_legacy):
+        student = create_students(1)[0]
+        client = Client(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(student.user).access_token}")
+        body = {'qr_data': forged_legacy, 'latitude': 21.0, 'longitude': 105.8}
+        for path in CHECKIN_PATHS:
+            response = client.post(path, body, content_type='application/json')
+            self.stdout.write(f"Mã dạng cũ tự viết gửi tới {path}: {response.status_code}")
+            if response.status_code != 400:
+                raise CommandError(f"{path} không từ chối mã dạng cũ tự viết: {response.status_code}")
+
+        today = timezone.localdate()
+        cases = (
+            ('mặc định', {}, False),
+            ('bật, không có ngày hết hạn', {'QR_ACCEPT_LEGACY_PAYLOAD': True, 'QR_LEGACY_PAYLOAD_UNTIL': None}, False),
+            ('bật, đã quá hạn', {'QR_ACCEPT_LEGACY_PAYLOAD': True,
+                                 'QR_LEGACY_PAYLOAD_UNTIL': today - timedelta(days=1)}, False),
+            ('bật, còn hạn', {'QR_ACCEPT_LEGACY_PAYLOAD': True, 'QR_LEGACY_PAYLOAD_UNTIL': today}, True),
+        )
+        for label, overrides, accepted in cases:
+            with override_settings(**overrides):
+                try:
+                    parse_qr_data(legacy)
+                    result = True
+                except InvalidQRPayload:
+                    result = False
+            if result != accepted:
+                raise CommandError(f"Mã dạng cũ ({label}): {'được chấp nhận' if result else 'bị từ chối'}")
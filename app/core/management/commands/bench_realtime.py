@@ -0,0 +1,149 @@
+import asyncio
+import json
+import queue
+import threading
+import time
+from unittest import mock
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from app.asgi import application
+from core import realtime, tasks
+from core.benchmarks import benchmark_database, percentile, seed_school
+from core.checkin import check_in
+from core.models import Attendance, Student
+
+
+class StandInBroker:
+    """
+    Broker thay thế Redis khi đo: sự kiện được tuần tự hoá thành JSON và chuyển qua một thread nghe riêng
+    trước khi vào Hub, giống đường đi của RedisBroker.
+    """
+
+    def __init__(self, hub):
+        self.hub = hub
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._listen, name='standin-broker', daemon=True)
+        self._thread.start()
+
+    def publish(self, channel, message):
+        self._queue.put((channel, json.dumps(message)))
+
+    def _listen(self):
+        while True:
+            channel, data = self._queue.get()
+            if channel is None:
+                return
+            self.hub.dispatch(channel, json.loads(data))
+
+    def stop(self):
+        self._queue.put((None, None))
+        self._thread.join()
+
+
+class Command(BaseCommand):
+    help = (
+        "Mở nhiều kết nối SSE tới luồng sự kiện điểm danh qua ứng dụng ASGI (trong tiến trình, một event loop), "
+        "ghi các lượt điểm danh QR và đo độ trễ tới khi mọi kết nối nhận được sự kiện."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, default=2000, help="Số kết nối theo dõi (mặc định 2000)")
+        parser.add_argument('--checkins', type=int, default=50, help="Số lượt điểm danh được ghi (mặc định 50)")
+
+    def handle(self, *args, **options):
+        with benchmark_database(sqlite_file=True), mock.patch.object(tasks.render_schedule_qr_code, 'delay'):
+            seeded = seed_school(classes=1, students_per_class=options['checkins'], schedules_per_class=1, days=1)
+            schedule = seeded['schedules'][0]
+            Attendance.objects.filter(schedule=schedule).delete()
+            students = list(Student.objects.filter(student_classes=schedule.class_name))[:options['checkins']]
+            token = str(RefreshToken.for_user(seeded['teacher'].user).access_token)
+
+            broker = StandInBroker(realtime.hub)
+            try:
+                with mock.patch.object(realtime, '_broker', broker):
+                    result = asyncio.run(self.run(schedule, students, token, options['subscribers']))
+            finally:
+                broker.stop()
+                connections.close_all()
+
+        latencies, threads, missing, dropped, left = result
+        self.stdout.write(
+            f"{options['subscribers']} kết nối, {len(students)} sự kiện, {len(latencies)} lượt nhận\n"
+            f"độ trễ tới khi nhận: p50 {percentile(latencies, 50) * 1000:.2f} ms  "
+            f"p99 {percentile(latencies, 99) * 1000:.2f} ms  max {max(latencies) * 1000:.2f} ms\n"
+            f"số thread của tiến trình khi đang giữ các kết nối: {threads}"
+        )
+        if missing or dropped or left:
+            raise CommandError(f"thiếu {missing} lượt nhận, bị bỏ {dropped}, còn {left} người theo dõi sau khi ngắt")
+        self.stdout.write(self.style.SUCCESS("Mọi kết nối nhận đủ sự kiện và được gỡ khỏi Hub khi ngắt kết nối."))
+
+    async def run(self, schedule, students, token, count):
+        path = f'/api/attendance/schedules/{schedule.pk}/events/'
+        channel = realtime.schedule_channel(schedule.pk)
+        disconnect = asyncio.Event()
+        received = []  # (id sự kiện, thời điểm nhận)
+        statuses = []
+
+        async def subscriber(index):
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+                'root_path': '', 'client': ('127.0.0.1', 10000 + index), 'server': ('testserver', 80),
+                'headers': [(b'host', b'testserver'), (b'authorization', f'Bearer {token}'.encode())],
+            }
+            requested = False
+
+            async def receive():
+                nonlocal requested
+                if not requested:
+                    requested = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses.append(message['status'])
+                elif message['type'] == 'http.response.body':
+                    now = time.perf_counter()
+                    for line in message.get('body', b'').decode().splitlines():
+                        if line.startswith('id: '):
+                            received.append((int(line[4:]), now))
+
+            await application(scope, receive, send)
+
+        workers = [asyncio.create_task(subscriber(i)) for i in range(count)]
+        while realtime.hub.subscriber_count(channel) < count:
+            if len(statuses) == count and any(code != 200 for code in statuses):
+                raise CommandError(f"Mở kết nối thất bại: {sorted(set(statuses))}")
+            await asyncio.sleep(0.05)
+        threads = threading.active_count()
+
+        def write_checkins():
+            written = {}
+            now = timezone.now()
+            for student in students:
+                started = time.perf_counter()
+                attendance, _ = check_in(Attendance(
+                    student=student, schedule=schedule, is_present=True, timestamp=now,
+                ))
+                written[attendance.id] = started
+            connections.close_all()
+            return written
+
+        published = await asyncio.to_thread(write_checkins)
+        expected = len(published) * count
+        deadline = time.perf_counter() + 30
+        while len(received) < expected and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+
+        latencies = [at - published[event_id] for event_id, at in received if event_id in published]
+        dropped = sum(subscription.dropped for subscription in realtime.hub._channels.get(channel, ()))
+        disconnect.set()
+        await asyncio.gather(*workers, return_exceptions=True)
+        await asyncio.sleep(0)
+        return latencies, threads, expected - len(latencies), dropped, realtime.hub.subscriber_count(channel)
@@ -0,0 +1,55 @@
+import pickle
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmarks import benchmark_database, create_students, measure
+from core.cache import class_rosters, is_class_member
+from core.models import Class
+from core.roster_index import RosterIndex
+
+
+class Command(BaseCommand):
+    help = (
+        "So sánh các cách kiểm tra sinh viên có thuộc lớp không: truy vấn exists() trên bảng trung gian, "
+        "nạp cả danh sách lớp, và chỉ mục RosterIndex trong cache. In kích thước chỉ mục so với frozenset."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=200, help="Sĩ số lớp (mặc định 200)")
+        parser.add_argument('--checks', type=int, default=2000, help="Số lần kiểm tra (mặc định 2000)")
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            students = create_students(options['students'] * 2)
+            class_obj = Class.objects.create(class_name='Lớp bench')
+            class_obj.students.add(*students[::2])
+            # Một nửa số lần kiểm tra là sinh viên không thuộc lớp
+            probes = [students[i % len(students)] for i in range(options['checks'])]
+            class_rosters.get(class_obj.id)
+
+            results = {}
+            for label, func in (
+                ('exists()', lambda s: class_obj.students.filter(id=s.id).exists()),
+                ('nạp cả lớp', lambda s: s in class_obj.students.all()),
+                ('RosterIndex', lambda s: is_class_member(class_obj.id, s.id)),
+            ):
+                answers, queries, elapsed = measure(lambda: [func(s) for s in probes])
+                results[label] = answers
+                self.stdout.write(
+                    f"{label:<12} {queries / len(probes):6.2f} truy vấn/lần  "
+                    f"{elapsed / len(probes) * 1e6:9.1f} µs/lần"
+                )
+            if len({tuple(answers) for answers in results.values()}) != 1:
+                raise CommandError("Các cách kiểm tra cho kết quả khác nhau.")
+
+            roster = list(class_obj.students.values_list('id', flat=True))
+
+        index = RosterIndex(roster)
+        self.stdout.write(
+            f"{len(roster)} sinh viên: RosterIndex ({'bitmap' if index.bitmap is not None else 'mảng'}) "
+            f"{len(pickle.dumps(index, pickle.HIGHEST_PROTOCOL))} byte, "
+            f"frozenset {len(pickle.dumps(frozenset(roster), pickle.HIGHEST_PROTOCOL))} byte"
+        )
+        changed = RosterIndex(roster[5:] + [max(roster) + 1])
+        _, _, elapsed = measure(index.diff, changed)
+        self.stdout.write(f"So sánh hai danh sách lớp (diff): {elapsed * 1e6:.1f} µs")
@@ -0,0 +1,106 @@
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core import qr_images, tasks
+from core.benchmarks import benchmark_database, measure, percentile, seed_school
+from core.qr.views import ScheduleQRViewSet
+from core.qr_payload import InvalidQRPayload, parse_qr_data, rotating_payload
+
+
+class Command(BaseCommand):
+    help = (
+        "Mô phỏng nhiều màn hình lớp học liên tục tải mã QR xoay vòng (GET .../rotating-qr/) và báo cáo "
+        "độ trễ, số lần vẽ ảnh và số lần ghi storage, so với vẽ lại ảnh cho mỗi lần tải; kiểm tra "
+        "QR_REQUIRE_ROTATING_TOKEN chỉ chấp nhận mã của cửa sổ xoay vòng hiện tại."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--schedules', type=int, default=20, help="Số lịch học đang chiếu mã (mặc định 20)")
+        parser.add_argument('--polls', type=int, default=2000, help="Tổng số lần tải mã (mặc định 2000)")
+        parser.add_argument('--image', choices=sorted(qr_images.QR_IMAGE_TYPES), default='svg')
+
+    def handle(self, *args, **options):
+        kind = options['image']
+        with benchmark_database(), mock.patch.object(tasks.render_schedule_qr_code, 'delay'):
+            seeded = seed_school(classes=1, students_per_class=1, schedules_per_class=options['schedules'], days=1)
+            teacher, schedules = seeded['teacher'], seeded['schedules']
+            cache.clear()
+
+            factory = APIRequestFactory()
+            view = ScheduleQRViewSet.as_view({'get': 'rotating_qr'})
+            renders = []
+            render = qr_images.RENDERERS[kind]
+
+            def counting_render(data):
+                renders.append(data)
+                return render(data)
+
+            def poll(schedule):
+                request = factory.get(f'/api/qr/schedules/{schedule.pk}/rotating-qr/', {'image': kind})
+                force_authenticate(request, user=teacher.user)
+                start = time.perf_counter()
+                response = view(request, pk=schedule.pk)
+                return time.perf_counter() - start, response.status_code
+
+            polls = [schedules[i % len(schedules)] for i in range(options['polls'])]
+            with mock.patch.dict(qr_images.RENDERERS, {kind: counting_render}), \
+                    mock.patch.object(default_storage, 'save', wraps=default_storage.save) as storage_save:
+                results, queries, elapsed = measure(lambda: [poll(schedule) for schedule in polls])
+
+            failures = sum(1 for _, code in results if code != 200)
+            latencies = [latency for latency, _ in results]
+            self.stdout.write(
+                f"Cache theo cửa sổ: p50 {percentile(latencies, 50) * 1000:6.2f} ms  "
+                f"p99 {percentile(latencies, 99) * 1000:6.2f} ms  {len(results) / elapsed:8.0f} lượt/s  "
+                f"{queries / len(results):.2f} truy vấn/lượt  {len(renders)} lần vẽ  "
+                f"{storage_save.call_count} lần ghi storage  lỗi {failures}"
+            )
+
+            _, _, render_elapsed = measure(lambda: [render(rotating_payload(s.pk)[0]) for s in polls])
+            self.stdout.write(
+                f"Vẽ mỗi lần tải:    {render_elapsed / len(polls) * 1000:6.2f} ms/lượt  "
+                f"{len(polls) / render_elapsed:8.0f} lượt/s  {len(polls)} lần vẽ"
+            )
+
+            if failures:
+                raise CommandError(f"{failures} lần tải mã QR thất bại.")
+            for token in renders:
+                if parse_qr_data(token).schedule_id not in {s.pk for s in schedules}:
+                    raise CommandError("Mã QR xoay vòng không giải mã được.")
+
+            self.check_require_rotating(schedules[0])
+        self.stdout.write(self.style.SUCCESS("QR_REQUIRE_ROTATING_TOKEN chỉ chấp nhận mã xoay vòng còn hiệu lực."))
+
+    def check_require_rotating(self, schedule):
+        schedule.refresh_from_db()
+        now = timezone.now()
+        # (mã, được chấp nhận khi bật QR_REQUIRE_ROTATING_TOKEN)
+        cases = {
+            'mã xoay vòng hiện tại': (rotating_payload(schedule.pk, now)[0], True),
+            'mã cố định của lịch học': (schedule.qr_code_data, False),
+            'mã dạng cũ': (str({'schedule_id': schedule.pk}), False),
+            'mã xoay vòng đã quá thời gian gia hạn': (rotating_payload(schedule.pk, now - timedelta(minutes=5))[0], False),
+        }
+        settings = {
+            'QR_REQUIRE_ROTATING_TOKEN': True,
+            'QR_ACCEPT_LEGACY_PAYLOAD': True,
+            'QR_LEGACY_PAYLOAD_UNTIL': timezone.localdate(now),
+        }
+        with override_settings(**settings):
+            for label, (token, expected) in cases.items():
+                try:
+                    parse_qr_data(token, now)
+                    accepted = True
+                except InvalidQRPayload:
+                    accepted = False
+                self.stdout.write(f"{label:<40} {'chấp nhận' if accepted else 'từ chối'}")
+                if accepted != expected:
+                    raise CommandError(f"QR_REQUIRE_ROTATING_TOKEN: {label} {'được chấp nhận' if accepted else 'bị từ chối'}")
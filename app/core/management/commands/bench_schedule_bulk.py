@@ -0,0 +1,117 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core import tasks
+from core.benchmarks import benchmark_database, create_students, create_teacher, measure
+from core.models import Attendance, Class, Classroom, Object, Schedule, Weekday
+from core.qr_payload import parse_qr_data
+from core.serializers import ScheduleBulkCreateSerializer
+
+WEEKDAYS = ['MON', 'WED', 'FRI']
+
+
+class Command(BaseCommand):
+    help = (
+        "So sánh tạo thời khoá biểu từng lịch học (save + Attendance.objects.create cho từng sinh viên) "
+        "với API tạo hàng loạt (bulk_create trong một transaction)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--schedules', type=int, default=300, help="Số lịch học (mặc định 300)")
+        parser.add_argument('--students', type=int, default=40, help="Sĩ số mỗi lớp (mặc định 40)")
+        parser.add_argument('--weeks', type=int, default=15, help="Số tuần của học kỳ (mặc định 15)")
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            items = self.seed(options['schedules'], options['students'], options['weeks'])
+
+            # Ảnh QR được vẽ bởi Celery worker, không tính vào thời gian tạo lịch học
+            with mock.patch.object(tasks.render_schedule_qr_code, 'delay') as render:
+                results = [
+                    ('từng lịch học', self.create_one_by_one),
+                    ('hàng loạt', self.create_bulk),
+                ]
+                for label, func in results:
+                    Schedule.objects.all().delete()
+                    render.reset_mock()
+                    _, queries, elapsed = measure(func, items)
+                    attendances = Attendance.objects.count()
+                    self.stdout.write(
+                        f"{label:<16} {len(items):>5} lịch  {attendances:>7} điểm danh  "
+                        f"{queries:>7} truy vấn  {elapsed * 1000:>9.1f} ms  "
+                        f"{len(items) / elapsed:>9.1f} lịch/s"
+                    )
+                    self.check_qr(label, render)
+
+    def check_qr(self, label, render):
+        """Mọi lịch học có dữ liệu QR đã ký của chính nó và được đưa vào hàng đợi vẽ ảnh QR"""
+        qr_data = dict(Schedule.objects.values_list('pk', 'qr_code_data'))
+        wrong = [pk for pk, data in qr_data.items() if not data or parse_qr_data(data).schedule_id != pk]
+        queued = {call.args[0] for call in render.call_args_list}
+        if wrong or queued != set(qr_data):
+            raise CommandError(
+                f"{label}: {len(wrong)} lịch học sai dữ liệu QR, "
+                f"{len(set(qr_data) - queued)} lịch học chưa được đưa vào hàng đợi vẽ ảnh QR"
+            )
+
+    def seed(self, count, students_per_class, weeks):
+        for day, _ in Weekday.DAY_CHOICES:
+            Weekday.objects.get_or_create(day=day)
+        teacher = create_teacher()
+        course = Object.objects.create(object_name='Môn bench')
+        # Mỗi phòng có 11 tiết mỗi ngày, đủ phòng để các lịch học không trùng nhau
+        rooms = Classroom.objects.bulk_create([
+            Classroom(classroom_code=f"P-{i}", class_name=f"P-{i}") for i in range(count // 11 + 1)
+        ])
+        classes = []
+        for i in range(max(1, count // 10)):
+            class_obj = Class.objects.create(class_name=f"Lớp {i}")
+            class_obj.students.add(*create_students(students_per_class))
+            classes.append(class_obj)
+
+        start_date = timezone.localdate() + timedelta(days=1)
+        return [
+            {
+                'teacher': teacher.id,
+                'course_name': course.id,
+                'room': rooms[i // 11].id,
+                'class_name': classes[i % len(classes)].id,
+                'lesson_start': 1 + i % 11,
+                'lesson_count': 1,
+                'weekdays': WEEKDAYS,
+                'start_date': start_date,
+                'end_date': start_date + timedelta(weeks=weeks),
+            }
+            for i in range(count)
+        ]
+
+    def create_one_by_one(self, items):
+        """Đường cũ: Schedule.save() rồi tạo điểm danh cho từng sinh viên"""
+        weekdays = list(Weekday.objects.filter(day__in=WEEKDAYS))
+        for item in items:
+            schedule = Schedule(
+                teacher_id=item['teacher'],
+                course_name_id=item['course_name'],
+                room_id=item['room'],
+                class_name_id=item['class_name'],
+                lesson_start=item['lesson_start'],
+                lesson_count=item['lesson_count'],
+                start_date=item['start_date'],
+                end_date=item['end_date'],
+            )
+            schedule.save()
+            schedule.weekdays.set(weekdays)
+            for student in schedule.class_name.students.all():
+                Attendance.objects.create(student=student, schedule=schedule, is_present=False)
+
+    def create_bulk(self, items):
+        serializer = ScheduleBulkCreateSerializer(data={'schedules': [
+            {**item, 'start_date': item['start_date'].isoformat(), 'end_date': item['end_date'].isoformat()}
+            for item in items
+        ]})
+        if not serializer.is_valid():
+            raise CommandError(serializer.errors)
+        return serializer.save()
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import stats
+from core.benchmarks import benchmark_database, create_students, measure, seed_school
+
+# (số lớp, sinh viên mỗi lớp, lịch học mỗi lớp, số ngày có điểm danh)
+SCALES = [
+    ('nhỏ', 1, 5, 2, 3),
+    ('lớn', 6, 40, 5, 30),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Đo số truy vấn và thời gian tính thống kê dashboard (admin, giáo viên, sinh viên) "
+        "ở nhiều quy mô dữ liệu. Báo lỗi nếu số truy vấn tăng theo dữ liệu."
+    )
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            student = create_students(1)[0]
+            teacher = None
+            results = []
+
+            for label, classes, students, schedules, days in SCALES:
+                seeded = seed_school(
+                    classes=classes,
+                    students_per_class=students,
+                    schedules_per_class=schedules,
+                    days=days,
+                    teacher=teacher,
+                    student=student,
+                )
+                teacher = seeded['teacher']
+
+                row = {'label': label}
+                for role, func, arg in (
+                    ('admin', stats.get_admin_statistics, None),
+                    ('teacher', stats.get_teacher_statistics, teacher),
+                    ('student', stats.get_student_statistics, student),
+                ):
+                    args = () if arg is None else (arg,)
+                    _, queries, elapsed = measure(func, *args)
+                    row[role] = (queries, elapsed)
+                    self.stdout.write(
+                        f"[{label}] {role:<8} {queries:>3} truy vấn  {elapsed * 1000:8.2f} ms"
+                    )
+                results.append(row)
+
+        first = results[0]
+        for row in results[1:]:
+            for role in ('admin', 'teacher', 'student'):
+                if row[role][0] != first[role][0]:
+                    raise CommandError(
+                        f"Số truy vấn của thống kê {role} thay đổi theo dữ liệu: "
+                        f"{first[role][0]} -> {row[role][0]}"
+                    )
+        self.stdout.write(self.style.SUCCESS("Số truy vấn không đổi khi dữ liệu tăng."))
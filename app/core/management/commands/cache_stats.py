@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from core import checkin, roles  # noqa: F401 (đăng ký loader ảnh chụp lịch học, ảnh chụp user)
+from core.cache import loaders, stats
+
+
+class Command(BaseCommand):
+    help = (
+        "In số lần trúng / trượt / xoá của các cache dùng chung (core/cache.py), "
+        "cộng dồn từ mọi tiến trình dùng cùng backend cache."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help="Đặt lại các số đếm về 0")
+
+    def handle(self, *args, **options):
+        names = sorted(loaders)
+        if options['reset']:
+            stats.reset(names)
+            self.stdout.write(self.style.SUCCESS("Đã đặt lại số đếm cache."))
+            return
+
+        for name, values in stats.shared(names).items():
+            ratio = values['hit_ratio']
+            self.stdout.write(
+                f"{name:<10} {values['hits']:>10} trúng  {values['misses']:>10} trượt  "
+                f"{values['invalidations']:>8} xoá  "
+                f"tỉ lệ trúng {'-' if ratio is None else f'{ratio:.1%}'}"
+            )
@@ -0,0 +1,124 @@
+import re
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import URLPattern, URLResolver, get_resolver
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core import tasks
+from core.benchmarks import benchmark_database, create_students, create_teacher, measure, seed_school
+from core.models import User
+
+# (số lớp, sinh viên mỗi lớp, lịch học mỗi lớp, số ngày có điểm danh)
+# Quy mô lớn vẫn nhỏ hơn một trang (PAGE_SIZE) để số dòng trả về thực sự tăng.
+SCALES = [
+    ('nhỏ', 1, 3, 1, 2),
+    ('lớn', 3, 8, 3, 4),
+]
+
+# Các API khác cần kiểm tra cùng với API danh sách: số truy vấn tối đa (kể cả xác thực JWT)
+# của một lượt gọi thành công, ở mọi quy mô dữ liệu
+QUERY_BUDGETS = {
+    '/api/qr/schedules/attendance-stats/': 4,
+}
+
+
+def _clean(regex):
+    return regex.lstrip('^').rstrip('$')
+
+
+def list_endpoints(patterns=None, prefix=''):
+    """
+    Duyệt URLconf, trả về đường dẫn của mọi API danh sách (tên route kết thúc bằng '-list')
+    không có tham số trên URL.
+    """
+    if patterns is None:
+        patterns = get_resolver().url_patterns
+    endpoints = []
+    for entry in patterns:
+        route = _clean(str(entry.pattern))
+        if isinstance(entry, URLResolver):
+            endpoints.extend(list_endpoints(entry.url_patterns, prefix + route))
+        elif isinstance(entry, URLPattern):
+            if not (entry.name or '').endswith('-list'):
+                continue
+            path = prefix + route
+            if re.search(r'[(<\\]', path):
+                continue
+            endpoints.append('/' + path)
+    return list(dict.fromkeys(endpoints))
+
+
+class Command(BaseCommand):
+    help = (
+        "Gọi mọi API danh sách (và các API trong QUERY_BUDGETS) với vai trò admin, giáo viên và sinh viên "
+        "ở nhiều quy mô dữ liệu; báo lỗi nếu số truy vấn tăng theo số dòng (N+1) hoặc vượt ngân sách."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='', help="Chỉ kiểm tra các đường dẫn bắt đầu bằng prefix (vd. /api/school/)")
+
+    def handle(self, *args, **options):
+        endpoints = [
+            path for path in list_endpoints() + list(QUERY_BUDGETS)
+            if path.startswith(options['prefix'])
+        ]
+        if not endpoints:
+            raise CommandError("Không tìm thấy API danh sách nào.")
+
+        # Ảnh QR của dữ liệu mẫu được vẽ bởi Celery worker, không cần cho việc đếm truy vấn
+        with benchmark_database(), mock.patch.object(tasks.render_schedule_qr_code, 'delay'):
+            admin = User.objects.create_user(
+                'admin@bench.local', '!', name='admin', is_staff=True, is_superuser=True,
+            )
+            teacher = create_teacher()
+            student = create_students(1)[0]
+            clients = {
+                'admin': self.client_for(admin),
+                'teacher': self.client_for(teacher.user),
+                'student': self.client_for(student.user),
+            }
+
+            counts = {}
+            for label, classes, students, schedules, days in SCALES:
+                seed_school(
+                    classes=classes,
+                    students_per_class=students,
+                    schedules_per_class=schedules,
+                    days=days,
+                    teacher=teacher,
+                    student=student,
+                )
+                for path in endpoints:
+                    for role, client in clients.items():
+                        # Không để cache của lần gọi trước che mất truy vấn
+                        cache.clear()
+                        response, queries, elapsed = measure(client.get, path)
+                        counts.setdefault((path, role), []).append((response.status_code, queries))
+                        self.stdout.write(
+                            f"[{label}] {path:<40} {role:<8} {response.status_code} "
+                            f"{queries:>4} truy vấn  {elapsed * 1000:8.2f} ms",
+                        )
+
+        problems = []
+        for (path, role), results in counts.items():
+            (first_status, first), *rest = results
+            for status, queries in rest:
+                if status == first_status == 200 and queries != first:
+                    problems.append(f"{path} ({role}): {first} -> {queries} truy vấn khi dữ liệu tăng")
+            budget = QUERY_BUDGETS.get(path)
+            if budget is not None:
+                over = [queries for status, queries in results if status == 200 and queries > budget]
+                if over:
+                    problems.append(f"{path} ({role}): {max(over)} truy vấn, ngân sách {budget}")
+        if problems:
+            raise CommandError("Số truy vấn không đạt:\n  " + "\n  ".join(problems))
+        self.stdout.write(self.style.SUCCESS(
+            f"Số truy vấn của {len(endpoints)} API không đổi khi dữ liệu tăng và nằm trong ngân sách."
+        ))
+
+    def client_for(self, user):
+        token = RefreshToken.for_user(user).access_token
+        return Client(HTTP_AUTHORIZATION=f"Bearer {token}")
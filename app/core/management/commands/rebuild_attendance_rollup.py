@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.rollup import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Dựng lại toàn bộ bảng tổng hợp điểm danh theo ngày (AttendanceDailyRollup) từ bảng Attendance"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Số dòng mỗi lần ghi hàng loạt (mặc định 1000)",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            created = rebuild_rollups(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Đã dựng lại {created} dòng tổng hợp điểm danh."))
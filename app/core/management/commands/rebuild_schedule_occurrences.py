@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from core.models import Schedule
+from core.occurrences import regenerate_occurrences
+
+
+class Command(BaseCommand):
+    help = "Sinh lại toàn bộ bảng buổi học cụ thể (ScheduleOccurrence) từ lịch lặp lại của các Schedule"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Số dòng mỗi lần ghi hàng loạt (mặc định 1000)",
+        )
+
+    def handle(self, *args, **options):
+        created = regenerate_occurrences(Schedule.objects.all(), batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Đã sinh {created} buổi học."))
@@ -1,14 +1,31 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.utils.deprecation import MiddlewareMixin
 
 class FakeIPMiddleware:
     """
     Middleware giả lập địa chỉ IP.
     Cho phép sử dụng tham số fake_ip trong URL để giả lập địa chỉ IP người dùng.
+    Dùng được cả đồng bộ lẫn async: dưới ASGI không cần chuyển sang thread.
     """
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        self.process_request(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        self.process_request(request)
+        return await self.get_response(request)
+
+    def process_request(self, request):
         fake_ip = request.GET.get('fake_ip')
         if fake_ip:
             # Lưu địa chỉ IP gốc
@@ -23,8 +40,6 @@ class FakeIPMiddleware:
         else:
             request._fake_ip_used = False
 
-        return self.get_response(request)
-
     def get_original_ip(self, request):
         """
         Lấy địa chỉ IP gốc từ request.
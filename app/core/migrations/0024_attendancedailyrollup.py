@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_rollups(apps, schema_editor):
+    # Dựng bảng tổng hợp từ các bản ghi điểm danh đã có trước migration này
+    from core.rollup import rebuild_rollups
+
+    rebuild_rollups(
+        attendance_model=apps.get_model("core", "Attendance"),
+        rollup_model=apps.get_model("core", "AttendanceDailyRollup"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0023_alter_user_avatar"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AttendanceDailyRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("total", models.PositiveIntegerField(default=0)),
+                ("present", models.PositiveIntegerField(default=0)),
+                ("late", models.PositiveIntegerField(default=0)),
+                ("absent", models.PositiveIntegerField(default=0)),
+                (
+                    "class_name",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_rollups",
+                        to="core.class",
+                    ),
+                ),
+                (
+                    "schedule",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_rollups",
+                        to="core.schedule",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["date"], name="core_attend_date_8e231a_idx")
+                ],
+                "unique_together": {("date", "schedule", "class_name")},
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_occurrences(apps, schema_editor):
+    # Sinh buổi học cụ thể cho các lịch học đã có trước migration này
+    from core.occurrences import regenerate_occurrences
+
+    Schedule = apps.get_model("core", "Schedule")
+    regenerate_occurrences(
+        Schedule.objects.all(),
+        occurrence_model=apps.get_model("core", "ScheduleOccurrence"),
+        weekday_model=Schedule.weekdays.through,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0024_attendancedailyrollup"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ScheduleOccurrence",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("start_time", models.DateTimeField()),
+                ("end_time", models.DateTimeField()),
+                (
+                    "class_name",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="occurrences",
+                        to="core.class",
+                    ),
+                ),
+                (
+                    "room",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="occurrences",
+                        to="core.classroom",
+                    ),
+                ),
+                (
+                    "schedule",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="occurrences",
+                        to="core.schedule",
+                    ),
+                ),
+                (
+                    "teacher",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="occurrences",
+                        to="core.teacher",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["date", "room"], name="core_schedu_date_1cec18_idx"
+                    ),
+                    models.Index(
+                        fields=["date", "teacher"], name="core_schedu_date_15b730_idx"
+                    ),
+                    models.Index(
+                        fields=["date", "class_name"],
+                        name="core_schedu_date_5990f5_idx",
+                    ),
+                ],
+                "unique_together": {("schedule", "date")},
+            },
+        ),
+        migrations.RunPython(backfill_occurrences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:01
+
+import core.models
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0025_scheduleoccurrence"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="classroom",
+            name="geofence_polygon",
+            field=models.JSONField(
+                blank=True,
+                help_text="Ranh giới phòng học: danh sách [vĩ độ, kinh độ], ít nhất 3 điểm. Khi có thì dùng thay cho bán kính",
+                null=True,
+                validators=[core.models.validate_geofence_polygon],
+            ),
+        ),
+        migrations.AddField(
+            model_name="classroom",
+            name="geofence_radius",
+            field=models.FloatField(
+                default=100,
+                help_text="Bán kính cho phép điểm danh quanh tọa độ phòng học (mét)",
+                validators=[django.core.validators.MinValueValidator(1)],
+            ),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0026_classroom_geofence"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="attendance",
+            index=models.Index(
+                fields=["schedule", "is_present"], name="core_attend_schedul_26f71f_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="attendance",
+            index=models.Index(
+                fields=["student", "timestamp"], name="core_attend_student_23e6fe_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="schedule",
+            index=models.Index(
+                fields=["teacher", "start_time"], name="core_schedu_teacher_1443df_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="schedule",
+            index=models.Index(
+                fields=["is_active", "start_date"],
+                name="core_schedu_is_acti_f60140_idx",
+            ),
+        ),
+    ]
@@ -3,11 +3,9 @@ Database models.
 """
 import uuid
 import os
-import qrcode
-from io import BytesIO
-from django.core.files import File
 from django.conf import settings
-from django.db import models
+from django.core.files.storage import default_storage
+from django.db import models, transaction
 # from django.contrib.auth.models import User
 from django.contrib.auth.models import (
     AbstractBaseUser,
@@ -20,6 +18,17 @@ from django.utils import timezone
 from rest_framework import serializers
 from datetime import datetime
 from django.core.exceptions import ValidationError
+from django.core.validators import MinValueValidator
+
+from .qr_images import qr_image_path
+from .qr_payload import schedule_payload
+
+# Trạng thái ảnh QR của lịch học
+QR_READY = 'ready'
+QR_PENDING = 'pending'
+
+# Các trường của Schedule ảnh hưởng tới dữ liệu QR (core/qr_payload.py)
+QR_PAYLOAD_FIELDS = ('end_date',)
 
 def generate_student_code():
     return f"SV{uuid.uuid4().hex[:6].upper()}"
@@ -77,6 +86,27 @@ def validate_avatar_file(value):
     
     return value
 
+def validate_geofence_polygon(value):
+    """
+    Kiểm tra ranh giới đa giác của phòng học
+    - Danh sách ít nhất 3 điểm [vĩ độ, kinh độ]
+    - Vĩ độ trong [-90, 90], kinh độ trong [-180, 180]
+    """
+    if value in (None, []):
+        return value
+    if not isinstance(value, list) or len(value) < 3:
+        raise ValidationError("Ranh giới phòng học phải là danh sách ít nhất 3 điểm [vĩ độ, kinh độ]")
+    for point in value:
+        if (
+            not isinstance(point, (list, tuple)) or len(point) != 2
+            or not all(isinstance(coordinate, (int, float)) for coordinate in point)
+        ):
+            raise ValidationError(f"Điểm không hợp lệ: {point!r}, cần dạng [vĩ độ, kinh độ]")
+        latitude, longitude = point
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValidationError(f"Tọa độ nằm ngoài phạm vi: {point!r}")
+    return value
+
 class User(AbstractBaseUser, PermissionsMixin):
     """Custom user model."""
     app_label = 'core'
@@ -158,6 +188,16 @@ class Classroom(models.Model):
     class_name = models.CharField(max_length=20)
     latitude = models.FloatField(null=True, blank=True, help_text="Vĩ độ của phòng học")
     longitude = models.FloatField(null=True, blank=True, help_text="Kinh độ của phòng học")
+    geofence_radius = models.FloatField(
+        default=100,
+        validators=[MinValueValidator(1)],
+        help_text="Bán kính cho phép điểm danh quanh tọa độ phòng học (mét)"
+    )
+    geofence_polygon = models.JSONField(
+        null=True, blank=True,
+        validators=[validate_geofence_polygon],
+        help_text="Ranh giới phòng học: danh sách [vĩ độ, kinh độ], ít nhất 3 điểm. Khi có thì dùng thay cho bán kính"
+    )
 
     def __str__(self):
         return f"{self.class_name} ({self.classroom_code})"
@@ -223,6 +263,14 @@ class Schedule(models.Model):
     def __str__(self):
         return f"{self.course_name} by {self.teacher.user.name}"
 
+    class Meta:
+        indexes = [
+            # Lịch dạy của giáo viên theo thời gian
+            models.Index(fields=['teacher', 'start_time']),
+            # Các lịch học đang hoạt động theo ngày bắt đầu
+            models.Index(fields=['is_active', 'start_date']),
+        ]
+
     def calculate_time(self, date, lesson_number):
         """Tính thời gian bắt đầu và kết thúc của một tiết học"""
         lesson_times = {
@@ -279,6 +327,29 @@ class Schedule(models.Model):
         today = timezone.now().date()
         self.is_active = self.start_date <= today <= self.end_date
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_qr_fields = instance.qr_payload_fields()
+        # Lớp lúc nạp, để signal nhận biết lịch học đổi lớp (bảng tổng hợp điểm danh, core/signals.py)
+        instance._loaded_class_id = instance.__dict__.get('class_name_id')
+        return instance
+
+    def qr_payload_fields(self):
+        """Giá trị hiện tại của các trường ảnh hưởng tới dữ liệu QR (bỏ qua trường bị defer)"""
+        return {
+            field: self.__dict__[field]
+            for field in QR_PAYLOAD_FIELDS
+            if field in self.__dict__
+        }
+
+    def qr_payload_changed(self):
+        """Có trường nào ảnh hưởng tới dữ liệu QR thay đổi kể từ khi nạp / lưu gần nhất không"""
+        loaded = getattr(self, '_loaded_qr_fields', None)
+        if loaded is None:
+            return True
+        return self.qr_payload_fields() != loaded
+
     def save(self, *args, **kwargs):
         # Tính thời gian bắt đầu và kết thúc dựa trên tiết học
         self.start_time, self.end_time = self.calculate_times()
@@ -286,45 +357,77 @@ class Schedule(models.Model):
         # Cập nhật trạng thái trước khi lưu
         today = timezone.now().date()
         self.is_active = self.start_date <= today <= self.end_date
-        
+
+        # Chỉ làm mới mã QR khi dữ liệu QR có thể đã thay đổi
+        refresh_qr = self._state.adding or not self.qr_code_data or self.qr_payload_changed()
+
         super().save(*args, **kwargs)
+        self._loaded_class_id = self.class_name_id
+
+        if refresh_qr:
+            self.generate_qr_code()
+        self._loaded_qr_fields = self.qr_payload_fields()
+
+    def build_qr_code_data(self):
+        """Dữ liệu được mã hoá trong QR code của lịch học: chuỗi ngắn đã ký (core/qr_payload.py)"""
+        return schedule_payload(self.id, self.end_date)
+
+    @property
+    def qr_status(self):
+        """'ready' khi ảnh QR khớp với dữ liệu QR hiện tại, ngược lại 'pending'"""
+        if self.qr_code_data and self.qr_code and self.qr_code.name == qr_image_path(self.qr_code_data):
+            return QR_READY
+        return QR_PENDING
 
     def generate_qr_code(self):
-        if not self.qr_code_data:
-            # Tạo dữ liệu cho QR code
-            data = {
-                'schedule_id': self.id,
-                'course_name': self.course_name.object_name,
-                'teacher': self.teacher.user.name,
-                'class_name': self.class_name.class_name,
-                'room': self.room.classroom_code,
-                'lesson_start': self.lesson_start,
-                'lesson_count': self.lesson_count,
-                'start_time': self.start_time.isoformat() if self.start_time else None,
-                'end_time': self.end_time.isoformat() if self.end_time else None
-            }
-            self.qr_code_data = str(data)
-            self.save()
-
-        # Tạo QR code
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(self.qr_code_data)
-        qr.make(fit=True)
-
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Lưu QR code vào file
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        
-        # Lưu file vào trường qr_code
-        self.qr_code.save(f'{self.id}.png', File(buffer), save=True)
-        return self.qr_code.url
+        """
+        Cập nhật dữ liệu QR và yêu cầu vẽ ảnh QR, không chờ vẽ xong.
+        Ảnh được lưu theo hash của dữ liệu: nếu đã có sẵn thì gắn ngay, nếu chưa thì
+        đưa task core.tasks.render_schedule_qr_code vào hàng đợi Celery sau khi transaction commit.
+        Trả về trạng thái 'ready' hoặc 'pending'.
+        """
+        from .tasks import render_schedule_qr_code
+
+        data = self.build_qr_code_data()
+        if data == self.qr_code_data and self.qr_status == QR_READY:
+            return QR_READY
+
+        self.qr_code_data = data
+        path = qr_image_path(data)
+        if default_storage.exists(path):
+            self.qr_code.name = path
+            Schedule.objects.filter(pk=self.pk).update(qr_code_data=data, qr_code=path)
+            return QR_READY
+
+        Schedule.objects.filter(pk=self.pk).update(qr_code_data=data)
+        schedule_id = self.pk
+        transaction.on_commit(lambda: render_schedule_qr_code.delay(schedule_id))
+        return QR_PENDING
+
+class ScheduleOccurrence(models.Model):
+    """
+    Một buổi học cụ thể sinh ra từ lịch lặp lại của Schedule
+    (các ngày thuộc weekdays nằm giữa start_date và end_date), xem core/occurrences.py.
+    Cho phép trả lời "đang học / hôm nay / tuần này" bằng một truy vấn theo khoảng ngày có index.
+    """
+    schedule = models.ForeignKey(Schedule, on_delete=models.CASCADE, related_name='occurrences')
+    date = models.DateField()
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField()
+    room = models.ForeignKey(Classroom, on_delete=models.CASCADE, related_name='occurrences')
+    teacher = models.ForeignKey(Teacher, on_delete=models.CASCADE, related_name='occurrences')
+    class_name = models.ForeignKey(Class, on_delete=models.CASCADE, related_name='occurrences')
+
+    def __str__(self):
+        return f"{self.schedule_id} - {self.date}"
+
+    class Meta:
+        unique_together = ('schedule', 'date')
+        indexes = [
+            models.Index(fields=['date', 'room']),
+            models.Index(fields=['date', 'teacher']),
+            models.Index(fields=['date', 'class_name']),
+        ]
 
 class Attendance(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
@@ -346,6 +449,35 @@ class Attendance(models.Model):
 
     class Meta:
         unique_together = ('student', 'schedule')  # Đảm bảo mỗi sinh viên chỉ có một bản ghi điểm danh cho mỗi lịch
+        indexes = [
+            # Danh sách có mặt / vắng mặt của một buổi học, thống kê theo lịch học
+            models.Index(fields=['schedule', 'is_present']),
+            # Lịch sử điểm danh của sinh viên theo thời gian
+            models.Index(fields=['student', 'timestamp']),
+        ]
+
+class AttendanceDailyRollup(models.Model):
+    """
+    Số liệu điểm danh tổng hợp theo (ngày, lịch học, lớp).
+    Được cập nhật lại cho đúng khóa bị ảnh hưởng mỗi khi một bản ghi Attendance thay đổi
+    (xem core/rollup.py), để dashboard đọc O(số ngày) thay vì O(số bản ghi điểm danh).
+    """
+    date = models.DateField()
+    schedule = models.ForeignKey(Schedule, on_delete=models.CASCADE, related_name='daily_rollups')
+    class_name = models.ForeignKey(Class, on_delete=models.CASCADE, related_name='daily_rollups')
+    total = models.PositiveIntegerField(default=0)
+    present = models.PositiveIntegerField(default=0)
+    late = models.PositiveIntegerField(default=0)
+    absent = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.date} - {self.schedule_id}: {self.present}/{self.total}"
+
+    class Meta:
+        unique_together = ('date', 'schedule', 'class_name')
+        indexes = [
+            models.Index(fields=['date']),
+        ]
 
 class QRCode(models.Model):
     schedule = models.OneToOneField(Schedule, on_delete=models.CASCADE)
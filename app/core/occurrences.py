@@ -0,0 +1,114 @@
+"""
+Sinh các buổi học cụ thể (ScheduleOccurrence) từ lịch lặp lại của Schedule.
+
+Mỗi Schedule lặp lại vào các thứ trong `weekdays`, từ `start_date` tới `end_date`, bắt đầu ở tiết
+`lesson_start` và kéo dài `lesson_count` tiết. Bảng occurrence được sinh lại mỗi khi lịch học hoặc
+các thứ trong tuần của nó thay đổi (xem core/signals.py).
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Schedule, ScheduleOccurrence
+
+# Mã thứ trong tuần -> date.weekday()
+WEEKDAY_INDEX = {'MON': 0, 'TUE': 1, 'WED': 2, 'THU': 3, 'FRI': 4, 'SAT': 5, 'SUN': 6}
+
+
+def occurrence_dates(start_date, end_date, weekday_codes):
+    """Các ngày trong [start_date, end_date] rơi vào một trong các thứ `weekday_codes`"""
+    indexes = {WEEKDAY_INDEX[code] for code in weekday_codes if code in WEEKDAY_INDEX}
+    if not indexes or not start_date or not end_date:
+        return []
+    dates = []
+    day = start_date
+    while day <= end_date:
+        if day.weekday() in indexes:
+            dates.append(day)
+        day += timedelta(days=1)
+    return dates
+
+
+def build_occurrences(schedule, weekday_codes, occurrence_model=ScheduleOccurrence):
+    """Tạo (chưa lưu) các ScheduleOccurrence của một lịch học"""
+    dates = occurrence_dates(schedule.start_date, schedule.end_date, weekday_codes)
+    if not dates:
+        return []
+    # Giờ học giống nhau mọi ngày: tính một lần rồi ghép với từng ngày
+    end_lesson = min(schedule.lesson_start + schedule.lesson_count - 1, 11)
+    # Gọi qua lớp Schedule để dùng được cả với model lịch sử của migration (không có phương thức riêng)
+    start_time, _ = Schedule.calculate_time(schedule, dates[0], schedule.lesson_start)
+    _, end_time = Schedule.calculate_time(schedule, dates[0], end_lesson)
+    start_clock, end_clock = start_time.timetz(), end_time.timetz()
+
+    return [
+        occurrence_model(
+            schedule_id=schedule.id,
+            date=day,
+            start_time=datetime.combine(day, start_clock),
+            end_time=datetime.combine(day, end_clock),
+            room_id=schedule.room_id,
+            teacher_id=schedule.teacher_id,
+            class_name_id=schedule.class_name_id,
+        )
+        for day in dates
+    ]
+
+
+def regenerate_occurrences(schedules, batch_size=1000, occurrence_model=ScheduleOccurrence, weekday_model=None):
+    """
+    Xoá và sinh lại occurrence của các lịch học, trả về số occurrence đã tạo.
+    Migration truyền model lịch sử qua `occurrence_model` / `weekday_model` (bảng trung gian Schedule.weekdays).
+    """
+    schedules = list(schedules)
+    if not schedules:
+        return 0
+    schedule_ids = [schedule.id for schedule in schedules]
+    weekday_model = weekday_model or Schedule.weekdays.through
+
+    weekdays = defaultdict(list)
+    for schedule_id, day in weekday_model.objects.filter(
+        schedule_id__in=schedule_ids
+    ).values_list('schedule_id', 'weekday__day'):
+        weekdays[schedule_id].append(day)
+
+    occurrences = []
+    for schedule in schedules:
+        occurrences.extend(build_occurrences(schedule, weekdays[schedule.id], occurrence_model))
+
+    with transaction.atomic():
+        occurrence_model.objects.filter(schedule_id__in=schedule_ids).delete()
+        occurrence_model.objects.bulk_create(occurrences, batch_size=batch_size)
+    return len(occurrences)
+
+
+def occurrences_in_period(period, now=None):
+    """
+    Occurrence trong một khoảng thời gian thông dụng:
+    - 'now': các buổi đang diễn ra
+    - 'today': các buổi hôm nay
+    - 'week': các buổi trong tuần hiện tại (thứ 2 - chủ nhật)
+    Trả về None nếu `period` không hợp lệ.
+    """
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    queryset = ScheduleOccurrence.objects.all()
+    if period == 'now':
+        queryset = queryset.filter(date=today, start_time__lte=now, end_time__gte=now)
+    elif period == 'today':
+        queryset = queryset.filter(date=today)
+    elif period == 'week':
+        monday = today - timedelta(days=today.weekday())
+        queryset = queryset.filter(date__gte=monday, date__lte=monday + timedelta(days=6))
+    else:
+        return None
+    return queryset.order_by('start_time')
+
+
+def upcoming_occurrences(today, days=7):
+    """Occurrence từ hôm nay tới `days` ngày sau"""
+    return ScheduleOccurrence.objects.filter(
+        date__gte=today, date__lte=today + timedelta(days=days)
+    ).order_by('start_time')
@@ -0,0 +1,135 @@
+"""
+Phân trang và chọn trường cho các API danh sách.
+
+- DefaultPagination: phân trang theo số trang, mặc định cho mọi danh sách (REST_FRAMEWORK).
+- AttendanceCursorPagination / IdCursorPagination: phân trang keyset theo (timestamp, id) hoặc id,
+  chi phí mỗi trang không phụ thuộc vào vị trí trang như OFFSET.
+- SparseFieldsetsMixin: ?fields=id,timestamp chỉ trả về các trường được chọn và thu hẹp
+  danh sách cột trong câu SQL bằng only() / select_related().
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class DefaultPagination(PageNumberPagination):
+    page_size = PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # Phân trang cần thứ tự ổn định
+        if not queryset.ordered:
+            queryset = queryset.order_by('pk')
+        return super().paginate_queryset(queryset, request, view)
+
+
+class AttendanceCursorPagination(CursorPagination):
+    """Điểm danh mới nhất trước, khóa keyset (timestamp, id)"""
+    page_size = PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = MAX_PAGE_SIZE
+    ordering = ('-timestamp', '-id')
+
+
+class IdCursorPagination(CursorPagination):
+    page_size = PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = MAX_PAGE_SIZE
+    ordering = ('id',)
+
+
+def _model_path(model, source):
+    """
+    Đổi source của một trường serializer ('teacher.user.name') thành đường dẫn ORM
+    ('teacher__user__name') và danh sách quan hệ cần select_related.
+    Trả về None nếu source không phải là trường trong CSDL (property, method...).
+    """
+    parts = source.split('.')
+    relations = []
+    for i, part in enumerate(parts):
+        try:
+            field = model._meta.get_field(part)
+        except FieldDoesNotExist:
+            return None
+        if field.many_to_many or field.one_to_many:
+            return None
+        if i == len(parts) - 1:
+            return '__'.join(parts), relations
+        if not field.is_relation:
+            return None
+        relations.append('__'.join(parts[:i + 1]))
+        model = field.related_model
+    return None
+
+
+def narrow_queryset(queryset, serializer, field_names, required=('pk',)):
+    """
+    Chỉ nạp các cột cần cho `field_names` của `serializer` (và các trường `required`,
+    ví dụ trường sắp xếp của phân trang). Giữ nguyên queryset nếu có trường không suy ra được cột.
+    """
+    model = queryset.model
+    columns = set()
+    relations = set()
+    for name in field_names:
+        field = serializer.fields.get(name)
+        if field is None:
+            continue
+        if isinstance(field, (serializers.SerializerMethodField, serializers.BaseSerializer)):
+            return queryset
+        if field.source == '*':
+            return queryset
+        path = _model_path(model, field.source)
+        if path is None:
+            return queryset
+        column, field_relations = path
+        columns.add(column)
+        relations.update(field_relations)
+
+    columns.update(model._meta.pk.name if name == 'pk' else name.lstrip('-') for name in required)
+    # Bỏ kế hoạch nạp quan hệ của viewset, chỉ nạp các quan hệ của trường được chọn
+    queryset = queryset.select_related(None).prefetch_related(None)
+    if relations:
+        queryset = queryset.select_related(*relations)
+    return queryset.only(*columns)
+
+
+class SparseFieldsetsMixin:
+    """
+    Mixin cho ViewSet: ?fields=a,b,c giới hạn các trường trả về (chỉ với GET)
+    và thu hẹp câu SQL tương ứng.
+    """
+    fields_query_param = 'fields'
+
+    def get_sparse_fields(self):
+        if self.request is None or self.request.method != 'GET':
+            return None
+        value = self.request.query_params.get(self.fields_query_param)
+        if not value:
+            return None
+        return [name.strip() for name in value.split(',') if name.strip()]
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        fields = self.get_sparse_fields()
+        if fields:
+            target = getattr(serializer, 'child', serializer)
+            for name in list(target.fields):
+                if name not in fields:
+                    target.fields.pop(name)
+        return serializer
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        fields = self.get_sparse_fields()
+        if not fields:
+            return queryset
+        serializer = self.get_serializer_class()(context=self.get_serializer_context())
+        required = ['pk']
+        ordering = getattr(self.pagination_class, 'ordering', None)
+        if self.paginator is not None and ordering:
+            required.extend([ordering] if isinstance(ordering, str) else ordering)
+        return narrow_queryset(queryset, serializer, fields, required)
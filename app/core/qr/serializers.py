@@ -1,8 +1,8 @@
 from rest_framework import serializers
 from ..models import Schedule, Attendance, Student
+from ..checkin import get_schedule_snapshot
+from ..qr_payload import InvalidQRPayload, parse_qr_data
 from django.utils import timezone
-import json
-from math import radians, cos, sin, asin, sqrt
 from datetime import timedelta
 
 class ScheduleQRSerializer(serializers.ModelSerializer):
@@ -11,12 +11,13 @@ class ScheduleQRSerializer(serializers.ModelSerializer):
     room_name = serializers.CharField(source='room.classroom_code', read_only=True)
     class_name = serializers.CharField(source='class_name.class_name', read_only=True)
     qr_code_url = serializers.SerializerMethodField()
+    qr_status = serializers.CharField(read_only=True)
 
     class Meta:
         model = Schedule
         fields = [
             'id', 'teacher_name', 'course_name', 'room_name', 
-            'class_name', 'start_time', 'end_time', 'qr_code_url'
+            'class_name', 'start_time', 'end_time', 'qr_code_url', 'qr_status'
         ]
 
     def get_qr_code_url(self, obj):
@@ -29,41 +30,20 @@ class QRAttendanceSerializer(serializers.Serializer):
     latitude = serializers.FloatField(required=True)
     longitude = serializers.FloatField(required=True)
     
-    def haversine_distance(self, lat1, lon1, lat2, lon2):
-        """
-        Tính khoảng cách giữa hai tọa độ GPS 
-        sử dụng công thức Haversine
-        """
-        # Chuyển đổi độ sang radian
-        lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-        
-        # Công thức Haversine
-        dlon = lon2 - lon1
-        dlat = lat2 - lat1
-        a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-        c = 2 * asin(sqrt(a))
-        r = 6371  # Bán kính trái đất tính bằng km
-        
-        # Chuyển đổi từ km sang mét
-        return c * r * 1000
-    
     def validate(self, attrs):
         qr_data = attrs.get('qr_data')
         latitude = attrs.get('latitude')
         longitude = attrs.get('longitude')
         
-        # Parse QR data
-        try:
-            qr_json = qr_data.replace("'", '"')
-            qr_info = json.loads(qr_json)
-            schedule_id = qr_info.get('schedule_id')
-        except (json.JSONDecodeError, AttributeError):
-            raise serializers.ValidationError("Mã QR không hợp lệ")
-        
-        # Kiểm tra schedule tồn tại
+        # Giải mã và kiểm tra chữ ký, hạn dùng của mã QR trước khi truy cập CSDL (core/qr_payload.py)
         try:
-            schedule = Schedule.objects.get(id=schedule_id)
-        except Schedule.DoesNotExist:
+            payload = parse_qr_data(qr_data)
+        except InvalidQRPayload as e:
+            raise serializers.ValidationError(str(e))
+
+        # Kiểm tra schedule tồn tại (đọc từ ảnh chụp lịch học trong cache)
+        schedule = get_schedule_snapshot(payload.schedule_id)
+        if schedule is None:
             raise serializers.ValidationError("Lịch học không tồn tại")
         
         # Kiểm tra thời gian hiện tại có nằm trong khoảng thời gian của buổi học
@@ -99,39 +79,24 @@ class QRAttendanceSerializer(serializers.Serializer):
             6: 'SUN',  # Chủ nhật
         }
         current_weekday = weekday_map.get(now.weekday())
-        if not schedule.weekdays.filter(day=current_weekday).exists():
+        if current_weekday not in schedule.weekdays:
             raise serializers.ValidationError(f"Hôm nay không phải là ngày học của lịch này")
         
-        # Kiểm tra vị trí
-        # Trong trường hợp thực tế, bạn cần thêm trường latitude và longitude cho Classroom
-        # Ở đây tôi sẽ giả định là classroom có tọa độ (nếu có)
-        classroom = schedule.room
-        
-        # Nếu classroom có tọa độ (giả định có trường latitude và longitude)
-        # thì kiểm tra khoảng cách
-        # Giả sử classroom có tọa độ (để sau này bạn có thể bổ sung)
-        # Tạm thời cho giá trị cứng để minh họa:
-        classroom_lat = getattr(classroom, 'latitude', None)
-        classroom_lon = getattr(classroom, 'longitude', None)
+        # Kiểm tra vị trí theo bán kính hoặc ranh giới đa giác của phòng học (đọc từ cache)
+        geofence = schedule.geofence
         
-        if classroom_lat and classroom_lon:
-            # Tính khoảng cách
-            distance = self.haversine_distance(
-                latitude, longitude, 
-                classroom_lat, classroom_lon
-            )
-            
-            # Khoảng cách tối đa cho phép (ví dụ: 100m)
-            max_distance = 100  # 100 mét
+        if geofence and geofence.has_location:
+            result = geofence.check(latitude, longitude)
             
-            if distance > max_distance:
+            if not result.inside:
                 raise serializers.ValidationError(
-                    f"Bạn đang ở cách phòng học quá xa ({distance:.0f}m). Vui lòng đến gần phòng học hơn."
+                    f"Bạn đang ở cách phòng học quá xa ({result.distance:.0f}m). Vui lòng đến gần phòng học hơn."
                 )
             
             # Lưu khoảng cách để sử dụng sau này
-            attrs['distance'] = distance
+            attrs['distance'] = result.distance
         
-        # Lưu schedule để sử dụng sau
+        # Lưu ảnh chụp lịch học và phòng học để sử dụng sau
         attrs['schedule'] = schedule
+        attrs['geofence'] = geofence
         return attrs 
\ No newline at end of file
@@ -1,52 +1,97 @@
 from rest_framework import viewsets, status, serializers
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db.models import Count, F, Q, Sum, Case, When, IntegerField
+from django.db.models import Count, F, FilteredRelation, Q, Sum, Case, When, IntegerField
+from django.http import HttpResponse
 from django.utils import timezone
-from ..models import Schedule, Attendance, Student
+from django.utils.http import http_date
+from ..checkin import ALREADY_PRESENT, CREATED, check_in, get_schedule_snapshot
+from ..idempotency import idempotent
+from ..models import Schedule, Attendance, Student, QR_READY
+from ..qr_images import QR_IMAGE_TYPES, rotating_qr_image
+from ..roles import get_role
+from ..pagination import IdCursorPagination, SparseFieldsetsMixin
 from .serializers import ScheduleQRSerializer, QRAttendanceSerializer
 
-class ScheduleQRViewSet(viewsets.ModelViewSet):
-    queryset = Schedule.objects.all()
+class ScheduleQRViewSet(SparseFieldsetsMixin, viewsets.ModelViewSet):
+    queryset = Schedule.objects.select_related('teacher__user', 'course_name', 'room', 'class_name')
     serializer_class = ScheduleQRSerializer
+    pagination_class = IdCursorPagination
 
     @action(detail=True, methods=['post'])
     def generate_qr(self, request, pk=None):
         schedule = self.get_object()
         try:
-            qr_code_url = schedule.generate_qr_code()
+            # Không chờ vẽ ảnh: trả về ngay trạng thái 'ready' hoặc 'pending'
+            qr_status = schedule.generate_qr_code()
+            ready = qr_status == QR_READY
             return Response({
                 'status': 'success',
-                'message': 'QR code generated successfully',
-                'qr_code_url': qr_code_url
-            })
+                'message': 'QR code generated successfully' if ready else 'QR code generation queued',
+                'qr_status': qr_status,
+                'qr_code_url': schedule.qr_code.url if ready else None
+            }, status=status.HTTP_200_OK if ready else status.HTTP_202_ACCEPTED)
         except Exception as e:
             return Response({
                 'status': 'error',
                 'message': str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @action(detail=True, methods=['get'], url_path='rotating-qr')
+    def rotating_qr(self, request, pk=None):
+        """
+        Ảnh mã QR xoay vòng của lịch học (?image=svg mặc định, hoặc png) để chiếu trên màn hình lớp học.
+        Mã đổi sau mỗi QR_ROTATION_INTERVAL giây nên ảnh chụp mã gửi cho người khác nhanh chóng hết hạn.
+        Chỉ giáo viên của lịch học và admin được xem; ảnh được vẽ trong bộ nhớ và cache theo cửa sổ thời gian.
+        """
+        kind = request.query_params.get('image', 'svg')
+        if kind not in QR_IMAGE_TYPES:
+            return Response({
+                "status": "error",
+                "message": f"Định dạng ảnh không hợp lệ, chọn một trong: {', '.join(QR_IMAGE_TYPES)}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        schedule = get_schedule_snapshot(pk)
+        if schedule is None:
+            return Response({
+                "status": "error",
+                "message": "Lịch học không tồn tại"
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        role = get_role(request)
+        if not role.is_admin and (role.teacher is None or role.teacher.pk != schedule.teacher_id):
+            return Response({
+                "status": "error",
+                "message": "Chỉ giáo viên của lịch học mới được xem mã QR điểm danh"
+            }, status=status.HTTP_403_FORBIDDEN)
+
+        image, window_end = rotating_qr_image(schedule.id, kind)
+        max_age = max(0, int((window_end - timezone.now()).total_seconds()))
+        response = HttpResponse(image, content_type=QR_IMAGE_TYPES[kind])
+        response['Cache-Control'] = f'private, max-age={max_age}'
+        response['Expires'] = http_date(window_end.timestamp())
+        return response
+
     @action(detail=False, methods=['post'], url_path='attendance')
+    @idempotent
     def qr_attendance(self, request):
         serializer = QRAttendanceSerializer(data=request.data)
         if serializer.is_valid():
-            user = request.user
-            
             # Kiểm tra nếu user có student profile
-            try:
-                student = Student.objects.get(user=user)
-            except Student.DoesNotExist:
+            student = get_role(request).student
+            if student is None:
                 return Response({
                     "status": "error",
                     "message": "Bạn không có quyền điểm danh"
                 }, status=status.HTTP_403_FORBIDDEN)
             
             schedule = serializer.validated_data['schedule']
+            geofence = serializer.validated_data['geofence']
             is_late = serializer.validated_data.get('is_late', False)
             distance = serializer.validated_data.get('distance')
             
             # Kiểm tra xem sinh viên có thuộc lớp của schedule này không
-            if not schedule.class_name.students.filter(id=student.id).exists():
+            if not schedule.has_student(student.id):
                 return Response({
                     "status": "error",
                     "message": "Bạn không phải là sinh viên trong lớp học này"
@@ -58,39 +103,25 @@ class ScheduleQRViewSet(viewsets.ModelViewSet):
                 time_diff = timezone.now() - schedule.start_time
                 minutes_late = int(time_diff.total_seconds() / 60)
             
-            # Kiểm tra xem đã điểm danh cho lịch học này chưa
-            # và cập nhật hoặc tạo mới
-            attendance, created = Attendance.objects.get_or_create(
+            # Một câu lệnh upsert có điều kiện: lượt điểm danh có mặt đầu tiên được giữ
+            attendance, outcome = check_in(Attendance(
                 student=student,
-                schedule=schedule,
-                defaults={
-                    'is_present': True,
-                    'is_late': is_late,
-                    'minutes_late': minutes_late
-                }
-            )
-            
-            if not created:
-                # Nếu bản ghi đã tồn tại, cập nhật trạng thái
-                attendance.is_present = True
-                
-                # Chỉ cập nhật is_late nếu chưa điểm danh hoặc cập nhật điểm danh sớm hơn
-                if attendance.is_late and not is_late:
-                    attendance.is_late = False
-                    attendance.minutes_late = None
-                elif not attendance.is_late and is_late:
-                    attendance.is_late = True
-                    attendance.minutes_late = minutes_late
-                    
-                attendance.save()
-                message = "Bạn đã cập nhật điểm danh thành công"
-            else:
+                schedule_id=schedule.id,
+                is_present=True,
+                is_late=is_late,
+                minutes_late=minutes_late,
+            ))
+            if outcome == CREATED:
                 message = "Bạn đã điểm danh thành công"
+            elif outcome == ALREADY_PRESENT:
+                message = "Bạn đã điểm danh cho lịch học này rồi"
+            else:
+                message = "Bạn đã cập nhật điểm danh thành công"
             
             # Lấy thống kê điểm danh của sinh viên cho lớp này
             attendance_stats = Attendance.objects.filter(
                 student=student,
-                schedule__class_name=schedule.class_name
+                schedule__class_name_id=schedule.class_id
             ).aggregate(
                 total=Count('id'),
                 present=Sum(Case(When(is_present=True, then=1), default=0, output_field=IntegerField())),
@@ -107,8 +138,8 @@ class ScheduleQRViewSet(viewsets.ModelViewSet):
                 attendance_rate = (present_count / total_schedules) * 100
             
             late_status = "Đúng giờ"
-            if is_late:
-                late_status = f"Trễ {minutes_late} phút"
+            if attendance.is_late:
+                late_status = f"Trễ {attendance.minutes_late} phút"
             
             return Response({
                 "status": "success",
@@ -116,9 +147,9 @@ class ScheduleQRViewSet(viewsets.ModelViewSet):
                 "data": {
                     "attendance_id": attendance.id,
                     "schedule_id": schedule.id,
-                    "course_name": schedule.course_name.object_name,
-                    "teacher": schedule.teacher.user.name,
-                    "classroom": schedule.room.classroom_code,
+                    "course_name": schedule.course_name,
+                    "teacher": schedule.teacher_name,
+                    "classroom": geofence.code if geofence else None,
                     "timestamp": attendance.timestamp,
                     "is_present": attendance.is_present,
                     "attendance_status": late_status,
@@ -130,8 +161,8 @@ class ScheduleQRViewSet(viewsets.ModelViewSet):
                     "present_count": present_count,
                     "late_count": late_count,
                     "attendance_rate": f"{attendance_rate:.1f}%",
-                    "course_name": schedule.course_name.object_name,
-                    "class_name": schedule.class_name.class_name
+                    "course_name": schedule.course_name,
+                    "class_name": schedule.class_name
                 }
             })
         
@@ -144,66 +175,65 @@ class ScheduleQRViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'], url_path='attendance-stats')
     def attendance_stats(self, request):
         """Lấy thống kê điểm danh của sinh viên"""
-        try:
-            student = Student.objects.get(user=request.user)
-        except Student.DoesNotExist:
+        student = get_role(request).student
+        if student is None:
             return Response({
                 "status": "error",
                 "message": "Bạn không phải là sinh viên"
             }, status=status.HTTP_403_FORBIDDEN)
         
-        # Lấy thống kê điểm danh theo từng lớp học
-        class_stats = []
-        
-        for class_obj in student.student_classes.all():
-            # Lấy thống kê điểm danh cho lớp này
-            class_attendance = Attendance.objects.filter(
-                student=student, 
-                schedule__class_name=class_obj
-            ).aggregate(
+        classes = list(student.student_classes.order_by('id'))
+
+        # Thống kê điểm danh của mọi lớp trong một truy vấn gom nhóm
+        totals = {
+            row['schedule__class_name_id']: row
+            for row in Attendance.objects.filter(
+                student=student,
+                schedule__class_name__in=classes
+            ).values('schedule__class_name_id').annotate(
                 total=Count('id'),
                 present=Sum(Case(When(is_present=True, then=1), default=0, output_field=IntegerField())),
                 late=Sum(Case(When(is_late=True, then=1), default=0, output_field=IntegerField()))
             )
-            
-            total = class_attendance.get('total', 0)
-            present = class_attendance.get('present', 0)
-            late = class_attendance.get('late', 0)
-            
+        }
+
+        # Mọi buổi học của các lớp cùng bản ghi điểm danh (nếu có) của sinh viên, một truy vấn LEFT JOIN
+        schedules_by_class = {class_obj.id: [] for class_obj in classes}
+        schedules = Schedule.objects.filter(class_name__in=classes).annotate(
+            student_attendance=FilteredRelation('attendance', condition=Q(attendance__student=student))
+        ).values(
+            'id', 'class_name_id', 'course_name__object_name', 'start_time', 'end_time',
+            'student_attendance__id', 'student_attendance__is_present',
+            'student_attendance__is_late', 'student_attendance__minutes_late',
+        ).order_by('id')
+        for schedule in schedules:
+            if schedule['student_attendance__id'] is None:
+                attendance_status = "Chưa điểm danh"
+            elif schedule['student_attendance__is_present']:
+                attendance_status = "Trễ" if schedule['student_attendance__is_late'] else "Có mặt"
+            else:
+                attendance_status = "Vắng mặt"
+
+            schedules_by_class[schedule['class_name_id']].append({
+                "schedule_id": schedule['id'],
+                "course_name": schedule['course_name__object_name'],
+                "date": schedule['start_time'].strftime("%d/%m/%Y"),
+                "time": f"{schedule['start_time'].strftime('%H:%M')} - {schedule['end_time'].strftime('%H:%M')}",
+                "status": attendance_status,
+                "minutes_late": schedule['student_attendance__minutes_late'] or 0
+            })
+
+        class_stats = []
+        for class_obj in classes:
+            class_attendance = totals.get(class_obj.id, {'total': 0, 'present': None, 'late': None})
+            total = class_attendance['total']
+            present = class_attendance['present']
+            late = class_attendance['late']
+
             attendance_rate = 0
             if total > 0:
                 attendance_rate = (present / total) * 100
-                
-            # Lấy thông tin tất cả các buổi học của lớp
-            schedules = Schedule.objects.filter(class_name=class_obj)
-            
-            # Lấy thông tin điểm danh cho mỗi buổi học
-            schedule_details = []
-            for schedule in schedules:
-                try:
-                    attendance = Attendance.objects.get(student=student, schedule=schedule)
-                    status = "Vắng mặt"
-                    if attendance.is_present:
-                        status = "Trễ" if attendance.is_late else "Có mặt"
-                        
-                    schedule_details.append({
-                        "schedule_id": schedule.id,
-                        "course_name": schedule.course_name.object_name,
-                        "date": schedule.start_time.strftime("%d/%m/%Y"),
-                        "time": f"{schedule.start_time.strftime('%H:%M')} - {schedule.end_time.strftime('%H:%M')}",
-                        "status": status,
-                        "minutes_late": attendance.minutes_late if attendance.minutes_late else 0
-                    })
-                except Attendance.DoesNotExist:
-                    schedule_details.append({
-                        "schedule_id": schedule.id,
-                        "course_name": schedule.course_name.object_name,
-                        "date": schedule.start_time.strftime("%d/%m/%Y"),
-                        "time": f"{schedule.start_time.strftime('%H:%M')} - {schedule.end_time.strftime('%H:%M')}",
-                        "status": "Chưa điểm danh",
-                        "minutes_late": 0
-                    })
-            
+
             class_stats.append({
                 "class_id": class_obj.id,
                 "class_name": class_obj.class_name,
@@ -211,7 +241,7 @@ class ScheduleQRViewSet(viewsets.ModelViewSet):
                 "present_count": present,
                 "late_count": late,
                 "attendance_rate": f"{attendance_rate:.1f}%",
-                "schedules": schedule_details
+                "schedules": schedules_by_class[class_obj.id]
             })
         
         return Response({
@@ -0,0 +1,105 @@
+"""
+Ảnh mã QR được lưu theo nội dung (content-addressed).
+
+Đường dẫn ảnh được suy ra từ sha256 của dữ liệu QR: qr_codes/<2 ký tự đầu>/<hash>.png.
+Hai lịch học (hoặc hai lần lưu) có cùng dữ liệu QR dùng chung một file và ảnh chỉ được vẽ một lần.
+
+Ảnh mã QR xoay vòng (rotating_qr_image) không ghi ra storage: ảnh được vẽ trong bộ nhớ
+và giữ trong cache dùng chung theo lịch học và cửa sổ thời gian, mỗi cửa sổ chỉ vẽ một lần.
+"""
+import hashlib
+import threading
+from io import BytesIO
+
+import qrcode
+import qrcode.image.svg
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from .qr_payload import rotating_payload
+
+# Định dạng ảnh QR xoay vòng: content type
+QR_IMAGE_TYPES = {
+    'svg': 'image/svg+xml',
+    'png': 'image/png',
+}
+ROTATING_KEY = 'qr:rotating:{}:{}:{}'
+
+_render_lock = threading.Lock()
+
+
+def qr_payload_hash(data):
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def qr_image_path(data):
+    """Đường dẫn (trong MEDIA_ROOT) của ảnh QR ứng với dữ liệu `data`"""
+    digest = qr_payload_hash(data)
+    return f'qr_codes/{digest[:2]}/{digest}.png'
+
+
+def render_qr_png(data):
+    """Vẽ mã QR thành ảnh PNG, trả về bytes"""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    img = qr.make_image(fill_color="black", back_color="white")
+    buffer = BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def render_qr_svg(data):
+    """Vẽ mã QR thành ảnh SVG (không cần Pillow), trả về bytes"""
+    qr = qrcode.QRCode(
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        border=4,
+        image_factory=qrcode.image.svg.SvgPathImage,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr.make_image().to_string()
+
+
+RENDERERS = {
+    'svg': render_qr_svg,
+    'png': render_qr_png,
+}
+
+
+def rotating_qr_image(schedule_id, kind='svg', now=None):
+    """
+    (ảnh, thời điểm kết thúc cửa sổ) của mã QR xoay vòng hiện tại của lịch học, `kind` là 'svg' hoặc 'png'.
+    Ảnh được cache tới hết cửa sổ; trong một tiến trình chỉ một luồng vẽ ảnh khi cache chưa có.
+    """
+    token, window, window_end = rotating_payload(schedule_id, now)
+    key = ROTATING_KEY.format(kind, schedule_id, window)
+    image = cache.get(key)
+    if image is None:
+        with _render_lock:
+            image = cache.get(key)
+            if image is None:
+                image = RENDERERS[kind](token)
+                cache.set(key, image, settings.QR_ROTATION_INTERVAL + 1)
+    return image, window_end
+
+
+def save_qr_image(data, storage=None):
+    """Đảm bảo ảnh QR của `data` đã có trong storage, chỉ vẽ khi chưa có. Trả về đường dẫn ảnh."""
+    storage = storage or default_storage
+    path = qr_image_path(data)
+    if storage.exists(path):
+        return path
+    name = storage.save(path, ContentFile(render_qr_png(data)))
+    if name != path:
+        # Một worker khác vừa ghi cùng ảnh, storage đã đổi tên file: bỏ bản trùng
+        storage.delete(name)
+    return path
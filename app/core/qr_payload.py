@@ -0,0 +1,157 @@
+"""
+Dữ liệu mã QR điểm danh: chuỗi base64url ngắn, có phiên bản và được ký bằng HMAC.
+
+Cấu trúc (21 byte, 28 ký tự base64url):
+    phiên bản (1 byte) | schedule_id (4 byte) | ngày buổi học (2 byte) | hết hạn (4 byte) | HMAC (10 byte)
+- Ngày buổi học tính theo số ngày kể từ 2000-01-01 cộng 1; 0 nghĩa là dùng được cho mọi buổi của lịch học.
+- Hết hạn là Unix timestamp (giây).
+- HMAC-SHA256 (salted_hmac của Django, khóa QR_SIGNING_KEY hoặc SECRET_KEY) cắt còn 10 byte.
+
+Mã giả mạo, sai định dạng hoặc hết hạn bị từ chối ngay trong verify_payload(), không cần truy cập CSDL.
+Mã dạng cũ (str(dict) của lịch học, không có chữ ký nên ai cũng tự viết được) bị từ chối. Chỉ khi
+bật QR_ACCEPT_LEGACY_PAYLOAD và chưa quá ngày QR_LEGACY_PAYLOAD_UNTIL thì mã dạng cũ mới được chấp nhận,
+để các mã đã in trước đây dùng được trong thời gian chuyển đổi.
+
+Ngoài mã cố định của lịch học (schedule_payload), rotating_payload() sinh mã xoay vòng chỉ dùng được
+cho buổi học hôm nay và trong cửa sổ thời gian hiện tại (QR_ROTATION_INTERVAL giây, cộng thêm
+QR_ROTATION_GRACE giây cho độ trễ khi quét). Mã được suy ra xác định từ lịch học và cửa sổ thời gian,
+nên mọi tiến trình sinh cùng một mã cho cùng một cửa sổ mà không cần lưu trạng thái.
+Khi bật QR_REQUIRE_ROTATING_TOKEN, parse_qr_data() chỉ chấp nhận mã xoay vòng: mã cố định (dùng được
+cả học kỳ, nên ảnh chụp mã in sẵn vẫn điểm danh được) và mã dạng cũ bị từ chối.
+"""
+import base64
+import binascii
+import json
+import struct
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from typing import Optional
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+PAYLOAD_VERSION = 1
+KEY_SALT = 'core.qr_payload'
+MAC_SIZE = 10
+EPOCH_DATE = date(2000, 1, 1)
+
+# phiên bản, schedule_id, ngày buổi học, hết hạn
+_HEADER = struct.Struct('>BIHI')
+PAYLOAD_SIZE = _HEADER.size + MAC_SIZE
+TOKEN_LENGTH = (PAYLOAD_SIZE * 4 + 2) // 3
+
+
+class InvalidQRPayload(ValueError):
+    """Mã QR không hợp lệ; thông điệp dùng để trả về cho người dùng"""
+
+
+@dataclass(frozen=True)
+class QRPayload:
+    schedule_id: int
+    # None: mã dùng cho mọi buổi của lịch học
+    occurrence: Optional[date] = None
+    # None với mã dạng cũ (không có hạn dùng)
+    expires_at: Optional[datetime] = None
+    legacy: bool = False
+
+
+def _mac(message):
+    secret = getattr(settings, 'QR_SIGNING_KEY', None) or settings.SECRET_KEY
+    return salted_hmac(KEY_SALT, message, secret=secret, algorithm='sha256').digest()[:MAC_SIZE]
+
+
+def sign_payload(schedule_id, expires_at, occurrence=None):
+    """Chuỗi base64url đã ký cho lịch học `schedule_id`, hết hạn lúc `expires_at`"""
+    day = (occurrence - EPOCH_DATE).days + 1 if occurrence is not None else 0
+    message = _HEADER.pack(PAYLOAD_VERSION, schedule_id, day, int(expires_at.timestamp()))
+    return base64.urlsafe_b64encode(message + _mac(message)).rstrip(b'=').decode('ascii')
+
+
+def verify_payload(token, now=None):
+    """Giải mã và kiểm tra chữ ký, hạn dùng và ngày buổi học của mã QR. Lỗi: InvalidQRPayload"""
+    if len(token) != TOKEN_LENGTH:
+        raise InvalidQRPayload("Mã QR không hợp lệ")
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+    except (binascii.Error, ValueError):
+        raise InvalidQRPayload("Mã QR không hợp lệ")
+    message, mac = raw[:_HEADER.size], raw[_HEADER.size:]
+    if len(raw) != PAYLOAD_SIZE or raw[0] != PAYLOAD_VERSION:
+        raise InvalidQRPayload("Mã QR không hợp lệ")
+    if not constant_time_compare(mac, _mac(message)):
+        raise InvalidQRPayload("Mã QR không hợp lệ")
+
+    _, schedule_id, day, expires = _HEADER.unpack(message)
+    now = now or timezone.now()
+    if now.timestamp() >= expires:
+        raise InvalidQRPayload("Mã QR đã hết hạn")
+    occurrence = EPOCH_DATE + timedelta(days=day - 1) if day else None
+    if occurrence is not None and occurrence != timezone.localdate(now):
+        raise InvalidQRPayload("Mã QR không dành cho buổi học hôm nay")
+    return QRPayload(schedule_id, occurrence, datetime.fromtimestamp(expires, tz=dt_timezone.utc))
+
+
+def legacy_payload_allowed(now=None):
+    """Có chấp nhận mã dạng cũ không: chỉ khi bật QR_ACCEPT_LEGACY_PAYLOAD và chưa quá QR_LEGACY_PAYLOAD_UNTIL"""
+    if not getattr(settings, 'QR_ACCEPT_LEGACY_PAYLOAD', False):
+        return False
+    until = getattr(settings, 'QR_LEGACY_PAYLOAD_UNTIL', None)
+    return until is not None and timezone.localdate(now) <= until
+
+
+def _parse_legacy(qr_data, now=None):
+    """Mã dạng cũ: str(dict) có khóa 'schedule_id'"""
+    if not legacy_payload_allowed(now):
+        raise InvalidQRPayload("Mã QR đã cũ, vui lòng quét mã mới của buổi học")
+    try:
+        schedule_id = json.loads(qr_data.replace("'", '"')).get('schedule_id')
+    except (json.JSONDecodeError, AttributeError):
+        raise InvalidQRPayload("Mã QR không hợp lệ")
+    if not isinstance(schedule_id, int):
+        raise InvalidQRPayload("Mã QR không hợp lệ")
+    return QRPayload(schedule_id, legacy=True)
+
+
+def parse_qr_data(qr_data, now=None):
+    """QRPayload của dữ liệu quét được từ mã QR (dạng mới hoặc dạng cũ)"""
+    qr_data = qr_data.strip()
+    if qr_data.startswith('{'):
+        payload = _parse_legacy(qr_data, now)
+    else:
+        payload = verify_payload(qr_data, now)
+    if getattr(settings, 'QR_REQUIRE_ROTATING_TOKEN', False) and not is_rotating(payload, now):
+        raise InvalidQRPayload("Vui lòng quét mã QR đang chiếu trên màn hình lớp học")
+    return payload
+
+
+def schedule_payload(schedule_id, end_date):
+    """Mã QR cố định của lịch học: dùng cho mọi buổi, hết hạn khi hết ngày `end_date` (giờ địa phương)"""
+    expires_at = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min))
+    return sign_payload(schedule_id, expires_at)
+
+
+def rotation_window(now=None):
+    """(số thứ tự cửa sổ thời gian hiện tại, thời điểm kết thúc cửa sổ)"""
+    interval = settings.QR_ROTATION_INTERVAL
+    window = int((now or timezone.now()).timestamp() // interval)
+    return window, datetime.fromtimestamp((window + 1) * interval, tz=dt_timezone.utc)
+
+
+def is_rotating(payload, now=None):
+    """
+    Mã có gắn với cửa sổ xoay vòng hiện tại không: mã của buổi học hôm nay, hết hạn không muộn hơn
+    cửa sổ hiện tại cộng QR_ROTATION_GRACE (mã đã hết hạn bị verify_payload() từ chối trước đó)
+    """
+    if payload.legacy or payload.occurrence is None or payload.expires_at is None:
+        return False
+    _, window_end = rotation_window(now)
+    return payload.expires_at <= window_end + timedelta(seconds=settings.QR_ROTATION_GRACE)
+
+
+def rotating_payload(schedule_id, now=None):
+    """(mã QR xoay vòng, số thứ tự cửa sổ, thời điểm kết thúc cửa sổ) của lịch học cho thời điểm `now`"""
+    now = now or timezone.now()
+    window, window_end = rotation_window(now)
+    expires_at = window_end + timedelta(seconds=settings.QR_ROTATION_GRACE)
+    return sign_payload(schedule_id, expires_at, timezone.localdate(now)), window, window_end
@@ -0,0 +1,212 @@
+"""
+Luồng sự kiện điểm danh thời gian thực (Server-Sent Events) cho giáo viên.
+
+- Hub: pub/sub trong tiến trình. Mỗi người theo dõi là một asyncio.Queue có giới hạn trên event loop
+  của ASGI server, nên hàng nghìn kết nối đang chờ không tốn một thread nào. dispatch() an toàn
+  khi gọi từ thread khác (thread xử lý request đồng bộ): sự kiện được định dạng text/event-stream
+  một lần, mỗi event loop chỉ nhận một callback cho mỗi sự kiện, callback đó đưa chuỗi đã định dạng
+  vào hàng đợi của mọi người theo dõi trên loop.
+- Broker: chuyển sự kiện tới Hub của mọi tiến trình, chọn bằng settings.REALTIME_BROKER.
+  LocalBroker chỉ dùng cho một tiến trình (runserver, một worker ASGI); RedisBroker dùng Redis
+  pub/sub khi chạy nhiều worker.
+- publish_checkins(): được upsert_checkins (core/checkin.py) gọi sau khi transaction được commit.
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'attendance:{}'
+
+
+def schedule_channel(schedule_id):
+    return CHANNEL.format(schedule_id)
+
+
+class Subscription:
+    """Hàng đợi sự kiện (đã định dạng) của một người theo dõi; tạo bên trong event loop sẽ đọc nó"""
+
+    def __init__(self, hub, channel, maxsize):
+        self.hub = hub
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        # Số sự kiện bị bỏ vì người theo dõi đọc quá chậm (hàng đợi đầy)
+        self.dropped = 0
+
+    def deliver(self, chunk):
+        """Chạy trên event loop của người theo dõi"""
+        try:
+            self.queue.put_nowait(chunk)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def get(self, timeout=None):
+        """
+        Các sự kiện đang chờ ghép thành một chuỗi (chờ sự kiện tiếp theo nếu chưa có),
+        hoặc asyncio.TimeoutError sau `timeout` giây
+        """
+        items = [] if not self.queue.empty() else [await asyncio.wait_for(self.queue.get(), timeout)]
+        while not self.queue.empty():
+            items.append(self.queue.get_nowait())
+        return ''.join(items)
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class Hub:
+    """Pub/sub trong tiến trình: kênh -> tập người theo dõi"""
+
+    def __init__(self):
+        self._channels = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel, maxsize=100):
+        subscription = Subscription(self, channel, maxsize)
+        with self._lock:
+            self._channels[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._channels.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._channels[subscription.channel]
+
+    def subscriber_count(self, channel=None):
+        with self._lock:
+            if channel is not None:
+                return len(self._channels.get(channel, ()))
+            return sum(len(subscribers) for subscribers in self._channels.values())
+
+    def dispatch(self, channel, message):
+        """Gửi `message` tới mọi người theo dõi `channel` trong tiến trình; gọi được từ bất kỳ thread nào"""
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        if not subscribers:
+            return
+        chunk = format_event(message)
+        by_loop = defaultdict(list)
+        for subscription in subscribers:
+            by_loop[subscription.loop].append(subscription)
+        for loop, group in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(_deliver_all, group, chunk)
+            except RuntimeError:
+                # Event loop đã đóng: các kết nối của loop đó không còn người đọc
+                for subscription in group:
+                    self.unsubscribe(subscription)
+
+
+def _deliver_all(subscriptions, chunk):
+    for subscription in subscriptions:
+        subscription.deliver(chunk)
+
+
+class LocalBroker:
+    """Chỉ phát tới Hub của tiến trình hiện tại"""
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    def publish(self, channel, message):
+        self.hub.dispatch(channel, message)
+
+
+class RedisBroker:
+    """
+    Phát qua Redis pub/sub (REALTIME_BROKER_URL). Mỗi tiến trình có một thread nghe mọi kênh
+    điểm danh và chuyển sự kiện vào Hub của tiến trình đó.
+    """
+
+    PREFIX = 'utt:realtime:'
+
+    def __init__(self, hub):
+        import redis
+
+        self.hub = hub
+        self.client = redis.Redis.from_url(settings.REALTIME_BROKER_URL)
+        self._thread = threading.Thread(target=self._listen, name='realtime-broker', daemon=True)
+        self._thread.start()
+
+    def publish(self, channel, message):
+        self.client.publish(self.PREFIX + channel, json.dumps(message))
+
+    def _listen(self):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe(self.PREFIX + '*')
+        for item in pubsub.listen():
+            try:
+                channel = item['channel'].decode('utf-8')[len(self.PREFIX):]
+                self.hub.dispatch(channel, json.loads(item['data']))
+            except Exception:
+                logger.exception("Sự kiện thời gian thực không hợp lệ")
+
+
+hub = Hub()
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.REALTIME_BROKER)(hub)
+    return _broker
+
+
+def checkin_event(attendance):
+    return {
+        'id': attendance.id,
+        'schedule_id': attendance.schedule_id,
+        'student_id': attendance.student_id,
+        'timestamp': attendance.timestamp.isoformat() if attendance.timestamp else None,
+        'is_late': attendance.is_late,
+        'minutes_late': attendance.minutes_late,
+        'is_in_location': attendance.is_in_location,
+    }
+
+
+def publish_checkins(attendances):
+    """Phát sự kiện cho các lượt điểm danh đã được ghi; lỗi của broker không ảnh hưởng tới điểm danh"""
+    try:
+        broker = get_broker()
+        for attendance in attendances:
+            broker.publish(schedule_channel(attendance.schedule_id), checkin_event(attendance))
+    except Exception:
+        logger.exception("Không phát được sự kiện điểm danh")
+
+
+def format_event(message, event='checkin'):
+    """Một sự kiện theo định dạng text/event-stream"""
+    return f"id: {message['id']}\nevent: {event}\ndata: {json.dumps(message)}\n\n"
+
+
+async def event_stream(channel, keepalive=None):
+    """
+    Async iterator cho StreamingHttpResponse: các sự kiện của `channel`, xen kẽ dòng chú thích giữ kết nối
+    sau mỗi `keepalive` giây không có sự kiện. Người theo dõi được gỡ khỏi Hub khi client ngắt kết nối.
+    """
+    keepalive = keepalive or settings.REALTIME_KEEPALIVE
+    subscription = hub.subscribe(channel, settings.REALTIME_QUEUE_SIZE)
+    get_broker()
+    try:
+        yield f"retry: {settings.REALTIME_RETRY_MS}\n\n"
+        while True:
+            try:
+                yield await subscription.get(keepalive)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+    finally:
+        subscription.close()
@@ -0,0 +1,261 @@
+"""
+Xác định vai trò người dùng (admin / sinh viên / giáo viên) một lần cho mỗi request.
+
+User, Student và Teacher được nạp bằng một truy vấn select_related. Kết quả được gắn vào user
+nên các truy cập user.student / user.teacher sau đó (kể cả khi không tồn tại) không tốn thêm truy vấn.
+- RoleMiddleware gắn request.role (nạp lười, sau khi đã xác thực).
+- RoleJWTAuthentication lấy user cùng student / teacher từ ảnh chụp trong cache (user_snapshots),
+  chỉ truy vấn khi ảnh chụp chưa có hoặc khác vai trò ghi trong token.
+- Token được ký kèm vai trò và id sinh viên / giáo viên lúc cấp (role_claims, core/serializers.py).
+"""
+from dataclasses import dataclass
+from typing import Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import transaction
+from django.utils.functional import SimpleLazyObject
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .cache import CachedLoader
+from .models import Student, Teacher, User
+
+ADMIN = 'admin'
+STUDENT = 'student'
+TEACHER = 'teacher'
+USER = 'user'
+ANONYMOUS = 'anonymous'
+
+# Các quan hệ một-một ngược của User cần nạp cùng user
+ROLE_RELATIONS = ('student', 'teacher')
+
+# Claim vai trò trong JWT
+ROLE_CLAIM = 'role'
+STUDENT_ID_CLAIM = 'student_id'
+TEACHER_ID_CLAIM = 'teacher_id'
+ROLE_CLAIMS = (ROLE_CLAIM, STUDENT_ID_CLAIM, TEACHER_ID_CLAIM)
+
+
+@dataclass(frozen=True)
+class UserRole:
+    name: str
+    user: Optional[User] = None
+    student: Optional[Student] = None
+    teacher: Optional[Teacher] = None
+
+    @property
+    def is_admin(self):
+        return self.name == ADMIN
+
+    @property
+    def is_student(self):
+        return self.student is not None
+
+    @property
+    def is_teacher(self):
+        return self.teacher is not None
+
+
+def _cached_relation(user, name):
+    """Trả về (đã nạp hay chưa, đối tượng liên quan hoặc None) mà không truy vấn"""
+    cache = user._state.fields_cache
+    if name not in cache:
+        return False, None
+    return True, cache[name]
+
+
+def load_role_relations(user):
+    """Nạp student / teacher của user trong một truy vấn nếu chưa được nạp"""
+    if all(_cached_relation(user, name)[0] for name in ROLE_RELATIONS):
+        return user
+    loaded = User.objects.select_related(*ROLE_RELATIONS).get(pk=user.pk)
+    for name in ROLE_RELATIONS:
+        user._state.fields_cache[name] = loaded._state.fields_cache.get(name)
+    return user
+
+
+def resolve_role(user):
+    """Xác định vai trò của user, ưu tiên admin rồi sinh viên rồi giáo viên"""
+    if user is None or not user.is_authenticated:
+        return UserRole(ANONYMOUS)
+
+    load_role_relations(user)
+    student = _cached_relation(user, 'student')[1]
+    teacher = _cached_relation(user, 'teacher')[1]
+
+    if user.is_superuser:
+        name = ADMIN
+    elif student is not None:
+        name = STUDENT
+    elif teacher is not None:
+        name = TEACHER
+    else:
+        name = USER
+    return UserRole(name, user=user, student=student, teacher=teacher)
+
+
+def role_claims(user):
+    """Các claim vai trò của user để ký vào token"""
+    role = resolve_role(user)
+    return {
+        ROLE_CLAIM: role.name,
+        STUDENT_ID_CLAIM: role.student.pk if role.student is not None else None,
+        TEACHER_ID_CLAIM: role.teacher.pk if role.teacher is not None else None,
+    }
+
+
+def add_role_claims(token, user):
+    for claim, value in role_claims(user).items():
+        token[claim] = value
+    return token
+
+
+def _user_snapshot_queryset(user_id):
+    # Không nạp mã băm mật khẩu vào cache dùng chung: user.password được nạp lười từ CSDL khi cần
+    # (vd. CHECK_REVOKE_TOKEN), user.save() không ghi đè trường chưa nạp
+    return (
+        User.objects.select_related(*ROLE_RELATIONS)
+        .defer('password')
+        .filter(**{api_settings.USER_ID_FIELD: user_id})
+    )
+
+
+def load_user_snapshot(user_id):
+    return _user_snapshot_queryset(user_id).first()
+
+
+async def aload_user_snapshot(user_id):
+    return await _user_snapshot_queryset(user_id).afirst()
+
+
+# User cùng student / teacher đã nạp, cho RoleJWTAuthentication. Ảnh chụp bị xoá bởi các signal
+# trong core/signals.py khi User, Student hoặc Teacher thay đổi
+user_snapshots = CachedLoader(
+    'user',
+    load=load_user_snapshot,
+    timeout_setting='USER_SNAPSHOT_TTL',
+    default_timeout=60,
+    aload=aload_user_snapshot,
+    # User bị khoá / đổi vai trò phải có hiệu lực ngay ở mọi worker: không dùng cache trong bộ nhớ tiến trình
+    shared_only=True,
+)
+
+
+def invalidate_user_snapshots(user_ids):
+    # Xoá lại sau khi commit: request khác có thể đã nạp dữ liệu cũ vào cache trước khi transaction kết thúc
+    user_ids = list(user_ids)
+    user_snapshots.invalidate(user_ids)
+    transaction.on_commit(lambda: user_snapshots.invalidate(user_ids))
+
+
+def get_role(request):
+    """
+    Vai trò của người dùng trong request, chỉ xác định một lần.
+    Nhận cả HttpRequest lẫn Request của DRF; kết quả được lưu trên HttpRequest gốc.
+    """
+    http_request = getattr(request, '_request', request)
+    user = request.user
+    role = getattr(http_request, '_cached_role', None)
+    if role is None or role.user is not user:
+        role = resolve_role(user)
+        http_request._cached_role = role
+    return role
+
+
+class RoleMiddleware:
+    """
+    Gắn request.role, được xác định khi truy cập lần đầu (sau khi DRF đã xác thực JWT).
+    Dùng được cả đồng bộ lẫn async: dưới ASGI không cần chuyển sang thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.role = SimpleLazyObject(lambda: get_role(request))
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        request.role = SimpleLazyObject(lambda: get_role(request))
+        return await self.get_response(request)
+
+
+class RoleJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication lấy user cùng student / teacher từ ảnh chụp trong cache, không truy vấn khi trúng cache.
+    Token có claim vai trò mà khác ảnh chụp (ảnh chụp đã cũ, hoặc vai trò đổi sau khi cấp token)
+    thì ảnh chụp được nạp lại từ CSDL; vai trò trong CSDL luôn là căn cứ phân quyền.
+    aauthenticate() dùng cho view async: token được kiểm tra ngay trong event loop.
+    """
+
+    def _user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+    def _load_user(self, validated_token):
+        user_id = self._user_id(validated_token)
+        user = user_snapshots.get(user_id)
+        if user is not None and not self._claims_match(user, validated_token):
+            user = user_snapshots.refresh([user_id]).get(user.pk)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        return user
+
+    @staticmethod
+    def _claims_match(user, validated_token):
+        # Token cấp trước khi có claim vai trò thì không so sánh
+        if ROLE_CLAIM not in validated_token:
+            return True
+        return role_claims(user) == {claim: validated_token.get(claim) for claim in ROLE_CLAIMS}
+
+    def _check_user(self, user, validated_token):
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+        return user
+
+    def get_user(self, validated_token):
+        return self._check_user(self._load_user(validated_token), validated_token)
+
+    async def _aload_user(self, validated_token):
+        # Như _load_user(): đọc cache bằng cache.aget, nạp từ CSDL bằng ORM async khi trượt
+        user_id = self._user_id(validated_token)
+        user = await user_snapshots.aget(user_id)
+        if user is not None and not self._claims_match(user, validated_token):
+            await user_snapshots.ainvalidate([user_id])
+            user = await user_snapshots.aget(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        return user
+
+    async def aget_user(self, validated_token):
+        return self._check_user(await self._aload_user(validated_token), validated_token)
+
+    async def aauthenticate(self, request):
+        """Như authenticate(): (user, token) hoặc None nếu request không có JWT"""
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
@@ -0,0 +1,118 @@
+"""
+Duy trì bảng tổng hợp điểm danh theo ngày (AttendanceDailyRollup).
+
+Mỗi khi một bản ghi Attendance được lưu hoặc xoá, chỉ khóa (ngày, lịch học) của bản ghi đó
+được tính lại bằng một truy vấn gom nhóm và ghi bằng một câu lệnh upsert.
+Các đường ghi hàng loạt (bulk_create, update) không phát signal nên phải tự gọi
+refresh_rollups() với các khóa bị ảnh hưởng.
+
+Việc tính lại các khóa của cùng một lịch học được thực hiện lần lượt: refresh_rollups() khóa dòng
+Schedule (SELECT ... FOR UPDATE) trước khi gom nhóm, nên hai lượt điểm danh đồng thời không ghi đè
+số liệu của nhau bằng kết quả gom nhóm cũ.
+"""
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Attendance, AttendanceDailyRollup, Schedule
+
+COUNTERS = ['total', 'present', 'late', 'absent']
+
+
+def rollup_key(attendance):
+    """Khóa (ngày theo múi giờ hiện tại, schedule_id) của một bản ghi điểm danh"""
+    return timezone.localdate(attendance.timestamp), attendance.schedule_id
+
+
+def _aggregate(queryset):
+    return (
+        queryset
+        .annotate(day=TruncDate('timestamp'))
+        .values('day', 'schedule_id', 'schedule__class_name_id')
+        .annotate(
+            total=Count('id'),
+            present=Count('id', filter=Q(is_present=True)),
+            late=Count('id', filter=Q(is_late=True)),
+        )
+    )
+
+
+def _build_rows(rows, rollup_model=AttendanceDailyRollup):
+    return [
+        rollup_model(
+            date=row['day'],
+            schedule_id=row['schedule_id'],
+            class_name_id=row['schedule__class_name_id'],
+            total=row['total'],
+            present=row['present'],
+            late=row['late'],
+            absent=row['total'] - row['present'],
+        )
+        for row in rows
+    ]
+
+
+def refresh_rollups(keys):
+    """Tính lại các khóa (date, schedule_id) từ bảng Attendance"""
+    keys = set(keys)
+    if not keys:
+        return
+    with transaction.atomic():
+        _lock_schedules({schedule_id for _, schedule_id in keys})
+        _refresh(keys)
+
+
+def _lock_schedules(schedule_ids):
+    # Khóa theo thứ tự khóa chính để hai transaction khóa nhiều lịch học không chờ lẫn nhau.
+    # SQLite bỏ qua FOR UPDATE, các transaction ghi của SQLite vốn đã chạy lần lượt
+    list(Schedule.objects.select_for_update().filter(pk__in=schedule_ids).order_by('pk').values_list('pk', flat=True))
+
+
+def _refresh(keys):
+    key_filter = Q()
+    for day, schedule_id in keys:
+        key_filter |= Q(timestamp__date=day, schedule_id=schedule_id)
+    rows = _build_rows(_aggregate(Attendance.objects.filter(key_filter)))
+
+    # Xoá dòng tổng hợp của khóa không còn bản ghi điểm danh (hoặc lịch học đã đổi lớp)
+    stale = Q()
+    for day, schedule_id in keys:
+        stale |= Q(date=day, schedule_id=schedule_id)
+    for row in rows:
+        stale &= ~Q(date=row.date, schedule_id=row.schedule_id, class_name_id=row.class_name_id)
+    AttendanceDailyRollup.objects.filter(stale).delete()
+
+    if rows:
+        AttendanceDailyRollup.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['date', 'schedule', 'class_name'],
+            update_fields=COUNTERS,
+        )
+
+
+def refresh_schedule_rollups(schedule_ids):
+    """Tính lại mọi ngày của các lịch học, vd. khi lịch học đổi lớp"""
+    schedule_ids = list(schedule_ids)
+    keys = set(
+        AttendanceDailyRollup.objects.filter(schedule_id__in=schedule_ids).values_list('date', 'schedule_id')
+    )
+    keys.update(
+        Attendance.objects.filter(schedule_id__in=schedule_ids)
+        .annotate(day=TruncDate('timestamp'))
+        .values_list('day', 'schedule_id')
+        .distinct()
+    )
+    refresh_rollups(keys)
+
+
+def rebuild_rollups(batch_size=1000, attendance_model=Attendance, rollup_model=AttendanceDailyRollup):
+    """
+    Xoá và dựng lại toàn bộ bảng tổng hợp, trả về số dòng đã tạo.
+    Migration truyền model lịch sử (apps.get_model) qua `attendance_model` / `rollup_model`.
+    """
+    rollup_model.objects.all().delete()
+    rows = _build_rows(_aggregate(attendance_model.objects.all()).order_by(), rollup_model)
+    rollup_model.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
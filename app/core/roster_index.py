@@ -0,0 +1,99 @@
+"""
+Chỉ mục danh sách sinh viên của một lớp, gọn để lưu trong cache (core/cache.py class_rosters).
+
+Khi các id sinh viên đủ dày (thường gặp vì sinh viên một khoá được tạo liên tiếp), chỉ mục là bitmap
+bắt đầu từ id nhỏ nhất, mỗi id một bit; kiểm tra thành viên là O(1). Khi các id thưa (bitmap lớn hơn
+mảng id), chỉ mục là mảng id đã sắp xếp, kiểm tra bằng tìm kiếm nhị phân.
+"""
+from array import array
+from bisect import bisect_left
+
+
+def _bits_to_ids(value, base):
+    """Các id ứng với những bit bằng 1 của số nguyên `value`, tính từ `base`"""
+    ids = []
+    while value:
+        lowest = value & -value
+        ids.append(base + lowest.bit_length() - 1)
+        value ^= lowest
+    return ids
+
+
+class RosterIndex:
+    __slots__ = ('base', 'bitmap', 'ids', 'count')
+
+    def __init__(self, student_ids=()):
+        ordered = sorted(set(student_ids))
+        self.count = len(ordered)
+        self.base = ordered[0] if ordered else 0
+        self.bitmap = None
+        self.ids = None
+        span = ordered[-1] - self.base + 1 if ordered else 0
+        # Mảng id tốn 8 byte mỗi sinh viên, bitmap tốn span / 8 byte
+        if ordered and (span + 7) // 8 <= 8 * len(ordered):
+            bits = bytearray((span + 7) // 8)
+            for student_id in ordered:
+                offset = student_id - self.base
+                bits[offset >> 3] |= 1 << (offset & 7)
+            self.bitmap = bytes(bits)
+        else:
+            self.ids = array('q', ordered)
+
+    def __contains__(self, student_id):
+        if self.bitmap is not None:
+            offset = student_id - self.base
+            return 0 <= offset < 8 * len(self.bitmap) and bool(self.bitmap[offset >> 3] & (1 << (offset & 7)))
+        index = bisect_left(self.ids, student_id)
+        return index < len(self.ids) and self.ids[index] == student_id
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        if self.bitmap is not None:
+            return iter(_bits_to_ids(int.from_bytes(self.bitmap, 'little'), self.base))
+        return iter(self.ids)
+
+    def __eq__(self, other):
+        if not isinstance(other, RosterIndex):
+            return NotImplemented
+        return self.count == other.count and list(self) == list(other)
+
+    def __reduce__(self):
+        # Chỉ lưu dữ liệu thô, gọn hơn pickle mặc định của __slots__
+        if self.bitmap is not None:
+            return _restore, (self.base, self.count, self.bitmap, None)
+        return _restore, (self.base, self.count, None, self.ids.tobytes())
+
+    def __repr__(self):
+        kind = 'bitmap' if self.bitmap is not None else 'array'
+        return f"<RosterIndex {kind} {self.count} sinh viên>"
+
+    @property
+    def nbytes(self):
+        """Kích thước dữ liệu của chỉ mục (byte)"""
+        return len(self.bitmap) if self.bitmap is not None else self.ids.itemsize * len(self.ids)
+
+    def diff(self, other):
+        """(id có trong `other` mà không có ở đây, id có ở đây mà không có trong `other`), đã sắp xếp"""
+        if self.bitmap is not None and other.bitmap is not None:
+            # Hai bitmap: dời về cùng gốc rồi XOR
+            base = min(self.base, other.base)
+            mine = int.from_bytes(self.bitmap, 'little') << (self.base - base)
+            theirs = int.from_bytes(other.bitmap, 'little') << (other.base - base)
+            changed = mine ^ theirs
+            return _bits_to_ids(changed & theirs, base), _bits_to_ids(changed & mine, base)
+        mine, theirs = set(self), set(other)
+        return sorted(theirs - mine), sorted(mine - theirs)
+
+
+def _restore(base, count, bitmap, ids):
+    index = RosterIndex.__new__(RosterIndex)
+    index.base = base
+    index.count = count
+    index.bitmap = bitmap
+    index.ids = None
+    if ids is not None:
+        index.ids = array('q')
+        index.ids.frombytes(ids)
+    return index
@@ -1,8 +1,19 @@
+from django.db import models
 from rest_framework import serializers
-from .models import User, Student, Teacher, Class, Classroom, Object, Schedule, Attendance, Weekday
+from .models import User, Student, Teacher, Class, Classroom, Object, Schedule, Attendance, Weekday, ScheduleOccurrence
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
+from django.conf import settings
 from django.utils import timezone
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from .occurrences import build_occurrences
+from .roles import add_role_claims, get_role, user_snapshots
+from .timetable import (
+    build_schedule, create_attendance_placeholders, create_schedules,
+    find_room_conflicts, missing_references,
+)
 
 class UserSerializer(serializers.ModelSerializer):
     """Serializer cho model User với đầy đủ thông tin cá nhân"""
@@ -62,6 +73,25 @@ class UserCreateSerializer(serializers.ModelSerializer):
 
         return user
 
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Đăng nhập (POST /auth/jwt/create/): token được ký kèm vai trò và id sinh viên / giáo viên"""
+
+    @classmethod
+    def get_token(cls, user):
+        return add_role_claims(super().get_token(user), user)
+
+
+class RoleTokenRefreshSerializer(TokenRefreshSerializer):
+    """Làm mới token (POST /auth/jwt/refresh/): access token mới mang vai trò hiện tại của user"""
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        access = AccessToken(data['access'])
+        user = user_snapshots.get(access[jwt_settings.USER_ID_CLAIM])
+        if user is not None:
+            data['access'] = str(add_role_claims(access, user))
+        return data
+
 class ChangePasswordSerializer(serializers.Serializer):
     """Serializer cho việc thay đổi mật khẩu"""
     old_password = serializers.CharField(required=True)
@@ -112,11 +142,24 @@ class ClassSerializer(serializers.ModelSerializer):
         return obj.teachers.count()
 
 
+class ClassListSerializer(serializers.ModelSerializer):
+    """
+    Serializer cho danh sách lớp học (core ClassViewSet).
+    students_count / teachers_count được tính sẵn bằng annotate (xem annotate_member_counts).
+    """
+    students_count = serializers.IntegerField(read_only=True)
+    teachers_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Class
+        fields = ['id', 'class_code', 'class_name', 'students_count', 'teachers_count']
+
+
 class ClassroomSerializer(serializers.ModelSerializer):
     """Serializer cho Classroom"""
     class Meta:
         model = Classroom
-        fields = ['id', 'classroom_code', 'class_name', 'latitude', 'longitude']
+        fields = ['id', 'classroom_code', 'class_name', 'latitude', 'longitude', 'geofence_radius', 'geofence_polygon']
         read_only_fields = ['id', 'classroom_code']
 
 
@@ -172,6 +215,32 @@ class AttendanceSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'timestamp']
 
+def attendance_status_map(student, schedules):
+    """{schedule_id: is_present} của sinh viên cho các lịch học, một truy vấn IN"""
+    schedule_ids = [schedule.pk for schedule in schedules]
+    if student is None or not schedule_ids:
+        return {}
+    return dict(
+        Attendance.objects.filter(student=student, schedule_id__in=schedule_ids)
+        .order_by('id')
+        .values_list('schedule_id', 'is_present')
+    )
+
+
+class StudentScheduleListSerializer(serializers.ListSerializer):
+    """Nạp trạng thái điểm danh của cả danh sách một lần trước khi serialize từng lịch học"""
+
+    def to_representation(self, data):
+        schedules = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        if 'attendance_map' not in self.context:
+            request = self.context.get('request')
+            student = None
+            if request and request.user.is_authenticated:
+                student = get_role(request).student
+            self.child.attendance_map = attendance_status_map(student, schedules)
+        return super().to_representation(schedules)
+
+
 class StudentScheduleSerializer(serializers.ModelSerializer):
     teacher_name = serializers.CharField(source='teacher.user.name', read_only=True)
     course_name = serializers.CharField(source='course_name.object_name', read_only=True)
@@ -185,11 +254,19 @@ class StudentScheduleSerializer(serializers.ModelSerializer):
             'id', 'teacher_name', 'course_name', 'room_name',
             'class_name', 'start_time', 'end_time', 'is_present'
         ]
+        list_serializer_class = StudentScheduleListSerializer
 
     def get_is_present(self, obj):
+        # Với many=True trạng thái đã được nạp sẵn (hoặc truyền qua context['attendance_map'])
+        attendance_map = self.context.get('attendance_map', getattr(self, 'attendance_map', None))
+        if attendance_map is not None:
+            return attendance_map.get(obj.pk)
+
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            student = request.user.student
+            student = get_role(request).student
+            if student is None:
+                return None
             attendance = Attendance.objects.filter(
                 student=student,
                 schedule=obj
@@ -238,17 +315,102 @@ class ScheduleSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         schedule = super().create(validated_data)
 
-        # Tạo bản ghi điểm danh cho tất cả sinh viên trong lớp
-        students = schedule.class_name.students.all()
-        for student in students:
-            Attendance.objects.create(
-                student=student,
-                schedule=schedule,
-                is_present=False
-            )
+        # Tạo bản ghi điểm danh cho tất cả sinh viên trong lớp bằng một lệnh INSERT
+        create_attendance_placeholders([schedule])
 
         return schedule
 
+
+class ScheduleBulkItemSerializer(serializers.Serializer):
+    """Một lịch học trong yêu cầu tạo hàng loạt, các quan hệ được gửi dưới dạng id"""
+    teacher = serializers.IntegerField()
+    course_name = serializers.IntegerField()
+    room = serializers.IntegerField()
+    class_name = serializers.IntegerField()
+    lesson_start = serializers.ChoiceField(choices=Schedule.LESSON_CHOICES)
+    lesson_count = serializers.IntegerField(min_value=1, default=1)
+    weekdays = serializers.ListField(
+        child=serializers.ChoiceField(choices=Weekday.DAY_CHOICES),
+        allow_empty=False
+    )
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+
+    def validate(self, attrs):
+        if attrs['end_date'] < attrs['start_date']:
+            raise serializers.ValidationError("Ngày kết thúc phải sau ngày bắt đầu.")
+        if attrs['lesson_start'] + attrs['lesson_count'] - 1 > 11:
+            raise serializers.ValidationError("Tiết kết thúc vượt quá tiết 11.")
+        return attrs
+
+
+class ScheduleBulkCreateSerializer(serializers.Serializer):
+    """
+    Tạo cả thời khoá biểu trong một request.
+    Id các quan hệ được kiểm tra bằng một truy vấn cho mỗi loại, trùng phòng được kiểm tra
+    bằng một truy vấn trên bảng ScheduleOccurrence (xem core/timetable.py).
+    """
+    schedules = ScheduleBulkItemSerializer(
+        many=True,
+        allow_empty=False,
+        max_length=getattr(settings, 'SCHEDULE_BULK_MAX', 1000)
+    )
+
+    def validate(self, attrs):
+        items = attrs['schedules']
+
+        missing = missing_references(items)
+        if missing:
+            raise serializers.ValidationError({'schedules': [
+                f"Lịch học #{index}: {field} = {value} không tồn tại."
+                for index, field, value in missing
+            ]})
+
+        schedules = [build_schedule(item) for item in items]
+        weekday_codes = [item['weekdays'] for item in items]
+        occurrence_lists = [
+            build_occurrences(schedule, codes) for schedule, codes in zip(schedules, weekday_codes)
+        ]
+        conflicts = find_room_conflicts(occurrence_lists)
+        if conflicts:
+            raise serializers.ValidationError({'schedules': [
+                f"Lịch học #{conflict['index']}: phòng {conflict['room']} ngày {conflict['date']} "
+                + (
+                    f"trùng với lịch học #{conflict['conflict_with_index']} trong yêu cầu."
+                    if 'conflict_with_index' in conflict
+                    else f"trùng với lịch học đã có (id {conflict['conflict_with_schedule']})."
+                )
+                for conflict in conflicts
+            ]})
+
+        attrs['built_schedules'] = schedules
+        attrs['weekday_codes'] = weekday_codes
+        attrs['occurrence_lists'] = occurrence_lists
+        return attrs
+
+    def create(self, validated_data):
+        schedules = validated_data['built_schedules']
+        result = create_schedules(
+            schedules, validated_data['weekday_codes'], validated_data['occurrence_lists']
+        )
+        result['ids'] = [schedule.id for schedule in schedules]
+        return result
+
+class ScheduleOccurrenceSerializer(serializers.ModelSerializer):
+    """Serializer cho một buổi học cụ thể của lịch học"""
+    schedule_id = serializers.IntegerField(read_only=True)
+    teacher_name = serializers.CharField(source='teacher.user.name', read_only=True)
+    course_name = serializers.CharField(source='schedule.course_name.object_name', read_only=True)
+    room_name = serializers.CharField(source='room.classroom_code', read_only=True)
+    class_name = serializers.CharField(source='class_name.class_name', read_only=True)
+
+    class Meta:
+        model = ScheduleOccurrence
+        fields = [
+            'id', 'schedule_id', 'date', 'start_time', 'end_time',
+            'teacher_name', 'course_name', 'room_name', 'class_name',
+        ]
+
 class AvatarSerializer(serializers.Serializer):
     """Serializer cho việc tải lên avatar"""
     avatar = serializers.ImageField(required=True)
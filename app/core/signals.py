@@ -1,11 +1,33 @@
 # core/signals.py
 
-from django.db.models.signals import post_save
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.db import transaction
+from django.db.backends.signals import connection_created
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from core.models import Student, Schedule
+from core.models import Student, Schedule, Attendance, Class, Classroom, Teacher, Object
+from core.models import User as CoreUser
+from core.rollup import refresh_rollups, refresh_schedule_rollups, rollup_key
+from core.cache import class_rosters, classroom_geofences
+from core.checkin import invalidate_schedule_snapshots
+from core.http_cache import CLASSES, CLASSROOMS, SCHEDULES, TEACHERS, bump_versions, user_scope
+from core.occurrences import regenerate_occurrences
+from core.roles import invalidate_user_snapshots
 import uuid
 
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    Bật WAL cho SQLite: người đọc không chặn người ghi và ngược lại, mỗi lần commit chỉ ghi nối vào file WAL.
+    synchronous=NORMAL là mức an toàn được khuyến nghị khi dùng WAL.
+    """
+    if connection.vendor != 'sqlite' or not getattr(settings, 'SQLITE_WAL', False):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+
 @receiver(post_save, sender=User)
 def create_student_for_user(sender, instance, created, **kwargs):
     if created and not instance.is_staff:
@@ -16,40 +38,171 @@ def create_student_for_user(sender, instance, created, **kwargs):
                 student_code=str(uuid.uuid4())[:8]  # mã ngẫu nhiên
             )
 
+@receiver(post_save, sender=Attendance)
+@receiver(post_delete, sender=Attendance)
+def update_attendance_rollup(sender, instance, **kwargs):
+    """
+    Cập nhật bảng tổng hợp điểm danh theo ngày cho khóa (ngày, lịch học) của bản ghi vừa thay đổi.
+    Áp dụng cho mọi đường lưu: AttendanceViewSet, qr_attendance, trang admin.
+    """
+    if instance.timestamp is None:
+        return
+    refresh_rollups([rollup_key(instance)])
+
+
+@receiver(post_save, sender=Schedule)
+def move_attendance_rollup(sender, instance, created, raw=False, **kwargs):
+    """Lịch học đổi lớp: các dòng tổng hợp của lịch học được tính lại theo lớp mới"""
+    if created or raw:
+        return
+    loaded_class_id = getattr(instance, '_loaded_class_id', None)
+    if loaded_class_id is not None and loaded_class_id != instance.class_name_id:
+        refresh_schedule_rollups([instance.id])
+
+
 @receiver(post_save, sender=Schedule)
-def update_qr_code_on_schedule_save(sender, instance, **kwargs):
+@receiver(post_delete, sender=Schedule)
+def invalidate_schedule_snapshot(sender, instance, **kwargs):
+    """Xoá ảnh chụp lịch học dùng cho điểm danh nhanh khi lịch học thay đổi"""
+    invalidate_schedule_snapshots([instance.id])
+
+
+@receiver(m2m_changed, sender=Schedule.weekdays.through)
+def invalidate_schedule_snapshot_on_weekdays(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        schedule_ids = Schedule.objects.filter(weekdays=instance).values_list('id', flat=True)
+        invalidate_schedule_snapshots(list(schedule_ids) + list(pk_set or []))
+    else:
+        invalidate_schedule_snapshots([instance.id])
+
+
+@receiver(post_save, sender=CoreUser)
+@receiver(post_delete, sender=CoreUser)
+def invalidate_user_snapshot(sender, instance, **kwargs):
+    """Xoá ảnh chụp user dùng cho xác thực JWT"""
+    invalidate_user_snapshots([instance.pk])
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+@receiver(post_save, sender=Teacher)
+@receiver(post_delete, sender=Teacher)
+def invalidate_user_snapshot_on_role(sender, instance, **kwargs):
+    """Ảnh chụp user chứa cả student / teacher"""
+    invalidate_user_snapshots([instance.user_id])
+
+
+@receiver(m2m_changed, sender=Class.students.through)
+def rebuild_class_roster(sender, instance, action, reverse, pk_set, **kwargs):
     """
-    Tự động cập nhật mã QR code khi Schedule được lưu
+    Xoá ngay chỉ mục danh sách sinh viên của các lớp vừa thêm / bớt sinh viên và dựng lại
+    sau khi transaction được commit (không đưa dữ liệu chưa commit vào cache dùng chung).
     """
-    # Sử dụng một cờ để tránh đệ quy vô hạn do generate_qr_code() cũng gọi save()
-    # Chi tiết: Kiểm tra xem QR code đã thay đổi hay chưa bằng cách so sánh
-    # qr_code_data hiện tại và qr_code_data mới
-    
-    # Tạo dữ liệu cho QR code
-    data = {
-        'schedule_id': instance.id,
-        'course_name': instance.course_name.object_name,
-        'teacher': instance.teacher.user.name,
-        'class_name': instance.class_name.class_name,
-        'room': instance.room.classroom_code,
-        'lesson_start': instance.lesson_start,
-        'lesson_count': instance.lesson_count,
-        'start_time': instance.start_time.isoformat() if instance.start_time else None,
-        'end_time': instance.end_time.isoformat() if instance.end_time else None
-    }
-    
-    new_qr_data = str(data)
-    
-    # Chỉ tạo QR code mới nếu dữ liệu đã thay đổi
-    if instance.qr_code_data != new_qr_data:
-        # Lưu dữ liệu QR mới và tránh gọi lại signal này
-        instance.qr_code_data = new_qr_data
-        
-        # Ngắt kết nối signal tạm thời để tránh đệ quy
-        post_save.disconnect(update_qr_code_on_schedule_save, sender=Schedule)
-        
-        # Tạo QR code
-        instance.generate_qr_code()
-        
-        # Kết nối lại signal
-        post_save.connect(update_qr_code_on_schedule_save, sender=Schedule)
+    if action not in ('post_add', 'post_remove', 'pre_clear', 'post_clear'):
+        return
+    if reverse:
+        # instance là Student; khi clear thì lấy các lớp hiện tại trước khi bị xoá
+        if action == 'post_clear':
+            return
+        class_ids = pk_set if action != 'pre_clear' else instance.student_classes.values_list('id', flat=True)
+    else:
+        if action == 'pre_clear':
+            return
+        class_ids = [instance.id]
+    class_ids = list(class_ids)
+    class_rosters.invalidate(class_ids)
+    transaction.on_commit(lambda: class_rosters.refresh(class_ids))
+
+
+@receiver(post_save, sender=Class)
+@receiver(post_delete, sender=Class)
+def invalidate_class_caches(sender, instance, **kwargs):
+    """Tên lớp nằm trong ảnh chụp lịch học; lớp bị xoá thì xoá cả danh sách sinh viên"""
+    class_rosters.invalidate([instance.id])
+    schedule_ids = Schedule.objects.filter(class_name=instance).values_list('id', flat=True)
+    invalidate_schedule_snapshots(list(schedule_ids))
+
+
+@receiver(post_save, sender=Classroom)
+@receiver(post_delete, sender=Classroom)
+def invalidate_classroom_geofence(sender, instance, **kwargs):
+    classroom_geofences.invalidate([instance.id])
+
+
+@receiver(post_save, sender=Schedule)
+def update_schedule_occurrences(sender, instance, raw=False, **kwargs):
+    """Sinh lại các buổi học cụ thể khi lịch học thay đổi"""
+    if raw:
+        return
+    regenerate_occurrences([instance])
+
+
+@receiver(m2m_changed, sender=Schedule.weekdays.through)
+def update_schedule_occurrences_on_weekdays(sender, instance, action, reverse, pk_set, **kwargs):
+    """Sinh lại các buổi học cụ thể khi các thứ trong tuần của lịch học thay đổi"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # instance là Weekday; chỉ biết các lịch học bị ảnh hưởng khi add/remove
+        if pk_set:
+            regenerate_occurrences(Schedule.objects.filter(id__in=pk_set))
+    else:
+        regenerate_occurrences([instance])
+
+
+# Số phiên bản cho ETag / Last-Modified (core/http_cache.py)
+
+@receiver(post_save, sender=Schedule)
+@receiver(post_delete, sender=Schedule)
+@receiver(post_save, sender=Object)
+@receiver(post_delete, sender=Object)
+def bump_schedule_version(sender, **kwargs):
+    bump_versions(SCHEDULES)
+
+
+@receiver(m2m_changed, sender=Schedule.weekdays.through)
+def bump_schedule_version_on_weekdays(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_versions(SCHEDULES)
+
+
+@receiver(post_save, sender=Class)
+@receiver(post_delete, sender=Class)
+def bump_class_version(sender, **kwargs):
+    bump_versions(CLASSES)
+
+
+@receiver(m2m_changed, sender=Class.students.through)
+@receiver(m2m_changed, sender=Class.teachers.through)
+def bump_class_version_on_members(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_versions(CLASSES)
+
+
+@receiver(post_save, sender=Classroom)
+@receiver(post_delete, sender=Classroom)
+def bump_classroom_version(sender, **kwargs):
+    bump_versions(CLASSROOMS)
+
+
+@receiver(post_save, sender=Teacher)
+@receiver(post_delete, sender=Teacher)
+def bump_teacher_version(sender, instance, **kwargs):
+    bump_versions(TEACHERS, user_scope(instance.user_id))
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+def bump_student_version(sender, instance, **kwargs):
+    bump_versions(user_scope(instance.user_id))
+
+
+@receiver(post_save, sender=CoreUser)
+@receiver(post_delete, sender=CoreUser)
+def bump_user_version(sender, instance, update_fields=None, **kwargs):
+    """Tên giáo viên nằm trong thời khoá biểu; đăng nhập (chỉ cập nhật last_login) không tính là thay đổi"""
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    bump_versions(TEACHERS, user_scope(instance.pk))
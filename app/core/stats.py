@@ -0,0 +1,272 @@
+"""
+Bộ tính thống kê cho dashboard.
+
+Mọi số liệu được tính bằng một số ít truy vấn gom nhóm thay vì lặp qua từng ngày /
+từng lịch học, nên số truy vấn không phụ thuộc vào số ngày, số lịch học hay số sinh viên.
+Số liệu theo lịch học / lớp / ngày được đọc từ bảng tổng hợp AttendanceDailyRollup;
+chỉ số liệu riêng của từng sinh viên mới đọc trực tiếp bảng Attendance.
+"""
+from datetime import timedelta
+
+from django.db.models import Count, Exists, OuterRef, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Attendance, AttendanceDailyRollup, Class, Schedule, Student, Teacher
+from .occurrences import upcoming_occurrences
+
+# Số ngày hiển thị trên biểu đồ điểm danh
+CHART_DAYS = 30
+
+
+def attendance_counts(queryset):
+    """Tổng hợp tổng số / có mặt / trễ của một queryset điểm danh trong một truy vấn"""
+    return queryset.aggregate(
+        total=Count('id'),
+        present=Count('id', filter=Q(is_present=True)),
+        late=Count('id', filter=Q(is_late=True)),
+    )
+
+
+def rollup_sums():
+    return {
+        'total': Coalesce(Sum('total'), 0),
+        'present': Coalesce(Sum('present'), 0),
+        'late': Coalesce(Sum('late'), 0),
+    }
+
+
+def attendance_by_day(rollups, today, days=CHART_DAYS):
+    """
+    Cộng dồn bảng tổng hợp theo ngày trong một truy vấn.
+    Trả về dict {ngày: số liệu} cho `days` ngày gần nhất, ngày mới nhất đứng trước,
+    ngày không có dữ liệu có giá trị 0.
+    """
+    first_day = today - timedelta(days=days - 1)
+    rows = (
+        rollups
+        .filter(date__gte=first_day, date__lte=today)
+        .values('date')
+        .annotate(**rollup_sums())
+    )
+    by_day = {row['date']: row for row in rows}
+
+    result = {}
+    for i in range(days):
+        day = today - timedelta(days=i)
+        row = by_day.get(day, {})
+        total = row.get('total', 0)
+        present = row.get('present', 0)
+        result[day] = {
+            'total': total,
+            'present': present,
+            'absent': total - present,
+            'late': row.get('late', 0),
+        }
+    return result
+
+
+def rate(part, total):
+    """Tỷ lệ phần trăm, trả về 0 khi không có dữ liệu"""
+    if total > 0:
+        return (part / total) * 100
+    return 0
+
+
+def upcoming_sessions(today, days=7, **filters):
+    """Các buổi học trong `days` ngày tới, đã nạp sẵn các quan hệ cần hiển thị"""
+    return (
+        upcoming_occurrences(today, days)
+        .filter(**filters)
+        .select_related('schedule__course_name', 'class_name', 'room', 'teacher__user')
+    )
+
+
+def format_time(value):
+    """Giờ:phút theo múi giờ địa phương"""
+    return timezone.localtime(value).strftime('%H:%M') if value else None
+
+
+def get_admin_statistics():
+    """Thống kê dành cho quản trị viên"""
+    today = timezone.now().date()
+
+    # Thống kê điểm danh trong 30 ngày gần đây
+    thirty_days_ago = today - timedelta(days=CHART_DAYS)
+    recent_rollups = AttendanceDailyRollup.objects.filter(date__gte=thirty_days_ago)
+    counts = recent_rollups.aggregate(**rollup_sums())
+
+    by_day = attendance_by_day(recent_rollups, today)
+
+    return {
+        'role': 'admin',
+        'overview': {
+            'total_students': Student.objects.count(),
+            'total_teachers': Teacher.objects.count(),
+            'total_classes': Class.objects.count(),
+            'active_schedules': Schedule.objects.filter(is_active=True).count(),
+        },
+        'attendance': {
+            'total': counts['total'],
+            'present': counts['present'],
+            'absent': counts['total'] - counts['present'],
+            'late': counts['late'],
+            'attendance_rate': rate(counts['present'], counts['total']),
+        },
+        'attendance_by_day': {
+            day.strftime('%Y-%m-%d'): data for day, data in by_day.items()
+        },
+    }
+
+
+def get_teacher_statistics(teacher):
+    """Thống kê dành cho giáo viên"""
+    today = timezone.now().date()
+
+    schedules = Schedule.objects.filter(teacher=teacher)
+    teacher_rollups = AttendanceDailyRollup.objects.filter(schedule__teacher=teacher)
+
+    # Danh sách lớp kèm sĩ số trong một truy vấn
+    classes = list(
+        Class.objects.filter(teachers=teacher)
+        .annotate(students_count=Count('students', distinct=True))
+    )
+
+    # Tỷ lệ điểm danh của từng lớp, gom nhóm theo lớp
+    class_attendance = {
+        row['class_name']: row
+        for row in teacher_rollups.values('class_name').annotate(**rollup_sums())
+    }
+
+    students_count = 0
+    classes_data = []
+    for class_obj in classes:
+        students_count += class_obj.students_count
+        row = class_attendance.get(class_obj.id, {})
+        classes_data.append({
+            'id': class_obj.id,
+            'name': class_obj.class_name,
+            'code': class_obj.class_code,
+            'students_count': class_obj.students_count,
+            'attendance_rate': rate(row.get('present', 0), row.get('total', 0)),
+        })
+
+    # Tỷ lệ điểm danh theo ngày
+    by_day = attendance_by_day(teacher_rollups, today)
+    attendance_data = {}
+    for day, data in by_day.items():
+        attendance_data[day.strftime('%Y-%m-%d')] = {
+            'total': data['total'],
+            'present': data['present'],
+            'absent': data['absent'],
+            'rate': rate(data['present'], data['total']),
+        }
+
+    # Các buổi dạy trong 7 ngày tới, đọc từ bảng ScheduleOccurrence
+    upcoming_data = []
+    for occurrence in upcoming_sessions(today, teacher=teacher):
+        upcoming_data.append({
+            'id': occurrence.schedule_id,
+            'course': occurrence.schedule.course_name.object_name,
+            'class_name': occurrence.class_name.class_name,
+            'date': occurrence.date.strftime('%Y-%m-%d'),
+            'start_time': format_time(occurrence.start_time),
+            'end_time': format_time(occurrence.end_time),
+            'room': occurrence.room.class_name,
+        })
+
+    return {
+        'role': 'teacher',
+        'name': teacher.user.name,
+        'code': teacher.teacher_code,
+        'overview': {
+            'classes_count': len(classes),
+            'students_count': students_count,
+            'active_schedules': schedules.filter(is_active=True).count(),
+        },
+        'classes': classes_data,
+        'attendance_by_day': attendance_data,
+        'upcoming_schedules': upcoming_data,
+    }
+
+
+def get_student_statistics(student):
+    """Thống kê dành cho sinh viên"""
+    today = timezone.now().date()
+
+    classes = Class.objects.filter(students=student)
+    schedules = Schedule.objects.filter(class_name__in=classes)
+    schedule_counts = schedules.aggregate(
+        total=Count('id'),
+        active=Count('id', filter=Q(is_active=True)),
+    )
+
+    # Thống kê điểm danh
+    counts = attendance_counts(Attendance.objects.filter(student=student))
+
+    # Thống kê điểm danh theo môn học: môn nào có lịch thì luôn có mặt trong kết quả
+    courses_attendance = {}
+    course_names = schedules.order_by('id').values_list('course_name__object_name', flat=True)
+    for course_name in course_names:
+        courses_attendance.setdefault(course_name, {
+            'total': 0,
+            'present': 0,
+            'absent': 0,
+            'late': 0
+        })
+
+    course_rows = (
+        Attendance.objects.filter(student=student, schedule__in=schedules)
+        .values('schedule__course_name__object_name')
+        .annotate(
+            total=Count('id'),
+            present=Count('id', filter=Q(is_present=True)),
+            late=Count('id', filter=Q(is_late=True)),
+        )
+    )
+    for row in course_rows:
+        courses_attendance[row['schedule__course_name__object_name']] = {
+            'total': row['total'],
+            'present': row['present'],
+            'absent': row['total'] - row['present'],
+            'late': row['late'],
+        }
+
+    # Các buổi học trong 7 ngày tới, kèm trạng thái đã điểm danh
+    upcoming = upcoming_sessions(today, class_name__students=student).annotate(
+        has_attendance=Exists(
+            Attendance.objects.filter(student=student, schedule=OuterRef('schedule'), is_present=True)
+        )
+    )
+    upcoming_data = []
+    for occurrence in upcoming:
+        upcoming_data.append({
+            'id': occurrence.schedule_id,
+            'course': occurrence.schedule.course_name.object_name,
+            'date': occurrence.date.strftime('%Y-%m-%d'),
+            'start_time': format_time(occurrence.start_time),
+            'end_time': format_time(occurrence.end_time),
+            'room': occurrence.room.class_name,
+            'teacher': occurrence.teacher.user.name,
+            'has_attendance': occurrence.has_attendance,
+        })
+
+    return {
+        'role': 'student',
+        'name': student.user.name,
+        'code': student.student_code,
+        'overview': {
+            'classes_count': classes.count(),
+            'total_schedules': schedule_counts['total'],
+            'active_schedules': schedule_counts['active'],
+        },
+        'attendance': {
+            'total': counts['total'],
+            'present': counts['present'],
+            'absent': counts['total'] - counts['present'],
+            'late': counts['late'],
+            'attendance_rate': rate(counts['present'], counts['total']),
+        },
+        'courses_attendance': courses_attendance,
+        'upcoming_schedules': upcoming_data,
+    }
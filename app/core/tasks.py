@@ -1,6 +1,7 @@
 from celery import shared_task
 from django.utils import timezone
 from .models import Schedule
+from .qr_images import save_qr_image
 from datetime import timedelta
 
 @shared_task
@@ -17,4 +18,19 @@ def generate_qr_codes_for_upcoming_classes():
     
     for schedule in upcoming_classes:
         schedule.generate_qr_code()
-        print(f"Generated QR code for schedule {schedule.id}") 
\ No newline at end of file
+        print(f"Generated QR code for schedule {schedule.id}")
+
+
+@shared_task
+def render_schedule_qr_code(schedule_id):
+    """
+    Vẽ ảnh QR cho dữ liệu QR hiện tại của lịch học và gắn vào trường qr_code.
+    Ảnh được lưu theo hash của dữ liệu nên dữ liệu giống nhau chỉ được vẽ một lần.
+    """
+    data = Schedule.objects.filter(pk=schedule_id).values_list('qr_code_data', flat=True).first()
+    if not data:
+        return None
+    path = save_qr_image(data)
+    # Chỉ gắn ảnh nếu dữ liệu QR chưa bị thay đổi trong lúc vẽ
+    Schedule.objects.filter(pk=schedule_id, qr_code_data=data).update(qr_code=path)
+    return path
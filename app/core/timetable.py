@@ -0,0 +1,192 @@
+"""
+Tạo hàng loạt lịch học (cả thời khoá biểu một học kỳ) trong một request.
+
+- find_room_conflicts: sinh các buổi học của mọi lịch trong bộ nhớ rồi kiểm tra trùng phòng
+  giữa các lịch trong cùng request và với bảng ScheduleOccurrence bằng một truy vấn theo khoảng ngày.
+- create_schedules: ghi lịch học, liên kết thứ trong tuần, các buổi học và bản ghi điểm danh
+  giữ chỗ bằng bulk_create trong một transaction; dữ liệu QR đã ký được ghi cùng transaction,
+  ảnh QR được vẽ bởi Celery sau khi commit.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+
+from .models import Attendance, Class, Classroom, Object, Schedule, ScheduleOccurrence, Teacher, Weekday
+from .http_cache import SCHEDULES, bump_versions
+from .occurrences import build_occurrences
+from .rollup import refresh_rollups, rollup_key
+from .tasks import render_schedule_qr_code
+
+# Trường khóa ngoại của dữ liệu lịch học -> model tương ứng
+REFERENCE_MODELS = {
+    'teacher': Teacher,
+    'course_name': Object,
+    'room': Classroom,
+    'class_name': Class,
+}
+
+
+def missing_references(items):
+    """
+    Kiểm tra các id giáo viên / môn học / phòng / lớp, mỗi loại một truy vấn.
+    Trả về danh sách (chỉ số lịch học, tên trường, id không tồn tại).
+    """
+    missing = []
+    for field, model in REFERENCE_MODELS.items():
+        found = set(
+            model.objects.filter(pk__in={item[field] for item in items}).values_list('pk', flat=True)
+        )
+        for index, item in enumerate(items):
+            if item[field] not in found:
+                missing.append((index, field, item[field]))
+    return missing
+
+
+def build_schedule(item):
+    """Tạo (chưa lưu) Schedule từ dữ liệu đã validate, tính sẵn các trường mà save() sẽ tính"""
+    schedule = Schedule(
+        teacher_id=item['teacher'],
+        course_name_id=item['course_name'],
+        room_id=item['room'],
+        class_name_id=item['class_name'],
+        lesson_start=item['lesson_start'],
+        lesson_count=item['lesson_count'],
+        start_date=item['start_date'],
+        end_date=item['end_date'],
+    )
+    # bulk_create không gọi Schedule.save()
+    schedule.start_time, schedule.end_time = schedule.calculate_times()
+    schedule.update_active_status()
+    return schedule
+
+
+def _overlaps(a_start, a_end, b_start, b_end):
+    return a_start < b_end and b_start < a_end
+
+
+def find_room_conflicts(occurrence_lists):
+    """
+    Tìm các buổi học trùng phòng. `occurrence_lists[i]` là các buổi học (chưa lưu) của lịch học thứ i.
+    Trả về danh sách lỗi, mỗi lỗi gồm chỉ số lịch học, ngày và lịch bị trùng
+    (chỉ số trong request hoặc id lịch học đã có).
+    """
+    slots = defaultdict(list)
+    for index, occurrences in enumerate(occurrence_lists):
+        for occurrence in occurrences:
+            slots[(occurrence.room_id, occurrence.date)].append(
+                (occurrence.start_time, occurrence.end_time, index)
+            )
+    if not slots:
+        return []
+
+    conflicts = []
+    # Trùng phòng giữa các lịch trong cùng request
+    for (room_id, date), items in slots.items():
+        items.sort()
+        for i, (start, end, index) in enumerate(items):
+            for other_start, other_end, other_index in items[i + 1:]:
+                if other_start >= end:
+                    break
+                if other_index != index:
+                    conflicts.append({
+                        'index': other_index,
+                        'date': date,
+                        'room': room_id,
+                        'conflict_with_index': index,
+                    })
+
+    # Trùng phòng với các buổi học đã có, một truy vấn cho cả request
+    dates = [date for _, date in slots]
+    existing = ScheduleOccurrence.objects.filter(
+        room_id__in={room_id for room_id, _ in slots},
+        date__gte=min(dates),
+        date__lte=max(dates),
+    ).values_list('room_id', 'date', 'start_time', 'end_time', 'schedule_id')
+    for room_id, date, start, end, schedule_id in existing:
+        for new_start, new_end, index in slots.get((room_id, date), ()):
+            if _overlaps(start, end, new_start, new_end):
+                conflicts.append({
+                    'index': index,
+                    'date': date,
+                    'room': room_id,
+                    'conflict_with_schedule': schedule_id,
+                })
+    return conflicts
+
+
+def weekday_ids(codes):
+    """Ánh xạ mã thứ -> id Weekday, tạo các Weekday còn thiếu"""
+    ids = dict(Weekday.objects.filter(day__in=codes).values_list('day', 'id'))
+    missing = set(codes) - set(ids)
+    if missing:
+        Weekday.objects.bulk_create([Weekday(day=day) for day in missing], ignore_conflicts=True)
+        ids = dict(Weekday.objects.filter(day__in=codes).values_list('day', 'id'))
+    return ids
+
+
+def create_attendance_placeholders(schedules, batch_size=1000):
+    """Tạo bản ghi điểm danh (vắng mặt) cho mọi sinh viên của lớp ứng với từng lịch học"""
+    students = defaultdict(list)
+    for class_id, student_id in Class.students.through.objects.filter(
+        class_id__in={schedule.class_name_id for schedule in schedules}
+    ).values_list('class_id', 'student_id'):
+        students[class_id].append(student_id)
+
+    attendances = [
+        Attendance(student_id=student_id, schedule_id=schedule.id, is_present=False)
+        for schedule in schedules
+        for student_id in students[schedule.class_name_id]
+    ]
+    Attendance.objects.bulk_create(attendances, batch_size=batch_size)
+    # bulk_create không phát signal nên tự cập nhật bảng tổng hợp
+    refresh_rollups({rollup_key(attendance) for attendance in attendances})
+    return attendances
+
+
+def create_schedules(schedules, weekday_codes, occurrence_lists=None, batch_size=1000):
+    """
+    Ghi các lịch học do build_schedule() tạo (đã kiểm tra trùng phòng).
+    `occurrence_lists` là các buổi học đã sinh khi kiểm tra trùng phòng, nếu không có thì sinh lại.
+    Trả về số lượng lịch học, buổi học và bản ghi điểm danh đã tạo.
+    Như Schedule.generate_qr_code(), ảnh QR không được vẽ ở đây: task render_schedule_qr_code của từng
+    lịch học được đưa vào hàng đợi Celery sau khi transaction commit.
+    """
+    if occurrence_lists is None:
+        occurrence_lists = [
+            build_occurrences(schedule, codes) for schedule, codes in zip(schedules, weekday_codes)
+        ]
+    ids = weekday_ids({code for codes in weekday_codes for code in codes})
+    Through = Schedule.weekdays.through
+
+    with transaction.atomic():
+        Schedule.objects.bulk_create(schedules, batch_size=batch_size)
+        # Dữ liệu QR đã ký chứa id của lịch học nên chỉ tính được sau khi tạo
+        for schedule in schedules:
+            schedule.qr_code_data = schedule.build_qr_code_data()
+            schedule._loaded_qr_fields = schedule.qr_payload_fields()
+            schedule._loaded_class_id = schedule.class_name_id
+        Schedule.objects.bulk_update(schedules, ['qr_code_data'], batch_size=batch_size)
+        Through.objects.bulk_create([
+            Through(schedule_id=schedule.id, weekday_id=ids[code])
+            for schedule, codes in zip(schedules, weekday_codes)
+            for code in set(codes)
+        ], batch_size=batch_size)
+
+        occurrences = []
+        for schedule, items in zip(schedules, occurrence_lists):
+            for occurrence in items:
+                occurrence.schedule_id = schedule.id
+                occurrences.append(occurrence)
+        ScheduleOccurrence.objects.bulk_create(occurrences, batch_size=batch_size)
+
+        attendances = create_attendance_placeholders(schedules, batch_size=batch_size)
+        # bulk_create không phát signal nên tự đánh dấu thời khoá biểu đã thay đổi
+        bump_versions(SCHEDULES)
+        schedule_ids = [schedule.id for schedule in schedules]
+        transaction.on_commit(lambda: [render_schedule_qr_code.delay(pk) for pk in schedule_ids])
+
+    return {
+        'schedules': len(schedules),
+        'occurrences': len(occurrences),
+        'attendances': len(attendances),
+    }
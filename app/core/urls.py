@@ -8,6 +8,7 @@ from core.views import (
     UserViewSet, StudentViewSet, TeacherViewSet, ClassroomViewSet
 )
 from core.admin import student_admin_site
+from core.roles import STUDENT, TEACHER, get_role
 
 router = DefaultRouter()
 router.register('classes', ClassViewSet)
@@ -40,28 +41,18 @@ def user_info(request):
     }
 
     # Xác định vai trò người dùng
-    if user.is_superuser:
-        data['role'] = 'admin'
-    else:
-        # Kiểm tra nếu là sinh viên
-        try:
-            student = user.student
-            data['role'] = 'student'
-            data['student_info'] = {
-                'student_code': student.student_code,
-                'classes_count': student.student_classes.count()
-            }
-        except Exception:
-            # Kiểm tra nếu là giáo viên
-            try:
-                teacher = user.teacher
-                data['role'] = 'teacher'
-                data['teacher_info'] = {
-                    'teacher_code': teacher.teacher_code,
-                    'classes_count': teacher.teacher_classes.count()
-                }
-            except Exception:
-                data['role'] = 'user'
+    role = get_role(request)
+    data['role'] = role.name
+    if role.name == STUDENT:
+        data['student_info'] = {
+            'student_code': role.student.student_code,
+            'classes_count': role.student.student_classes.count()
+        }
+    elif role.name == TEACHER:
+        data['teacher_info'] = {
+            'teacher_code': role.teacher.teacher_code,
+            'classes_count': role.teacher.teacher_classes.count()
+        }
 
     return Response(data)
 
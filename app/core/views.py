@@ -5,46 +5,72 @@ from rest_framework.viewsets import GenericViewSet
 
 
 from .models import Schedule, Attendance, Class, Student, Teacher, User, Classroom
+from . import stats
 from .serializers import (
     ScheduleSerializer, StudentScheduleSerializer, UserSerializer,
     StudentSerializer, TeacherSerializer, ClassroomSerializer,
-    ChangePasswordSerializer, AvatarSerializer
+    ChangePasswordSerializer, AvatarSerializer, ScheduleOccurrenceSerializer,
+    ScheduleBulkCreateSerializer, ClassListSerializer
 )
+from .cache import is_class_member
+from .http_cache import CLASSES, CLASSROOMS, SCHEDULES, TEACHERS, conditional_get
+from .occurrences import occurrences_in_period
+from .roles import STUDENT, TEACHER, get_role
+from .pagination import IdCursorPagination, SparseFieldsetsMixin
 from django.shortcuts import render
 from rest_framework.views import APIView
-from django.db.models import Count, Avg, Sum, F, Q, Case, When, IntegerField, Value
+from django.db.models import Count, Avg, Sum, F, Q, Case, When, IntegerField, Value, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from datetime import timedelta
 import json
 from rest_framework.parsers import MultiPartParser, FormParser
 
-class ClassViewSet(viewsets.ReadOnlyModelViewSet):
+def _member_count(through, owner_field):
+    """Subquery đếm số dòng của bảng trung gian `through` thuộc lớp ở truy vấn ngoài"""
+    rows = (
+        through.objects.filter(**{owner_field: OuterRef('pk')})
+        .order_by()
+        .values(owner_field)
+        .annotate(total=Count('*'))
+        .values('total')
+    )
+    return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+
+def annotate_member_counts(queryset):
     """
-    API endpoint cho xem thông tin lớp học
-    Chỉ cung cấp chức năng đọc (không thêm/sửa/xóa)
+    Thêm students_count / teachers_count cho queryset Class bằng subquery tương quan:
+    cả danh sách chỉ tốn một truy vấn và không bị ảnh hưởng bởi các filter join qua
+    students / teachers của queryset (như Count trên join).
     """
-    queryset = Class.objects.all()
-    permission_classes = [permissions.IsAuthenticated]
+    return queryset.annotate(
+        students_count=_member_count(Class.students.through, 'class_id'),
+        teachers_count=_member_count(Class.teachers.through, 'class_id'),
+    )
 
-    def get_serializer_class(self):
-        # Sử dụng serializer mặc định của DRF
-        from rest_framework import serializers
 
-        class ClassSerializer(serializers.ModelSerializer):
-            students_count = serializers.SerializerMethodField()
-            teachers_count = serializers.SerializerMethodField()
+TIMETABLE_SCOPES = (SCHEDULES, CLASSES, CLASSROOMS, TEACHERS)
 
-            class Meta:
-                model = Class
-                fields = ['id', 'class_code', 'class_name', 'students_count', 'teachers_count']
 
-            def get_students_count(self, obj):
-                return obj.students.count()
+def _timetable_period(request):
+    """Phần ETag phụ thuộc thời gian của ?period=: 'now' thay đổi theo từng phút nên không cache"""
+    period = request.query_params.get('period')
+    if not period:
+        return ''
+    if period == 'now':
+        return None
+    return timezone.localdate().isoformat()
 
-            def get_teachers_count(self, obj):
-                return obj.teachers.count()
 
-        return ClassSerializer
+class ClassViewSet(SparseFieldsetsMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    API endpoint cho xem thông tin lớp học
+    Chỉ cung cấp chức năng đọc (không thêm/sửa/xóa)
+    """
+    queryset = Class.objects.all()
+    serializer_class = ClassListSerializer
+    permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         """
@@ -53,29 +79,27 @@ class ClassViewSet(viewsets.ReadOnlyModelViewSet):
         - Giáo viên: chỉ thấy các lớp mình dạy
         - Admin: thấy tất cả
         """
-        user = self.request.user
-
-        if user.is_superuser:
-            return Class.objects.all()
+        role = get_role(self.request)
 
+        if role.is_admin:
+            classes = Class.objects.all()
         # Kiểm tra nếu là sinh viên
-        try:
-            student = user.student
-            return Class.objects.filter(students=student)
-        except:
-            pass
-
+        elif role.is_student:
+            classes = Class.objects.filter(students=role.student)
         # Kiểm tra nếu là giáo viên
-        try:
-            teacher = user.teacher
-            return Class.objects.filter(teachers=teacher)
-        except:
+        elif role.is_teacher:
+            classes = Class.objects.filter(teachers=role.teacher)
+        else:
             return Class.objects.none()
+        return annotate_member_counts(classes)
 
-class ScheduleViewSet(viewsets.ModelViewSet):
-    queryset = Schedule.objects.all()
+class ScheduleViewSet(SparseFieldsetsMixin, viewsets.ModelViewSet):
+    queryset = Schedule.objects.select_related(
+        'teacher__user', 'course_name', 'room', 'class_name'
+    ).prefetch_related('weekdays')
     serializer_class = ScheduleSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = IdCursorPagination
 
 
     def get_serializer_class(self):
@@ -83,25 +107,68 @@ class ScheduleViewSet(viewsets.ModelViewSet):
             return ScheduleSerializer  # Có thể dùng serializer riêng nếu cần
         return ScheduleSerializer
 
+    def occurrences_response(self, request, **filters):
+        """
+        Trả về các buổi học cụ thể khi có tham số ?period=now|today|week,
+        hoặc None để dùng danh sách lịch học như trước.
+        """
+        period = request.query_params.get('period')
+        if not period:
+            return None
+        occurrences = occurrences_in_period(period)
+        if occurrences is None:
+            return Response(
+                {"error": "Tham số period phải là một trong: now, today, week."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        occurrences = occurrences.filter(**filters).select_related(
+            'schedule__course_name', 'teacher__user', 'room', 'class_name'
+        )
+        serializer = ScheduleOccurrenceSerializer(occurrences, many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['post'], url_path='bulk', permission_classes=[permissions.IsAdminUser])
+    def bulk(self, request):
+        """Tạo nhiều lịch học (cả thời khoá biểu một học kỳ) trong một request"""
+        serializer = ScheduleBulkCreateSerializer(data=request.data)
+        if serializer.is_valid():
+            result = serializer.save()
+            return Response(result, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
     @action(detail=False, methods=['get'])
+    @conditional_get(TIMETABLE_SCOPES, 'timetable', extra=_timetable_period)
     def student_schedule(self, request):
-        student = request.user.student
-        schedules = Schedule.objects.filter(class_name__students=student)
+        student = get_role(request).student
+        if student is None:
+            return Response(
+                {"error": "Bạn không phải là sinh viên."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        response = self.occurrences_response(request, class_name__students=student)
+        if response is not None:
+            return response
+
+        schedules = self.get_queryset().filter(class_name__students=student)
         schedules = schedules.order_by('start_time')
         serializer = self.get_serializer(schedules, many=True)
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
+    @conditional_get(TIMETABLE_SCOPES, 'timetable', extra=_timetable_period)
     def teacher_schedule(self, request):
-        try:
-            teacher = request.user.teacher
-        except:
+        teacher = get_role(request).teacher
+        if teacher is None:
             return Response(
                 {"error": "Bạn không phải là giáo viên."},
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        schedules = Schedule.objects.filter(teacher=teacher).order_by('start_time')
+        response = self.occurrences_response(request, teacher=teacher)
+        if response is not None:
+            return response
+
+        schedules = self.get_queryset().filter(teacher=teacher).order_by('start_time')
         serializer = self.get_serializer(schedules, many=True)
         return Response(serializer.data)
 
@@ -109,9 +176,9 @@ class ScheduleViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def mark_attendance(self, request, pk=None):
         schedule = self.get_object()
-        student = request.user.student
+        student = get_role(request).student
 
-        if student not in schedule.class_name.students.all():
+        if student is None or not is_class_member(schedule.class_name_id, student.pk):
             return Response(
                 {"error": "Bạn không phải là sinh viên của lớp này."},
                 status=status.HTTP_403_FORBIDDEN
@@ -145,28 +212,18 @@ def index_view(request):
         }
 
         # Xác định vai trò người dùng
-        if request.user.is_superuser:
-            user_data['role'] = 'admin'
-        else:
-            # Kiểm tra nếu là sinh viên
-            try:
-                student = request.user.student
-                user_data['role'] = 'student'
-                user_data['student_info'] = {
-                    'student_code': student.student_code,
-                    'classes_count': student.student_classes.count()
-                }
-            except Exception:
-                # Kiểm tra nếu là giáo viên
-                try:
-                    teacher = request.user.teacher
-                    user_data['role'] = 'teacher'
-                    user_data['teacher_info'] = {
-                        'teacher_code': teacher.teacher_code,
-                        'classes_count': teacher.teacher_classes.count()
-                    }
-                except Exception:
-                    user_data['role'] = 'user'
+        role = get_role(request)
+        user_data['role'] = role.name
+        if role.name == STUDENT:
+            user_data['student_info'] = {
+                'student_code': role.student.student_code,
+                'classes_count': role.student.student_classes.count()
+            }
+        elif role.name == TEACHER:
+            user_data['teacher_info'] = {
+                'teacher_code': role.teacher.teacher_code,
+                'classes_count': role.teacher.teacher_classes.count()
+            }
 
         context['user_data'] = user_data
 
@@ -179,266 +236,35 @@ class StatisticsAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        user = request.user
+        role = get_role(request)
 
         # Phân loại người dùng để trả về thống kê phù hợp
-        if user.is_superuser:
+        if role.is_admin:
             return self.get_admin_statistics()
 
-        try:
-            # Thống kê dành cho sinh viên
-            student = user.student
-            return self.get_student_statistics(student)
-        except:
-            pass
+        # Thống kê dành cho sinh viên
+        if role.is_student:
+            return self.get_student_statistics(role.student)
 
-        try:
-            # Thống kê dành cho giáo viên
-            teacher = user.teacher
-            return self.get_teacher_statistics(teacher)
-        except:
-            return Response({"error": "Không thể xác định vai trò của bạn"}, status=status.HTTP_403_FORBIDDEN)
+        # Thống kê dành cho giáo viên
+        if role.is_teacher:
+            return self.get_teacher_statistics(role.teacher)
+        return Response({"error": "Không thể xác định vai trò của bạn"}, status=status.HTTP_403_FORBIDDEN)
 
     def get_admin_statistics(self):
         """Thống kê dành cho quản trị viên"""
-        today = timezone.now().date()
-
-        # Thống kê tổng quan
-        total_students = Student.objects.count()
-        total_teachers = Teacher.objects.count()
-        total_classes = Class.objects.count()
-        active_schedules = Schedule.objects.filter(is_active=True).count()
-
-        # Thống kê điểm danh trong 30 ngày gần đây
-        thirty_days_ago = today - timedelta(days=30)
-        recent_attendance = Attendance.objects.filter(timestamp__date__gte=thirty_days_ago)
-        total_attendance = recent_attendance.count()
-        present_count = recent_attendance.filter(is_present=True).count()
-        absent_count = total_attendance - present_count
-        late_count = recent_attendance.filter(is_late=True).count()
-
-        # Tỷ lệ điểm danh
-        attendance_rate = 0
-        if total_attendance > 0:
-            attendance_rate = (present_count / total_attendance) * 100
-
-        # Biểu đồ điểm danh theo ngày
-        attendance_by_day = {}
-        for i in range(30):
-            day = today - timedelta(days=i)
-            day_attendance = recent_attendance.filter(timestamp__date=day)
-            attendance_by_day[day.strftime('%Y-%m-%d')] = {
-                'total': day_attendance.count(),
-                'present': day_attendance.filter(is_present=True).count(),
-                'absent': day_attendance.filter(is_present=False).count(),
-                'late': day_attendance.filter(is_late=True).count()
-            }
-
-        return Response({
-            'role': 'admin',
-            'overview': {
-                'total_students': total_students,
-                'total_teachers': total_teachers,
-                'total_classes': total_classes,
-                'active_schedules': active_schedules
-            },
-            'attendance': {
-                'total': total_attendance,
-                'present': present_count,
-                'absent': absent_count,
-                'late': late_count,
-                'attendance_rate': attendance_rate
-            },
-            'attendance_by_day': attendance_by_day,
-        })
+        return Response(stats.get_admin_statistics())
 
     def get_teacher_statistics(self, teacher):
         """Thống kê dành cho giáo viên"""
-        today = timezone.now().date()
-
-        # Lấy danh sách lớp giáo viên đang dạy
-        classes = Class.objects.filter(teachers=teacher)
-
-        # Lấy danh sách lịch dạy
-        schedules = Schedule.objects.filter(teacher=teacher)
-        active_schedules = schedules.filter(is_active=True)
-
-        # Thống kê học sinh và tỷ lệ điểm danh
-        students_count = 0
-        classes_data = []
-
-        for class_obj in classes:
-            class_students = class_obj.students.count()
-            students_count += class_students
-
-            # Tính tỷ lệ điểm danh cho từng lớp
-            class_schedules = schedules.filter(class_name=class_obj)
-            class_attendance = Attendance.objects.filter(schedule__in=class_schedules)
-            total_class_attendance = class_attendance.count()
-            present_count = class_attendance.filter(is_present=True).count()
-            attendance_rate = 0
-            if total_class_attendance > 0:
-                attendance_rate = (present_count / total_class_attendance) * 100
-
-            classes_data.append({
-                'id': class_obj.id,
-                'name': class_obj.class_name,
-                'code': class_obj.class_code,
-                'students_count': class_students,
-                'attendance_rate': attendance_rate
-            })
-
-        # Thống kê điểm danh 30 ngày gần đây
-        thirty_days_ago = today - timedelta(days=30)
-        recent_attendance = Attendance.objects.filter(
-            schedule__in=schedules,
-            timestamp__date__gte=thirty_days_ago
-        )
-
-        # Tỷ lệ điểm danh theo ngày
-        attendance_by_day = {}
-        for i in range(30):
-            day = today - timedelta(days=i)
-            day_attendance = recent_attendance.filter(timestamp__date=day)
-            total = day_attendance.count()
-            present = day_attendance.filter(is_present=True).count()
-
-            if total > 0:
-                rate = (present / total) * 100
-            else:
-                rate = 0
-
-            attendance_by_day[day.strftime('%Y-%m-%d')] = {
-                'total': total,
-                'present': present,
-                'absent': total - present,
-                'rate': rate
-            }
-
-        # Lịch dạy sắp tới trong 7 ngày
-        next_week = today + timedelta(days=7)
-        upcoming_schedules = active_schedules.filter(
-            start_date__gte=today,
-            start_date__lte=next_week
-        ).order_by('start_date')
-
-        upcoming_data = []
-        for schedule in upcoming_schedules:
-            upcoming_data.append({
-                'id': schedule.id,
-                'course': schedule.course_name.object_name,
-                'class_name': schedule.class_name.class_name,
-                'date': schedule.start_date.strftime('%Y-%m-%d'),
-                'start_time': schedule.start_time.strftime('%H:%M') if schedule.start_time else None,
-                'end_time': schedule.end_time.strftime('%H:%M') if schedule.end_time else None,
-                'room': schedule.room.class_name
-            })
-
-        return Response({
-            'role': 'teacher',
-            'name': teacher.user.name,
-            'code': teacher.teacher_code,
-            'overview': {
-                'classes_count': classes.count(),
-                'students_count': students_count,
-                'active_schedules': active_schedules.count()
-            },
-            'classes': classes_data,
-            'attendance_by_day': attendance_by_day,
-            'upcoming_schedules': upcoming_data
-        })
+        return Response(stats.get_teacher_statistics(teacher))
 
     def get_student_statistics(self, student):
         """Thống kê dành cho sinh viên"""
-        today = timezone.now().date()
-
-        # Lấy các lớp học sinh đang học
-        classes = Class.objects.filter(students=student)
-
-        # Lấy tất cả lịch học
-        schedules = Schedule.objects.filter(class_name__in=classes)
-        active_schedules = schedules.filter(is_active=True)
-
-        # Thống kê điểm danh
-        all_attendance = Attendance.objects.filter(student=student)
-        total_attendance = all_attendance.count()
-        present_count = all_attendance.filter(is_present=True).count()
-        absent_count = total_attendance - present_count
-        late_count = all_attendance.filter(is_late=True).count()
-
-        # Tỷ lệ điểm danh
-        attendance_rate = 0
-        if total_attendance > 0:
-            attendance_rate = (present_count / total_attendance) * 100
-
-        # Thống kê điểm danh theo môn học
-        courses_attendance = {}
-        for schedule in schedules:
-            course_name = schedule.course_name.object_name
-
-            if course_name not in courses_attendance:
-                courses_attendance[course_name] = {
-                    'total': 0,
-                    'present': 0,
-                    'absent': 0,
-                    'late': 0
-                }
-
-            attendance = all_attendance.filter(schedule=schedule)
-            courses_attendance[course_name]['total'] += attendance.count()
-            courses_attendance[course_name]['present'] += attendance.filter(is_present=True).count()
-            courses_attendance[course_name]['absent'] += attendance.filter(is_present=False).count()
-            courses_attendance[course_name]['late'] += attendance.filter(is_late=True).count()
-
-        # Lịch học sắp tới trong 7 ngày
-        next_week = today + timedelta(days=7)
-        upcoming_schedules = active_schedules.filter(
-            start_date__gte=today,
-            start_date__lte=next_week
-        ).order_by('start_date')
-
-        upcoming_data = []
-        for schedule in upcoming_schedules:
-            # Kiểm tra xem đã điểm danh chưa
-            has_attendance = Attendance.objects.filter(
-                student=student,
-                schedule=schedule,
-                is_present=True
-            ).exists()
-
-            upcoming_data.append({
-                'id': schedule.id,
-                'course': schedule.course_name.object_name,
-                'date': schedule.start_date.strftime('%Y-%m-%d'),
-                'start_time': schedule.start_time.strftime('%H:%M') if schedule.start_time else None,
-                'end_time': schedule.end_time.strftime('%H:%M') if schedule.end_time else None,
-                'room': schedule.room.class_name,
-                'teacher': schedule.teacher.user.name,
-                'has_attendance': has_attendance
-            })
-
-        return Response({
-            'role': 'student',
-            'name': student.user.name,
-            'code': student.student_code,
-            'overview': {
-                'classes_count': classes.count(),
-                'total_schedules': schedules.count(),
-                'active_schedules': active_schedules.count(),
-            },
-            'attendance': {
-                'total': total_attendance,
-                'present': present_count,
-                'absent': absent_count,
-                'late': late_count,
-                'attendance_rate': attendance_rate
-            },
-            'courses_attendance': courses_attendance,
-            'upcoming_schedules': upcoming_data
-        })
+        return Response(stats.get_student_statistics(student))
 
 # Thêm UserViewSet cho quản lý thông tin người dùng
-class UserViewSet(viewsets.ReadOnlyModelViewSet):
+class UserViewSet(SparseFieldsetsMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint cho người dùng quản lý thông tin cá nhân của mình
     """
@@ -535,7 +361,7 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 # Thêm StudentViewSet
-class StudentViewSet(viewsets.ReadOnlyModelViewSet):
+class StudentViewSet(SparseFieldsetsMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint cho xem thông tin sinh viên
     """
@@ -549,31 +375,23 @@ class StudentViewSet(viewsets.ReadOnlyModelViewSet):
         Giáo viên có thể xem thông tin của sinh viên trong lớp mình dạy
         Admin có thể xem tất cả
         """
-        user = self.request.user
+        role = get_role(self.request)
 
-        if user.is_superuser:
-            return Student.objects.all()
+        students = Student.objects.select_related('user')
+        if role.is_admin:
+            return students.all()
 
         # Nếu là giáo viên, xem thông tin sinh viên trong lớp dạy
-        try:
-            teacher = user.teacher
-            teacher_classes = teacher.teacher_classes.all()
-            student_ids = []
-            for teacher_class in teacher_classes:
-                student_ids.extend(teacher_class.students.values_list('id', flat=True))
-            return Student.objects.filter(id__in=student_ids)
-        except:
-            pass
+        if role.is_teacher:
+            return students.filter(student_classes__teachers=role.teacher).distinct()
 
         # Nếu là sinh viên, chỉ xem thông tin của mình
-        try:
-            student = user.student
-            return Student.objects.filter(id=student.id)
-        except:
-            return Student.objects.none()
+        if role.is_student:
+            return students.filter(id=role.student.id)
+        return Student.objects.none()
 
 # Thêm TeacherViewSet
-class TeacherViewSet(viewsets.ReadOnlyModelViewSet):
+class TeacherViewSet(SparseFieldsetsMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint cho xem thông tin giáo viên
     """
@@ -587,34 +405,42 @@ class TeacherViewSet(viewsets.ReadOnlyModelViewSet):
         Sinh viên có thể xem thông tin của giáo viên dạy mình
         Admin có thể xem tất cả
         """
-        user = self.request.user
+        role = get_role(self.request)
 
-        if user.is_superuser:
-            return Teacher.objects.all()
+        teachers = Teacher.objects.select_related('user')
+        if role.is_admin:
+            return teachers.all()
 
         # Nếu là giáo viên, xem thông tin của mình
-        try:
-            teacher = user.teacher
-            return Teacher.objects.filter(id=teacher.id)
-        except:
-            pass
+        if role.is_teacher:
+            return teachers.filter(id=role.teacher.id)
 
         # Nếu là sinh viên, xem thông tin giáo viên dạy mình
-        try:
-            student = user.student
-            student_classes = student.student_classes.all()
-            teacher_ids = []
-            for student_class in student_classes:
-                teacher_ids.extend(student_class.teachers.values_list('id', flat=True))
-            return Teacher.objects.filter(id__in=teacher_ids)
-        except:
-            return Teacher.objects.none()
+        if role.is_student:
+            return teachers.filter(teacher_classes__students=role.student).distinct()
+        return Teacher.objects.none()
+
+    @conditional_get((TEACHERS, CLASSES), 'teachers')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_get((TEACHERS, CLASSES), 'teachers')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
 # Thêm ClassroomViewSet
-class ClassroomViewSet(viewsets.ReadOnlyModelViewSet):
+class ClassroomViewSet(SparseFieldsetsMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint cho xem thông tin phòng học
     """
     queryset = Classroom.objects.all()
     serializer_class = ClassroomSerializer
-    permission_classes = [permissions.IsAuthenticated]
\ No newline at end of file
+    permission_classes = [permissions.IsAuthenticated]
+
+    @conditional_get((CLASSROOMS,), 'classrooms')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_get((CLASSROOMS,), 'classrooms')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
\ No newline at end of file
@@ -1,11 +1,35 @@
+from django.db.models import Prefetch
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from core.models import Class, Teacher, Student
+from core.roles import get_role
 from .serializers import ClassSerializer, TeacherSerializer, StudentSerializer
 
+
+# Kế hoạch prefetch cho từng serializer: serializer chỉ đọc từ cache prefetch,
+# số truy vấn của một trang không phụ thuộc số lớp / sinh viên / giáo viên.
+def class_queryset(queryset=None):
+    """Lớp học kèm sinh viên, giáo viên và user của họ (dùng cho ClassSerializer)"""
+    queryset = Class.objects.all() if queryset is None else queryset
+    return queryset.prefetch_related(
+        Prefetch('students', queryset=Student.objects.select_related('user')),
+        Prefetch('teachers', queryset=Teacher.objects.select_related('user')),
+    )
+
+
+def teacher_queryset():
+    """Giáo viên kèm user và các lớp giảng dạy (dùng cho TeacherSerializer)"""
+    return Teacher.objects.select_related('user').prefetch_related('teaching_classes')
+
+
+def student_queryset():
+    """Sinh viên kèm user và các lớp đang học (dùng cho StudentSerializer)"""
+    return Student.objects.select_related('user').prefetch_related('student_classes')
+
+
 class ClassViewSet(viewsets.ModelViewSet):
-    queryset = Class.objects.all()
+    queryset = class_queryset()
     serializer_class = ClassSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -34,25 +58,29 @@ class ClassViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Không tìm thấy giáo viên'}, status=status.HTTP_404_NOT_FOUND)
 
 class TeacherViewSet(viewsets.ModelViewSet):
-    queryset = Teacher.objects.all()
+    queryset = teacher_queryset()
     serializer_class = TeacherSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     @action(detail=False, methods=['get'])
     def my_classes(self, request):
-        teacher = request.user.teacher
-        classes = teacher.teaching_classes.all()
-        serializer = ClassSerializer(classes, many=True)
+        teacher = get_role(request).teacher
+        if teacher is None:
+            return Response({"error": "Bạn không phải là giáo viên."}, status=status.HTTP_403_FORBIDDEN)
+        classes = class_queryset(teacher.teaching_classes.all())
+        serializer = ClassSerializer(classes, many=True, context=self.get_serializer_context())
         return Response(serializer.data)
 
 class StudentViewSet(viewsets.ModelViewSet):
-    queryset = Student.objects.all()
+    queryset = student_queryset()
     serializer_class = StudentSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     @action(detail=False, methods=['get'])
     def my_classes(self, request):
-        student = request.user.student
-        classes = student.student_classes.all()
-        serializer = ClassSerializer(classes, many=True)
+        student = get_role(request).student
+        if student is None:
+            return Response({"error": "Bạn không phải là sinh viên."}, status=status.HTTP_403_FORBIDDEN)
+        classes = class_queryset(student.student_classes.all())
+        serializer = ClassSerializer(classes, many=True, context=self.get_serializer_context())
         return Response(serializer.data) 
\ No newline at end of file
@@ -10,6 +10,8 @@ from django.utils.translation import gettext as _
 
 from rest_framework import serializers
 
+from core.roles import resolve_role
+
 # ModelSerializer cung cấp
 # Tự động tạo các field dựa trên model
 # Tự động tạo các validators
@@ -59,26 +61,22 @@ class UserSerializer(serializers.ModelSerializer):
     
     def get_student_info(self, obj):
         # Kiểm tra xem người dùng có thông tin sinh viên không
-        try:
-            if hasattr(obj, 'student'):
-                return {
-                    'student_code': obj.student.student_code,
-                    'classes_count': obj.student.student_classes.count()
-                }
-        except:
-            pass
+        student = resolve_role(obj).student
+        if student is not None:
+            return {
+                'student_code': student.student_code,
+                'classes_count': student.student_classes.count()
+            }
         return None
     
     def get_teacher_info(self, obj):
         # Kiểm tra xem người dùng có thông tin giáo viên không
-        try:
-            if hasattr(obj, 'teacher'):
-                return {
-                    'teacher_code': obj.teacher.teacher_code,
-                    'classes_count': obj.teacher.teacher_classes.count()
-                }
-        except:
-            pass
+        teacher = resolve_role(obj).teacher
+        if teacher is not None:
+            return {
+                'teacher_code': teacher.teacher_code,
+                'classes_count': teacher.teacher_classes.count()
+            }
         return None
 
     # override lại các phương thức
@@ -8,7 +8,8 @@ from rest_framework.settings import api_settings
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from core.http_cache import CLASSES, conditional_get
+from core.roles import RoleJWTAuthentication
 
 from user.serializers import UserSerializer, AuthTokenSerializer
 from django.contrib.auth import get_user_model, authenticate
@@ -53,7 +54,7 @@ class CreateTokenView(ObtainAuthToken):
 class ManageUserView(generics.RetrieveUpdateAPIView):
     """Manage the authenticated user."""
     serializer_class = UserSerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [RoleJWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     # Override get_object
@@ -79,17 +80,21 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
 class UserInfoView(generics.RetrieveAPIView):
     """Retrieve extended user information."""
     serializer_class = UserSerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [RoleJWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
         return self.request.user
 
+    @conditional_get((CLASSES,), 'user_info')
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
 
 class UpdateProfileView(generics.UpdateAPIView):
     """Update user profile information."""
     serializer_class = UserSerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [RoleJWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
@@ -98,7 +103,7 @@ class UpdateProfileView(generics.UpdateAPIView):
 
 class ChangePasswordView(APIView):
     """Change user password."""
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [RoleJWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]
     
     def post(self, request):
@@ -136,7 +141,7 @@ class ChangePasswordView(APIView):
 
 class UploadAvatarView(APIView):
     """Upload user avatar."""
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [RoleJWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser]
 
@@ -171,7 +176,7 @@ class UploadAvatarView(APIView):
 
 class RemoveAvatarView(APIView):
     """Remove user avatar."""
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [RoleJWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def delete(self, request, format=None):